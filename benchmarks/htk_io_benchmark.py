@@ -0,0 +1,512 @@
+#!/usr/bin/python
+"""Times htk_io readers, writers and mappers on synthetic HTS-scale data.
+
+All data is generated locally, so no corpus or network access is needed.
+The sizes of the generated data are controlled by the command line options,
+and default to roughly the size of a typical HTS voice.
+Results are written as JSON so that they can be compared across versions.
+"""
+
+# Copyright 2014, 2015 Matt Shannon
+
+# This file is part of htk_io.
+# See `License` for details of license and warranty.
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from timeit import default_timer
+import numpy as np
+
+import htk_io
+import htk_io.alignment as alio
+import htk_io.ques as qio
+import htk_io.tree as tio
+from htk_io.vecseq import VecSeqIo
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+binDir = os.path.join(repoDir, 'bin')
+
+phones = [
+    'a', 'aa', 'ae', 'ah', 'ao', 'aw', 'ay', 'b', 'ch', 'd', 'dh', 'e', 'eh',
+    'er', 'ey', 'f', 'g', 'hh', 'i', 'ih', 'iy', 'jh', 'k', 'l', 'm', 'n',
+    'ng', 'o', 'ow', 'oy', 'p', 'pau', 'r', 's', 'sh', 'sil', 't', 'th', 'u',
+    'uh', 'uw', 'v', 'w', 'x', 'y', 'z', 'zh',
+]
+# (format of each context field after the quinphone, and its maximum value)
+numFields = [
+    ('@%d_', 10), ('%d/A:', 10), ('%d_', 4), ('%d_', 2), ('%d/B:', 8),
+    ('%d-', 4), ('%d-', 8), ('%d@', 20), ('%d-', 20), ('%d/C:', 10),
+    ('%d+', 4), ('%d+', 8), ('%d/D:', 20),
+]
+
+def genLabel(rng):
+    """Returns an HTS-style full-context label."""
+    quinphone = '%s^%s-%s+%s=%s' % tuple([
+        rng.choice(phones) for _ in range(5)
+    ])
+    rest = ''.join([
+        fieldFormat % rng.randint(0, maxValue)
+        for fieldFormat, maxValue in numFields
+    ])
+    return quinphone + rest
+
+def genQuestions(numQuestions, rng):
+    """Returns an HTS-style question set with `numQuestions` questions."""
+    quesPatFormats = ['%s^*', '*^%s-*', '*-%s+*', '*+%s=*', '*=%s@*']
+    questions = []
+    # phone identity questions
+    for posIndex, quesPatFormat in enumerate(quesPatFormats):
+        for phone in phones:
+            questions.append((
+                'P%s-%s' % (posIndex, phone), [quesPatFormat % phone]
+            ))
+    # numeric context questions
+    prevSuffix = ''
+    for fieldIndex, (fieldFormat, maxValue) in enumerate(numFields):
+        prefix, suffix = fieldFormat.split('%d')
+        for value in range(maxValue + 1):
+            questions.append((
+                'F%s==%s' % (fieldIndex, value),
+                ['*%s%s%s*' % (prefix + prevSuffix, value, suffix)]
+            ))
+        prevSuffix = suffix
+    # phone class questions
+    classIndex = 0
+    while len(questions) < numQuestions:
+        posIndex = rng.randrange(len(quesPatFormats))
+        classPhones = rng.sample(phones, rng.randint(2, 12))
+        questions.append((
+            'C%s-Class%s' % (posIndex, classIndex),
+            [ quesPatFormats[posIndex] % phone for phone in classPhones ]
+        ))
+        classIndex += 1
+
+    return questions[:numQuestions]
+
+def genTree(quesIds, numLeaves, macroIdPrefix, rng):
+    """Returns a random binary tree with `numLeaves` leaves."""
+    assert numLeaves >= 2
+    getChildren = { 0: [None, None] }
+    openSlots = [(0, 0), (0, 1)]
+    nextSplitId = -1
+    while len(openSlots) < numLeaves:
+        slotIndex = rng.randrange(len(openSlots))
+        splitId, childIndex = openSlots[slotIndex]
+        openSlots[slotIndex] = openSlots[-1]
+        openSlots.pop()
+        getChildren[splitId][childIndex] = nextSplitId
+        getChildren[nextSplitId] = [None, None]
+        openSlots.extend([(nextSplitId, 0), (nextSplitId, 1)])
+        nextSplitId -= 1
+    for leafIndex, (splitId, childIndex) in enumerate(openSlots):
+        getChildren[splitId][childIndex] = tio.Leaf(
+            '%s_%s' % (macroIdPrefix, leafIndex + 1)
+        )
+
+    splitInfos = [
+        (splitId, rng.choice(quesIds), children[0], children[1])
+        for splitId, children in sorted(getChildren.items(), reverse=True)
+    ]
+    return tio.Tree(splitInfos, rootNode=0)
+
+def genAlignment(labels, numSubLabels, rng):
+    """Returns a 2-level (label, sublabel) alignment as output by HSMMAlign."""
+    alignment = []
+    startTime = 0
+    for label in labels:
+        subAlignment = []
+        for subLabelIndex in range(numSubLabels):
+            endTime = startTime + rng.randint(1, 10)
+            subAlignment.append((
+                startTime, endTime, '%s[%s]' % (label, subLabelIndex + 2), None
+            ))
+            startTime = endTime
+        alignment.append((
+            subAlignment[0][0], subAlignment[-1][1], label, subAlignment
+        ))
+    return alignment
+
+def timeIt(func, repeat):
+    """Returns the best wall clock time in seconds of `repeat` calls."""
+    times = []
+    for _ in range(repeat):
+        timeStart = default_timer()
+        func()
+        times.append(default_timer() - timeStart)
+    return min(times)
+
+class Benchmark(object):
+    def __init__(self, repeat, only=None):
+        self.repeat = repeat
+        self.only = only
+        self.results = []
+
+    def isSelected(self, name):
+        """Returns whether the benchmark `name` would be run.
+
+        Allows expensive setup needed only by some benchmarks to be skipped.
+        """
+        return self.only is None or any([ pat in name for pat in self.only ])
+
+    def run(self, name, func, numItems, itemName):
+        if not self.isSelected(name):
+            return
+        seconds = timeIt(func, self.repeat)
+        self.results.append(dict(
+            name=name,
+            seconds=seconds,
+            numItems=numItems,
+            itemName=itemName,
+            secondsPerItem=(seconds / numItems if numItems else None),
+        ))
+        sys.stderr.write('%s: %.4fs (%s %s)\n' %
+                         (name, seconds, numItems, itemName))
+
+def runCommand(scriptName, args, stdoutFile=os.devnull):
+    """Runs one of the htk_io commands using the htk_io in this directory."""
+    env = dict(os.environ)
+    pythonPath = [repoDir]
+    if 'PYTHONPATH' in env:
+        pythonPath.append(env['PYTHONPATH'])
+    env['PYTHONPATH'] = os.pathsep.join(pythonPath)
+    with open(stdoutFile, 'w') as stdout:
+        subprocess.check_call(
+            [sys.executable, os.path.join(binDir, scriptName)] + args,
+            env=env, stdout=stdout
+        )
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--num_utts', dest='numUtts', metavar='NUMUTTS',
+        default=200, type=int,
+        help='number of synthetic utterances to generate'
+    )
+    parser.add_argument(
+        '--num_phones', dest='numPhones', metavar='NUMPHONES',
+        default=40, type=int,
+        help='number of phones (full-context labels) per utterance'
+    )
+    parser.add_argument(
+        '--num_sublabels', dest='numSubLabels', metavar='NUMSUBLABELS',
+        default=5, type=int,
+        help='number of sublabels (states) per phone'
+    )
+    parser.add_argument(
+        '--num_questions', dest='numQuestions', metavar='NUMQUES',
+        default=2000, type=int,
+        help='number of questions in the synthetic question set'
+    )
+    parser.add_argument(
+        '--num_streams', dest='numStreams', metavar='NUMSTREAMS',
+        default=4, type=int,
+        help='number of streams with a tree for each sublabel'
+    )
+    parser.add_argument(
+        '--num_leaves', dest='numLeaves', metavar='NUMLEAVES',
+        default=10000, type=int,
+        help='total number of leaves over all trees in the tree file'
+    )
+    parser.add_argument(
+        '--vec_seq_mb', dest='vecSeqMb', metavar='MB',
+        default=256, type=int,
+        help='size in megabytes of the synthetic raw vector sequence file'
+    )
+    parser.add_argument(
+        '--vec_size', dest='vecSize', metavar='VECSIZE',
+        default=60, type=int,
+        help='vector size of the synthetic raw vector sequence file'
+    )
+    parser.add_argument(
+        '--repeat', dest='repeat', metavar='REPEAT',
+        default=3, type=int,
+        help='number of times to repeat each timing (the best is reported)'
+    )
+    parser.add_argument(
+        '--only', dest='only', metavar='NAME', action='append',
+        help=('only run benchmarks whose name contains NAME'
+              ' (may be given multiple times)')
+    )
+    parser.add_argument(
+        '--seed', dest='seed', metavar='SEED',
+        default=0, type=int,
+        help='random seed used to generate the synthetic data'
+    )
+    parser.add_argument(
+        '--work_dir', dest='workDir', metavar='DIR',
+        default=None,
+        help=('directory to write synthetic data to (default is a temporary'
+              ' directory which is removed afterwards)')
+    )
+    parser.add_argument(
+        '--output', dest='outputFile', metavar='OUTPUT',
+        default=None,
+        help='file to write JSON results to (default is stdout)'
+    )
+    args = parser.parse_args(argv[1:])
+
+    rng = random.Random(args.seed)
+    np.random.seed(args.seed)
+
+    removeWorkDir = args.workDir is None
+    workDir = tempfile.mkdtemp() if removeWorkDir else args.workDir
+    try:
+        results = runBenchmarks(args, rng, workDir)
+    finally:
+        if removeWorkDir:
+            shutil.rmtree(workDir)
+
+    output = dict(
+        htkIoVersion=htk_io.__version__,
+        python=platform.python_version(),
+        numpy=np.__version__,
+        platform=platform.platform(),
+        timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        params=dict([
+            (key, value)
+            for key, value in sorted(vars(args).items())
+            if key not in ['workDir', 'outputFile']
+        ]),
+        results=results,
+    )
+    if args.outputFile is None:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.outputFile, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+def runBenchmarks(args, rng, workDir):
+    bench = Benchmark(args.repeat, only=args.only)
+
+    sys.stderr.write('(generating synthetic data in %s)\n' % workDir)
+    alignDir = os.path.join(workDir, 'lab')
+    outDir = os.path.join(workDir, 'out')
+    for dirName in [alignDir, outDir]:
+        if not os.path.isdir(dirName):
+            os.makedirs(dirName)
+
+    questions = genQuestions(args.numQuestions, rng)
+    quesIds = [ quesId for quesId, _ in questions ]
+    quesFile = os.path.join(workDir, 'questions.hed')
+    qio.writeQuesFile(questions, quesFile)
+
+    numTrees = args.numSubLabels * args.numStreams
+    streamSpecedTrees = []
+    for streamIndex in range(args.numStreams):
+        for subLabelIndex in range(args.numSubLabels):
+            streamSpec = '{*}[%s].stream[%s]' % (subLabelIndex + 2,
+                                                 streamIndex + 1)
+            tree = genTree(
+                quesIds, max(2, args.numLeaves // numTrees),
+                'str%s_s%s' % (streamIndex + 1, subLabelIndex + 2), rng
+            )
+            streamSpecedTrees.append((streamSpec, tree))
+    treeFile = os.path.join(workDir, 'trees.inf')
+    tio.writeTreeFile(questions, streamSpecedTrees, treeFile)
+    treeFileBinary = os.path.join(workDir, 'trees.bin')
+    tio.writeTreeFileBinary(questions, streamSpecedTrees, treeFileBinary)
+
+    alignmentIo = alio.AlignmentIo(framePeriod=1e-7)
+    uttIds = [ 'utt%05d' % uttIndex for uttIndex in range(args.numUtts) ]
+    allLabels = []
+    alignments = []
+    for uttId in uttIds:
+        labels = [ genLabel(rng) for _ in range(args.numPhones) ]
+        allLabels.extend(labels)
+        alignment = genAlignment(labels, args.numSubLabels, rng)
+        alignments.append(alignment)
+        alignmentIo.writeFile(
+            os.path.join(alignDir, '%s.lab' % uttId), alignment
+        )
+    uttIdsFile = os.path.join(workDir, 'uttIds.txt')
+    with open(uttIdsFile, 'w') as f:
+        for uttId in uttIds:
+            f.write('%s\n' % uttId)
+    numSegments = len(uttIds) * args.numPhones * args.numSubLabels
+
+    vecSeqFile = os.path.join(workDir, 'feats.raw')
+    vecSeqIo = VecSeqIo(args.vecSize)
+    chunkFrames = max(1, (1 << 24) // (4 * args.vecSize))
+    numFrames = args.vecSeqMb * (1 << 20) // (4 * args.vecSize)
+    vecSeqNeeded = (bench.isSelected('VecSeqIo.readFile') or
+                    bench.isSelected('VecSeqIo.writeFile'))
+    if vecSeqNeeded:
+        with open(vecSeqFile, 'wb') as f:
+            for chunkStart in range(0, numFrames, chunkFrames):
+                numChunkFrames = min(chunkFrames, numFrames - chunkStart)
+                np.random.randn(numChunkFrames, args.vecSize).astype(
+                    np.float32
+                ).tofile(f)
+
+    # alignments
+
+    alignFiles = [ os.path.join(alignDir, '%s.lab' % uttId)
+                   for uttId in uttIds ]
+
+    def readAlignments():
+        for alignFile in alignFiles:
+            alignmentIo.readFile(alignFile)
+    bench.run('AlignmentIo.readFile', readAlignments,
+              numSegments, 'segments')
+
+    def writeAlignments():
+        for uttId, alignment in zip(uttIds, alignments):
+            alignmentIo.writeFile(
+                os.path.join(outDir, '%s.lab' % uttId), alignment
+            )
+    bench.run('AlignmentIo.writeFile', writeAlignments,
+              numSegments, 'segments')
+
+    flatAlignments = [ alio.flatten(alignment) for alignment in alignments ]
+
+    def flattenAlignments():
+        for alignment in alignments:
+            alio.flatten(alignment)
+    bench.run('flatten', flattenAlignments, numSegments, 'segments')
+
+    def flattenAlignmentsNoCheck():
+        for alignment in alignments:
+            alio.flatten(alignment, checkRecover=False)
+    bench.run('flatten(checkRecover=False)', flattenAlignmentsNoCheck,
+              numSegments, 'segments')
+
+    def unflattenAlignments():
+        for flatAlignment in flatAlignments:
+            alio.unflatten(flatAlignment)
+    bench.run('unflatten', unflattenAlignments, numSegments, 'segments')
+
+    # questions and trees
+
+    bench.run('readQuesFileVerifying',
+              lambda: qio.readQuesFileVerifying(quesFile),
+              len(questions), 'questions')
+    bench.run('getQuesReDict', lambda: qio.getQuesReDict(questions),
+              len(questions), 'questions')
+    bench.run('readTreeFileVerifying',
+              lambda: tio.readTreeFileVerifying(treeFile),
+              args.numLeaves, 'leaves')
+    bench.run('readTreeFileBinary',
+              lambda: tio.readTreeFileBinary(treeFileBinary),
+              args.numLeaves, 'leaves')
+
+    quesReDict = qio.getQuesReDict(questions)
+    trees = [ tree for _, tree in streamSpecedTrees ]
+    navTrees = [ tio.NavBinaryTree(quesReDict, tree) for tree in trees ]
+    compiledTrees = [ tio.CompiledNavBinaryTree(quesReDict, tree)
+                      for tree in trees ]
+    lookupLabels = allLabels[:max(1, 10000 // len(trees))]
+    numLookups = len(lookupLabels) * len(trees)
+
+    def getLeaves(navTrees):
+        for label in lookupLabels:
+            for navTree in navTrees:
+                navTree.getLeaf(label)
+    bench.run('NavBinaryTree.getLeaf', lambda: getLeaves(navTrees),
+              numLookups, 'lookups')
+    bench.run('CompiledNavBinaryTree.getLeaf',
+              lambda: getLeaves(compiledTrees),
+              numLookups, 'lookups')
+
+    def getLeavesCached():
+        answerCache = qio.QuesAnswerCache(quesReDict)
+        getLeaves([
+            tio.CompiledNavBinaryTree(quesReDict, tree,
+                                      answerCache=answerCache)
+            for tree in trees
+        ])
+    bench.run('CompiledNavBinaryTree.getLeaf(answerCache)', getLeavesCached,
+              numLookups, 'lookups')
+
+    def getLeavesBatch():
+        for navTree in navTrees:
+            navTree.getLeaves(lookupLabels)
+    bench.run('NavBinaryTree.getLeaves', getLeavesBatch,
+              numLookups, 'lookups')
+
+    answerLabels = allLabels[:1000]
+    quesRes = [ qio.getQuesRe(quesPats) for _, quesPats in questions ]
+    bench.run('getAnswerMatrix',
+              lambda: qio.getAnswerMatrix(answerLabels, quesRes),
+              len(answerLabels), 'labels')
+    quesMatcher = qio.QuesMatcher(questions)
+    bench.run('QuesMatcher.getAnswerMatrix',
+              lambda: quesMatcher.getAnswerMatrix(answerLabels),
+              len(answerLabels), 'labels')
+
+    # vector sequences
+
+    numBytes = numFrames * args.vecSize * 4
+    bench.run('VecSeqIo.readFile', lambda: vecSeqIo.readFile(vecSeqFile),
+              numBytes, 'bytes')
+    if bench.isSelected('VecSeqIo.writeFile'):
+        vecSeqs = [vecSeqIo.readFile(vecSeqFile)]
+        vecSeqFileOut = os.path.join(outDir, 'feats.raw')
+        bench.run('VecSeqIo.writeFile',
+                  lambda: vecSeqIo.writeFile(vecSeqFileOut, vecSeqs[0]),
+                  numBytes, 'bytes')
+        # (allow the possibly very large array to be garbage collected)
+        del vecSeqs[:]
+        os.remove(vecSeqFileOut)
+
+    # commands
+
+    subLabelArgs = ['--num_sublabels', str(args.numSubLabels)]
+    bench.run(
+        'htk_io_map_alignment_files_label_sublabel_to_leaf_macro_id.py',
+        lambda: runCommand(
+            'htk_io_map_alignment_files_label_sublabel_to_leaf_macro_id.py',
+            subLabelArgs + [treeFile, alignDir, uttIdsFile, outDir]
+        ),
+        numSegments, 'segments'
+    )
+    bench.run(
+        'htk_io_map_alignment_files_label_sublabel_to_ques_answers.py',
+        lambda: runCommand(
+            'htk_io_map_alignment_files_label_sublabel_to_ques_answers.py',
+            subLabelArgs + [quesFile, alignDir, uttIdsFile, outDir]
+        ),
+        numSegments, 'segments'
+    )
+    bench.run(
+        'htk_io_get_label_map_leaf_macro_id_to_leaf_index.py',
+        lambda: runCommand(
+            'htk_io_get_label_map_leaf_macro_id_to_leaf_index.py',
+            [treeFile]
+        ),
+        args.numLeaves, 'leaves'
+    )
+    if bench.isSelected('htk_io_map_alignment_files.py'):
+        # (input for this command is the output of the other commands)
+        labelMapFile = os.path.join(workDir, 'labelMap.txt')
+        runCommand('htk_io_get_label_map_leaf_macro_id_to_leaf_index.py',
+                   [treeFile], stdoutFile=labelMapFile)
+        mappedDir = os.path.join(workDir, 'mapped')
+        if not os.path.isdir(mappedDir):
+            os.makedirs(mappedDir)
+        runCommand(
+            'htk_io_map_alignment_files_label_sublabel_to_leaf_macro_id.py',
+            subLabelArgs + [treeFile, alignDir, uttIdsFile, mappedDir]
+        )
+        bench.run(
+            'htk_io_map_alignment_files.py',
+            lambda: runCommand(
+                'htk_io_map_alignment_files.py',
+                [labelMapFile, mappedDir, uttIdsFile, outDir]
+            ),
+            numSegments, 'segments'
+        )
+
+    return bench.results
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -12,25 +12,32 @@ For example, might map "mgc_s2_23" to "0".
 import sys
 import argparse
 
+import htk_io.mapping as mapping
 import htk_io.tree as tio
 
 def main(argv):
     parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--parse_cache_dir', dest='parseCacheDir', metavar='CACHEDIR',
+        default=None,
+        help=('directory in which to cache the parsed tree file, so that'
+              ' parsing and verification are skipped on later runs'
+              ' (e.g. "cache")')
+    )
     parser.add_argument(
         dest='treeFile', metavar='TREE',
         help='an HTK / HTS tree file (e.g. "mgc.inf")'
     )
     args = parser.parse_args(argv[1:])
 
-    questions, streamSpecedTrees = tio.readTreeFileVerifying(args.treeFile)
+    questions, streamSpecedTrees = tio.readTreeFileVerifying(
+        args.treeFile, cacheDir=args.parseCacheDir
+    )
 
-    leafMacroIdSet = set()
-    for streamSpec, tree in streamSpecedTrees:
-        for leaf in tree.leaves:
-            leafMacroIdSet.add(leaf.macroId)
+    leafMacroIdToIndex = mapping.getLeafMacroIdToIndex(streamSpecedTrees)
 
-    for leafIndex, leafMacroId in enumerate(sorted(leafMacroIdSet)):
-        print '%s %s' % (leafMacroId, leafIndex)
+    for leafMacroId in sorted(leafMacroIdToIndex):
+        print '%s %s' % (leafMacroId, leafMacroIdToIndex[leafMacroId])
 
 if __name__ == '__main__':
     main(sys.argv)
@@ -10,29 +10,12 @@ innermost, i.e the fastest-changing) level is considered.
 # This file is part of htk_io.
 # See `License` for details of license and warranty.
 
-import os
 import sys
 import argparse
 
 import htk_io.alignment as alio
-
-def readLabelMapFile(labelMapFile):
-    labelMapDict = dict()
-    for line in open(labelMapFile):
-        labelKey, labelValue = line.rstrip('\n').split()
-        if labelKey in labelMapDict:
-            raise RuntimeError('multiple values given for key %s' % labelKey)
-        labelMapDict[labelKey] = labelValue
-
-    return labelMapDict
-
-def mapAlignment(labelMapDict, alignment):
-    alignmentNew = []
-    for startTime, endTime, label, _ in alignment:
-        labelNew = labelMapDict[label]
-        alignmentNew.append((startTime, endTime, labelNew, None))
-
-    return alignmentNew
+import htk_io.corpus as corpus
+import htk_io.mapping as mapping
 
 def main(argv):
     parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
@@ -42,6 +25,11 @@ def main(argv):
         default='lab',
         help='suffix for alignment files'
     )
+    parser.add_argument(
+        '--jobs', dest='numJobs', metavar='N',
+        default=1, type=int,
+        help='number of utterances to process in parallel (e.g. "8")'
+    )
     parser.add_argument(
         dest='labelMapFile', metavar='LABELMAP',
         help=('file specifying label mapping'
@@ -66,23 +54,18 @@ def main(argv):
 
     alignmentIo = alio.AlignmentIo(framePeriod=1e-7)
 
-    labelMapDict = readLabelMapFile(args.labelMapFile)
+    labelMapDict = mapping.readLabelMapFile(args.labelMapFile)
     print '(read label map with %s entries)' % len(labelMapDict)
+    labelMapper = mapping.LabelMapper(labelMapDict)
 
     print '(writing output to directory %s)' % args.alignmentDirOut
-    for uttId in uttIds:
-        alignmentFileIn = os.path.join(
-            args.alignmentDirIn,
-            '%s.%s' % (uttId, args.alignmentSuffix)
-        )
-        alignmentFileOut = os.path.join(
-            args.alignmentDirOut,
-            '%s.%s' % (uttId, args.alignmentSuffix)
-        )
-
-        alignment = alignmentIo.readFile(alignmentFileIn)
-        alignmentNew = mapAlignment(labelMapDict, alignment)
-        alignmentIo.writeFile(alignmentFileOut, alignmentNew)
+    corpus.mapFiles(
+        labelMapper,
+        uttIds,
+        alignmentIo, args.alignmentDirIn, args.alignmentSuffix,
+        alignmentIo, args.alignmentDirOut, args.alignmentSuffix,
+        numJobs=args.numJobs
+    )
 
 if __name__ == '__main__':
     main(sys.argv)
@@ -9,6 +9,15 @@ leaf macro id (e.g. "mgc_s2_23").
 
 Two-level (label, sublabel) alignment files suitable for input to this command
 may be obtained using HTS's HSMMAlign command with the -f flag.
+
+Alternatively each (label, sublabel) pair may be mapped directly to a leaf
+index, where leaf indices are assigned to the leaf macro ids in the tree file
+in sorted order (as for htk_io_get_label_map_leaf_macro_id_to_leaf_index.py).
+In this case the result is a collection of binary files of int32 values, in
+the raw vector sequence format, specifying either the start frame, end frame
+and leaf index for each (label, sublabel) pair (3 values per row) or the leaf
+index for each frame starting from frame 0 (1 value per row, in which case each
+alignment must start at time 0).
 """
 
 # Copyright 2014, 2015 Matt Shannon
@@ -16,28 +25,16 @@ may be obtained using HTS's HSMMAlign command with the -f flag.
 # This file is part of htk_io.
 # See `License` for details of license and warranty.
 
-import os
 import sys
 import argparse
+import numpy as np
 
 import htk_io.alignment as alio
+import htk_io.corpus as corpus
+import htk_io.mapping as mapping
 import htk_io.ques as qio
 import htk_io.tree as tio
-
-def mapAlignment(alignment, navTrees, subLabelStrEnds):
-    alignmentNew = []
-    for startTime, endTime, label, subAlignment in alignment:
-        assert len(subAlignment) == len(subLabelStrEnds)
-
-        for subLabelIndex, (subStartTime, subEndTime, subLabelStr, _) in (
-            enumerate(subAlignment)
-        ):
-            assert subLabelStr.endswith(subLabelStrEnds[subLabelIndex])
-
-            leaf = navTrees[subLabelIndex].getLeaf(label)
-            alignmentNew.append((subStartTime, subEndTime, leaf.macroId, None))
-
-    return alignmentNew
+from htk_io.vecseq import VecSeqIo
 
 def main(argv):
     parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
@@ -47,6 +44,48 @@ def main(argv):
         default='lab',
         help='suffix for alignment files (e.g. "lab")'
     )
+    parser.add_argument(
+        '--jobs', dest='numJobs', metavar='N',
+        default=1, type=int,
+        help='number of utterances to process in parallel (e.g. "8")'
+    )
+    parser.add_argument(
+        '--output_format', dest='outputFormat',
+        default='macro_id',
+        choices=['macro_id', 'leaf_index_segments', 'leaf_index_frames'],
+        help=('format of output files: alignment files with leaf macro id'
+              ' labels, or binary int32 files of leaf indices for each'
+              ' segment or for each frame')
+    )
+    parser.add_argument(
+        '--frame_period', dest='framePeriod', metavar='FRAMEPERIOD',
+        default=None, type=float,
+        help=('frame period in seconds, used to convert times to frames for'
+              ' the leaf index output formats, and required for those'
+              ' formats (e.g. "0.005")')
+    )
+    parser.add_argument(
+        '--output_suffix', dest='outputSuffix', metavar='OUTSUFFIX',
+        default=None,
+        help=('suffix for output files (defaults to the alignment suffix for'
+              ' the macro_id output format and "leaf" otherwise)')
+    )
+    parser.add_argument(
+        '--answer_cache_labels', dest='answerCacheLabels', metavar='N',
+        default=0, type=int,
+        help=('if greater than 0, remember question answers for up to this'
+              ' many recently seen labels and share them between the trees'
+              ' for each sublabel (off by default, since labels rarely'
+              ' repeat and the trees mostly ask different questions;'
+              ' e.g. "10000")')
+    )
+    parser.add_argument(
+        '--parse_cache_dir', dest='parseCacheDir', metavar='CACHEDIR',
+        default=None,
+        help=('directory in which to cache the parsed tree file, so that'
+              ' parsing and verification are skipped on later runs'
+              ' (e.g. "cache")')
+    )
     parser.add_argument(
         '--sublabel_pat', dest='subLabelStrEndPat',
         metavar='PAT',
@@ -64,7 +103,9 @@ def main(argv):
               ' a sublabel index >= 2, specifies the HTK macro pattern'
               ' identifying the desired tree for a given sublabel'
               ' (e.g. for HTS demo a value of "{*}[%%d].stream[1]" would use'
-              ' trees from stream 1, which is the mgc stream)')
+              ' trees from stream 1, which is the mgc stream; a tree whose'
+              ' macro pattern covers a range of streams, such as'
+              ' "{*}[2].stream[2-4]", is used for each stream in the range)')
     )
     parser.add_argument(
         '--num_sublabels', dest='numSubLabels', metavar='NUMSUBLABELS',
@@ -90,51 +131,65 @@ def main(argv):
         help='directory to write output alignments to'
     )
     args = parser.parse_args(argv[1:])
+    if args.outputFormat != 'macro_id' and args.framePeriod is None:
+        # (a wrong frame period would silently give wrong frame times, so
+        #   insist on it being specified)
+        parser.error('--frame_period must be specified for output format %s'
+                     % args.outputFormat)
 
     uttIds = [ line.strip() for line in open(args.uttIdsFile) ]
 
-    subLabelStrEnds = [
-        args.subLabelStrEndPat % (subLabelIndex + 2)
-        for subLabelIndex in range(args.numSubLabels)
-    ]
-
-    alignmentIo = alio.AlignmentIo(framePeriod=1e-7)
-
-    def subLabelIndexToStreamSpec(subLabelIndex):
-        return args.streamSpecPat % (subLabelIndex + 2)
+    subLabelStrEnds = mapping.getSubLabelStrEnds(args.subLabelStrEndPat,
+                                                 args.numSubLabels)
 
-    questions, streamSpecedTrees = tio.readTreeFileVerifying(args.treeFile)
-    quesReDict = qio.getQuesReDict(questions)
+    if args.outputFormat == 'macro_id':
+        alignmentIo = alio.AlignmentIo(framePeriod=1e-7)
+        outputSuffix = args.alignmentSuffix
+    else:
+        alignmentIo = alio.AlignmentIo(framePeriod=args.framePeriod)
+        outputSuffix = 'leaf'
+    if args.outputSuffix is not None:
+        outputSuffix = args.outputSuffix
 
-    navTrees = []
-    for subLabelIndex in range(args.numSubLabels):
-        streamSpecDesired = subLabelIndexToStreamSpec(subLabelIndex)
-        foundTrees = [
-            tree
-            for streamSpec, tree in streamSpecedTrees
-            if streamSpec == streamSpecDesired
-        ]
-        assert len(foundTrees) == 1
-        navTree = tio.NavBinaryTree(quesReDict, foundTrees[0])
-        navTrees.append(navTree)
-
-    numLeaves = sum([ len(navTree.tree.leaves) for navTree in navTrees ])
-    print '(found %s leaves)' % numLeaves
+    streamSpecs = [
+        args.streamSpecPat % (subLabelIndex + 2)
+        for subLabelIndex in range(args.numSubLabels)
+    ]
 
-    print '(writing output to directory %s)' % args.alignmentDirOut
-    for uttId in uttIds:
-        alignmentFileIn = os.path.join(
-            args.alignmentDirIn,
-            '%s.%s' % (uttId, args.alignmentSuffix)
-        )
-        alignmentFileOut = os.path.join(
-            args.alignmentDirOut,
-            '%s.%s' % (uttId, args.alignmentSuffix)
+    questions, streamSpecedTrees = tio.readTreeFileVerifying(
+        args.treeFile, cacheDir=args.parseCacheDir
+    )
+    if args.answerCacheLabels > 0:
+        answerCache = qio.QuesAnswerCache(qio.getQuesReDict(questions),
+                                          maxLabels=args.answerCacheLabels)
+    else:
+        answerCache = None
+    leafMacroIdMapper = mapping.LeafMacroIdMapper(
+        questions, streamSpecedTrees, streamSpecs, subLabelStrEnds,
+        answerCache=answerCache
+    )
+    print '(found %s leaves)' % leafMacroIdMapper.numLeaves
+
+    if args.outputFormat == 'macro_id':
+        mapper = leafMacroIdMapper
+        ioOut = alignmentIo
+    else:
+        perFrame = (args.outputFormat == 'leaf_index_frames')
+        mapper = mapping.LeafIndexMapper(
+            leafMacroIdMapper,
+            mapping.getLeafMacroIdToIndex(streamSpecedTrees),
+            perFrame=perFrame
         )
+        ioOut = VecSeqIo(1 if perFrame else 3, dtypeFile=np.int32)
 
-        alignment = alignmentIo.readFile(alignmentFileIn)
-        alignmentNew = mapAlignment(alignment, navTrees, subLabelStrEnds)
-        alignmentIo.writeFile(alignmentFileOut, alignmentNew)
+    print '(writing output to directory %s)' % args.alignmentDirOut
+    corpus.mapFiles(
+        mapper,
+        uttIds,
+        alignmentIo, args.alignmentDirIn, args.alignmentSuffix,
+        ioOut, args.alignmentDirOut, outputSuffix,
+        numJobs=args.numJobs
+    )
 
 if __name__ == '__main__':
     main(sys.argv)
@@ -17,37 +17,14 @@ may be obtained using HTS's HSMMAlign command with the -f flag.
 # This file is part of htk_io.
 # See `License` for details of license and warranty.
 
-import os
 import sys
 import argparse
 
 import htk_io.alignment as alio
+import htk_io.corpus as corpus
+import htk_io.mapping as mapping
 import htk_io.ques as qio
 
-def mapAlignment(alignment, quesRes, subLabelStrEnds):
-    numSubLabels = len(subLabelStrEnds)
-
-    alignmentNew = []
-    for startTime, endTime, label, subAlignment in alignment:
-        assert len(subAlignment) == len(subLabelStrEnds)
-
-        answerVec = [ quesRe.match(label) for quesRe in quesRes ]
-        answerVecStr = ','.join(map(lambda x: ('1' if x else '0'), answerVec))
-
-        for subLabelIndex, (subStartTime, subEndTime, subLabelStr, _) in (
-            enumerate(subAlignment)
-        ):
-            assert subLabelStr.endswith(subLabelStrEnds[subLabelIndex])
-
-            alignmentNew.append((
-                subStartTime,
-                subEndTime,
-                '%s,%s' % ((subLabelIndex + 0.5) / numSubLabels, answerVecStr),
-                None
-            ))
-
-    return alignmentNew
-
 def main(argv):
     parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
     parser.add_argument(
@@ -56,6 +33,18 @@ def main(argv):
         default='lab',
         help='suffix for alignment files (e.g. "lab")'
     )
+    parser.add_argument(
+        '--jobs', dest='numJobs', metavar='N',
+        default=1, type=int,
+        help='number of utterances to process in parallel (e.g. "8")'
+    )
+    parser.add_argument(
+        '--parse_cache_dir', dest='parseCacheDir', metavar='CACHEDIR',
+        default=None,
+        help=('directory in which to cache the parsed question file, so that'
+              ' parsing and verification are skipped on later runs'
+              ' (e.g. "cache")')
+    )
     parser.add_argument(
         '--sublabel_pat', dest='subLabelStrEndPat',
         metavar='PAT',
@@ -92,30 +81,24 @@ def main(argv):
 
     uttIds = [ line.strip() for line in open(args.uttIdsFile) ]
 
-    subLabelStrEnds = [
-        args.subLabelStrEndPat % (subLabelIndex + 2)
-        for subLabelIndex in range(args.numSubLabels)
-    ]
+    subLabelStrEnds = mapping.getSubLabelStrEnds(args.subLabelStrEndPat,
+                                                 args.numSubLabels)
 
     alignmentIo = alio.AlignmentIo(framePeriod=1e-7)
 
-    questions = qio.readQuesFileVerifying(args.quesFile)
-    quesRes = [ qio.getQuesRe(quesPats) for _, quesPats in questions ]
+    questions = qio.readQuesFileVerifying(
+        args.quesFile, cacheDir=args.parseCacheDir
+    )
+    quesAnswerMapper = mapping.QuesAnswerMapper(questions, subLabelStrEnds)
 
     print '(writing output to directory %s)' % args.alignmentDirOut
-    for uttId in uttIds:
-        alignmentFileIn = os.path.join(
-            args.alignmentDirIn,
-            '%s.%s' % (uttId, args.alignmentSuffix)
-        )
-        alignmentFileOut = os.path.join(
-            args.alignmentDirOut,
-            '%s.%s' % (uttId, args.alignmentSuffix)
-        )
-
-        alignment = alignmentIo.readFile(alignmentFileIn)
-        alignmentNew = mapAlignment(alignment, quesRes, subLabelStrEnds)
-        alignmentIo.writeFile(alignmentFileOut, alignmentNew)
+    corpus.mapFiles(
+        quesAnswerMapper,
+        uttIds,
+        alignmentIo, args.alignmentDirIn, args.alignmentSuffix,
+        alignmentIo, args.alignmentDirOut, args.alignmentSuffix,
+        numJobs=args.numJobs
+    )
 
 if __name__ == '__main__':
     main(sys.argv)
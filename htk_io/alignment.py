@@ -18,9 +18,70 @@ an alignment or None (to specify no sub-alignment).
 # See `License` for details of license and warranty.
 
 import os
+from itertools import chain, islice
+import numpy as np
 
 from htk_io.base import LineIo
 from htk_io.base import DirReader
+from htk_io.base import getArchiveIndexFile
+
+def parseInts(intStrs):
+    """Parses a sequence of strings each specifying an integer.
+
+    Returns an int64 numpy array.
+    Raises a ValueError if any string does not specify an integer.
+    """
+    intsStr = ' '.join(intStrs)
+    # (np.fromstring silently stops parsing at the first invalid value and
+    #   saturates on overflow, so only use it for the common case of
+    #   non-empty strings of digits, and check for overflow)
+    if (intStrs and all(intStrs) and isinstance(intsStr, str) and
+            not intsStr.translate(None, '0123456789 ')):
+        ints = np.fromstring(intsStr, dtype=np.int64, sep=' ')
+    else:
+        ints = None
+    if (ints is None or
+            len(ints) != len(intStrs) or
+            np.any(ints == np.iinfo(np.int64).max)):
+        # (fall back to parsing each string separately, which gives an
+        #   appropriate error for any invalid strings)
+        ints = np.array(map(int, intStrs), dtype=np.int64)
+    return ints
+
+def roundHalfAway(x):
+    """Rounds each element of a float array to the nearest integer.
+
+    Ties are rounded away from zero, as done by python's built-in `round`
+    function, rather than to the nearest even integer as done by `np.round`.
+    The returned array has float dtype.
+
+    >>> import htk_io.alignment as alio
+    >>> x = np.array([-2.5, -0.5, 0.5, 1.5, 2.5, 0.49])
+    >>> alio.roundHalfAway(x).tolist()
+    [-3.0, -1.0, 1.0, 2.0, 3.0, 0.0]
+    """
+    truncated = np.trunc(x)
+    return np.where(
+        np.abs(x - truncated) == 0.5,
+        truncated + np.sign(x),
+        np.rint(x)
+    )
+
+# (integers of at most this magnitude are represented exactly as float64)
+_maxExactInt = 2 ** 53
+
+def roundToInts(x):
+    """Rounds each element of a float array to the nearest integer.
+
+    Ties are rounded away from zero as for `roundHalfAway`.
+    Returns a list of ints, or None if any rounded value is too large in
+    magnitude to be converted exactly using int64 arithmetic, in which case
+    the caller should fall back to converting each value separately.
+    """
+    rounded = roundHalfAway(x)
+    if len(rounded) and not np.all(np.abs(rounded) <= _maxExactInt):
+        return None
+    return rounded.astype(np.int64).tolist()
 
 class SimpleAlignmentIo(LineIo):
     """Reads and writes 1-level HTK-style alignment files.
@@ -52,12 +113,36 @@ class SimpleAlignmentIo(LineIo):
         """
         divisor = self.framePeriod * 1e7
 
-        alignmentLines = []
-        for startTime, endTime, label, subAlignment in alignment:
-            assert subAlignment is None
-            startTicks = int(round(startTime * divisor))
-            endTicks = int(round(endTime * divisor))
-            alignmentLines.append('%s %s %s' % (startTicks, endTicks, label))
+        alignment = list(alignment)
+        if not alignment:
+            return []
+        for segment in alignment:
+            if len(segment) != 4:
+                raise ValueError('segment %r does not have 4 elements' %
+                                 (segment,))
+
+        startTimes, endTimes, labels, subAlignments = zip(*alignment)
+        assert all([ subAlignment is None for subAlignment in subAlignments ])
+        startTicksList = roundToInts(
+            np.array(startTimes, dtype=np.float64) * divisor
+        )
+        endTicksList = roundToInts(
+            np.array(endTimes, dtype=np.float64) * divisor
+        )
+        if startTicksList is None or endTicksList is None:
+            # (fall back to converting each time separately, giving arbitrary
+            #   precision integers as for python's built-in int)
+            startTicksList = [ int(round(startTime * divisor))
+                               for startTime in startTimes ]
+            endTicksList = [ int(round(endTime * divisor))
+                             for endTime in endTimes ]
+
+        alignmentLines = [
+            '%s %s %s' % (startTicks, endTicks, label)
+            for startTicks, endTicks, label in zip(
+                startTicksList, endTicksList, labels
+            )
+        ]
 
         return alignmentLines
 
@@ -69,16 +154,55 @@ class SimpleAlignmentIo(LineIo):
         See the 1-level alignment examples in the documentation for
         `AlignmentIo.readLines` for examples of usage of this method.
         """
+        return list(self.iterReadLines(alignmentLines))
+
+    def readLinesChunk(self, alignmentLines):
+        """Reads a list of alignment lines, converting all times at once."""
         divisor = self.framePeriod * 1e7
 
-        alignment = []
-        for line in alignmentLines:
-            startTicks, endTicks, label = line.strip().split(None, 2)
-            startTime = int(round(int(startTicks) / divisor))
-            endTime = int(round(int(endTicks) / divisor))
-            alignment.append((startTime, endTime, label, None))
+        if not alignmentLines:
+            return []
 
-        return alignment
+        startTicksStrs, endTicksStrs, labels = zip(*[
+            line.strip().split(None, 2) for line in alignmentLines
+        ])
+        try:
+            startTimes = roundToInts(parseInts(startTicksStrs) / divisor)
+            endTimes = roundToInts(parseInts(endTicksStrs) / divisor)
+        except OverflowError:
+            startTimes = endTimes = None
+        if startTimes is None or endTimes is None:
+            # (fall back to converting each time separately, giving arbitrary
+            #   precision integers as for python's built-in int)
+            startTimes = [ int(round(int(startTicks) / divisor))
+                           for startTicks in startTicksStrs ]
+            endTimes = [ int(round(int(endTicks) / divisor))
+                         for endTicks in endTicksStrs ]
+
+        return zip(startTimes, endTimes, labels, [None] * len(labels))
+
+    def iterReadLines(self, alignmentLines, chunkSize=4096):
+        """Returns an iterator over the segments in some alignment lines.
+
+        `alignmentLines` may be any iterable, and is only consumed as the
+        returned iterator is.
+        Lines are converted `chunkSize` at a time.
+        """
+        linesIter = iter(alignmentLines)
+        while True:
+            lines = list(islice(linesIter, chunkSize))
+            if not lines:
+                break
+            for segment in self.readLinesChunk(lines):
+                yield segment
+
+    def iterSegments(self, alignmentFile):
+        """Returns an iterator over the segments in a 1-level alignment file.
+
+        The file is read incrementally as the iterator is consumed, so the
+        whole file is never held in memory at once.
+        """
+        return self.iterReadLines(self.iterFileLines(alignmentFile))
 
 def flatten(alignment, checkRecover=True):
     """Converts a hierarchical alignment to a flat alignment.
@@ -131,7 +255,12 @@ def flatten(alignment, checkRecover=True):
     The hierarchical alignment should be of a consistent depth.
     If `checkRecover` is True then a check is performed to verify that the
     original hierarchical alignment is recoverable from the flat alignment.
-    This is the case whenever the restrictions mentioned above are adhered to.
+    This is the case whenever the restrictions mentioned above are adhered to
+    and the start and end time of each segment with a sub-alignment are the
+    start time of its first sub-segment and the end time of its last
+    sub-segment.
+    The check is done structurally as the alignment is traversed, so it is
+    cheap compared to the flattening itself.
 
     >>> alio.flatten([
     ...     (0, 2, 'a', [
@@ -145,36 +274,56 @@ def flatten(alignment, checkRecover=True):
     RuntimeError: alignment could not be recovered...
     """
     flatAlignment = []
-    for startTime, endTime, label, subAlignment in alignment:
+    recoverable = isinstance(alignment, list)
+    numLevels = None
+    # (labels of the enclosing segments which start at the current segment,
+    #   outermost first)
+    pendingLabels = []
+    # (iterators over the sub-alignments currently being traversed)
+    segmentIters = [iter(alignment)]
+    segmentsEnd = object()
+    while segmentIters:
+        segment = next(segmentIters[-1], segmentsEnd)
+        if segment is segmentsEnd:
+            segmentIters.pop()
+            continue
+        startTime, endTime, label, subAlignment = segment
+        if checkRecover and not isinstance(segment, tuple):
+            recoverable = False
+
+        pendingLabels.append(label)
         if not subAlignment:
             if subAlignment is not None:
                 raise RuntimeError(
                     'sub-alignment was neither a non-empty list nor None: %s' %
                     subAlignment
                 )
-            flatAlignmentSub = [(startTime, endTime, (), subAlignment)]
-        else:
-            flatAlignmentSub = flatten(
-                subAlignment,
-                checkRecover=False
-            )
-        assert flatAlignmentSub
-        for (
-            entryIndex, (startTimeSub, endTimeSub, labelTuple, subAlignmentSub)
-        ) in enumerate(flatAlignmentSub):
-            flatAlignment.append((
-                startTimeSub,
-                endTimeSub,
-                labelTuple if entryIndex > 0 else labelTuple + (label,),
-                subAlignmentSub
-            ))
-
-    if checkRecover:
-        if unflatten(flatAlignment) != alignment:
-            raise RuntimeError(
-                'alignment could not be recovered from flattened alignment'
-                ' (check alignment has consistent depth)'
+            if checkRecover:
+                if numLevels is None:
+                    numLevels = len(segmentIters)
+                elif len(segmentIters) != numLevels:
+                    recoverable = False
+            pendingLabels.reverse()
+            flatAlignment.append(
+                (startTime, endTime, tuple(pendingLabels), None)
             )
+            pendingLabels = []
+        else:
+            # (the times of a segment with a sub-alignment are recovered from
+            #   the times of its first and last sub-segments)
+            if checkRecover and not (
+                isinstance(subAlignment, list) and
+                subAlignment[0][0] == startTime and
+                subAlignment[-1][1] == endTime
+            ):
+                recoverable = False
+            segmentIters.append(iter(subAlignment))
+
+    if checkRecover and not recoverable:
+        raise RuntimeError(
+            'alignment could not be recovered from flattened alignment'
+            ' (check alignment has consistent depth)'
+        )
 
     return flatAlignment
 
@@ -201,45 +350,382 @@ def unflatten(flatAlignment):
     ... ]
     True
     """
-    if not flatAlignment:
-        assert flatAlignment is not None
-        alignment = []
+    assert flatAlignment is not None
+    return list(iterUnflatten(flatAlignment))
+
+def iterUnflatten(flatAlignment):
+    """Returns an iterator over the segments of an unflattened alignment.
+
+    This is an incremental version of `unflatten`.
+    `flatAlignment` may be any iterable, and is only consumed as the returned
+    iterator is.
+    Each top-level segment (with its complete sub-alignment) is yielded as
+    soon as the flat segments that make it up have been consumed.
+
+    >>> import htk_io.alignment as alio
+    >>> flatSegments = iter([
+    ...     (0, 1, ('X', 'a'), None),
+    ...     (1, 2, ('Y',), None),
+    ...     (2, 3, ('Z', 'b'), None),
+    ... ])
+    >>> segments = alio.iterUnflatten(flatSegments)
+    >>> next(segments)
+    (0, 2, 'a', [(0, 1, 'X', None), (1, 2, 'Y', None)])
+    >>> next(flatSegments)
+    Traceback (most recent call last):
+        ...
+    StopIteration
+    >>> next(segments)
+    (2, 3, 'b', [(2, 3, 'Z', None)])
+    """
+    entry = None
+    for entryNext in chain(flatAlignment, [None]):
+        if entry is None:
+            if entryNext is None:
+                return
+            numLevels = len(entryNext[2])
+            assert numLevels >= 1
+
+            currLabels = [ None for _ in range(numLevels) ]
+            currSubAlignments = [ [] for _ in range(numLevels) ]
+            entry = entryNext
+            continue
+
+        currNumLevels = len(entry[2])
+        assert 1 <= currNumLevels <= numLevels
+
+        startTime, endTime, labelTuple, subAlignment = entry
+        assert subAlignment is None
+
+        currLabels[:currNumLevels] = labelTuple
+
+        numFreeze = numLevels if entryNext is None else len(entryNext[2])
+        for freezeIndex in range(numFreeze):
+            label = currLabels[freezeIndex]
+            if freezeIndex >= 1:
+                subAlignmentSeg = currSubAlignments[freezeIndex - 1]
+                startTimeSeg = subAlignmentSeg[0][0]
+                endTimeSeg = subAlignmentSeg[-1][1]
+                segment = (startTimeSeg, endTimeSeg, label, subAlignmentSeg)
+                currSubAlignments[freezeIndex - 1] = []
+            else:
+                segment = (startTime, endTime, label, None)
+            currLabels[freezeIndex] = None
+            if freezeIndex == numLevels - 1:
+                yield segment
+            else:
+                currSubAlignments[freezeIndex].append(segment)
+
+        entry = entryNext
+
+class LabelVocab(object):
+    """A table assigning a distinct integer code to each label.
+
+    Codes are assigned in order of first use, starting at 0.
+    A single vocab may be shared by many alignments.
+
+    >>> import htk_io.alignment as alio
+    >>> labelVocab = alio.LabelVocab(['sil', 'a'])
+    >>> labelVocab.getCode('a'), labelVocab.getCode('b')
+    (1, 2)
+    >>> labelVocab.labels
+    ['sil', 'a', 'b']
+    """
+    def __init__(self, labels=None):
+        self.labels = []
+        self.codeOf = dict()
+
+        if labels is not None:
+            for label in labels:
+                self.getCode(label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def getCode(self, label):
+        """Returns the code for a label, adding the label if necessary."""
+        code = self.codeOf.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.codeOf[label] = code
+            self.labels.append(label)
+        return code
+
+class ArrayAlignment(object):
+    """A multilevel alignment stored as a collection of numpy arrays.
+
+    Level 0 is the outermost (i.e. the least frequently changing) level of the
+    alignment, and level `numLevels - 1` is the innermost.
+    For each level, `startTimes[level]` and `endTimes[level]` are int64 arrays
+    giving the start and end times of the segments at that level,
+    `labelCodes[level]` is an int32 array giving the codes of their labels in
+    `labelVocab`, and for `level >= 1`, `parentIndices[level]` is an int64
+    array giving the index of the segment at level `level - 1` containing each
+    segment (`parentIndices[0]` is None).
+
+    Use `getArrayAlignment` to convert from the usual representation of an
+    alignment as a list of segments, and `toAlignment` to convert back.
+
+    >>> import htk_io.alignment as alio
+    >>> labelVocab = alio.LabelVocab()
+    >>> arrayAlignment = alio.getArrayAlignment([
+    ...     (0, 2, 'a', [
+    ...         (0, 1, 'X', None),
+    ...         (1, 2, 'Y', None),
+    ...     ]),
+    ...     (2, 5, 'b', [
+    ...         (2, 5, 'X', None),
+    ...     ]),
+    ... ], labelVocab)
+    >>> arrayAlignment.numLevels
+    2
+    >>> arrayAlignment.labelCodes[1].tolist()
+    [1, 2, 1]
+    >>> arrayAlignment.parentIndices[1].tolist()
+    [0, 0, 1]
+    >>> arrayAlignment.getDurations(1).tolist()
+    [1, 1, 3]
+    >>> arrayAlignment.toAlignment() == [
+    ...     (0, 2, 'a', [
+    ...         (0, 1, 'X', None),
+    ...         (1, 2, 'Y', None),
+    ...     ]),
+    ...     (2, 5, 'b', [
+    ...         (2, 5, 'X', None),
+    ...     ]),
+    ... ]
+    True
+    """
+    def __init__(self, labelVocab, startTimes, endTimes, labelCodes,
+                 parentIndices):
+        self.labelVocab = labelVocab
+        self.startTimes = startTimes
+        self.endTimes = endTimes
+        self.labelCodes = labelCodes
+        self.parentIndices = parentIndices
+
+        self.numLevels = len(self.startTimes)
+        assert self.numLevels >= 1
+        assert len(self.endTimes) == self.numLevels
+        assert len(self.labelCodes) == self.numLevels
+        assert len(self.parentIndices) == self.numLevels
+        assert self.parentIndices[0] is None
+
+    def getDurations(self, level=-1):
+        """Returns the durations of the segments at a given level."""
+        return self.endTimes[level] - self.startTimes[level]
+
+    def toAlignment(self):
+        """Returns this alignment as a list of segments."""
+        labels = self.labelVocab.labels
+
+        segments = None
+        for level in reversed(range(self.numLevels)):
+            if segments is None:
+                subAlignments = [None] * len(self.startTimes[level])
+            else:
+                bounds = np.searchsorted(
+                    self.parentIndices[level + 1],
+                    np.arange(len(self.startTimes[level]) + 1)
+                ).tolist()
+                subAlignments = [
+                    segments[start:end]
+                    for start, end in zip(bounds[:-1], bounds[1:])
+                ]
+            segments = [
+                (startTime, endTime, labels[labelCode], subAlignment)
+                for startTime, endTime, labelCode, subAlignment in zip(
+                    self.startTimes[level].tolist(),
+                    self.endTimes[level].tolist(),
+                    self.labelCodes[level].tolist(),
+                    subAlignments
+                )
+            ]
+
+        return segments
+
+def getArrayAlignmentFromFlat(flatAlignment, labelVocab):
+    """Converts a flat alignment to an `ArrayAlignment`.
+
+    `flatAlignment` is as returned by `flatten`, and may be any iterable.
+    Labels are converted to codes using `labelVocab`, which is extended with
+    any new labels.
+    """
+    numLevels = None
+    startTimes = endTimes = labelCodes = parentIndices = None
+    for startTime, endTime, labelTuple, subAlignment in flatAlignment:
+        assert subAlignment is None
+        if numLevels is None:
+            numLevels = len(labelTuple)
+            assert numLevels >= 1
+            startTimes = [ [] for _ in range(numLevels) ]
+            endTimes = [ [] for _ in range(numLevels) ]
+            labelCodes = [ [] for _ in range(numLevels) ]
+            parentIndices = [ [] for _ in range(numLevels) ]
+        currNumLevels = len(labelTuple)
+        assert 1 <= currNumLevels <= numLevels
+
+        # (labelTuple[0] is the label for the innermost level)
+        for level in range(numLevels - currNumLevels, numLevels):
+            startTimes[level].append(startTime)
+            endTimes[level].append(endTime)
+            labelCodes[level].append(
+                labelVocab.getCode(labelTuple[numLevels - 1 - level])
+            )
+            if level >= 1:
+                parentIndices[level].append(len(startTimes[level - 1]) - 1)
+        for level in range(numLevels - currNumLevels):
+            endTimes[level][-1] = endTime
+
+    if numLevels is None:
+        numLevels = 1
+        startTimes = endTimes = labelCodes = parentIndices = [[]]
+
+    return ArrayAlignment(
+        labelVocab,
+        [ np.array(times, dtype=np.int64) for times in startTimes ],
+        [ np.array(times, dtype=np.int64) for times in endTimes ],
+        [ np.array(codes, dtype=np.int32) for codes in labelCodes ],
+        [None] + [
+            np.array(indices, dtype=np.int64)
+            for indices in parentIndices[1:]
+        ]
+    )
+
+def getArrayAlignment(alignment, labelVocab):
+    """Converts an alignment to an `ArrayAlignment`.
+
+    Labels are converted to codes using `labelVocab`, which is extended with
+    any new labels.
+    The alignment should be of a consistent depth (see `flatten`).
+    """
+    return getArrayAlignmentFromFlat(flatten(alignment), labelVocab)
+
+def expandToFrames(startTimes, endTimes, values):
+    """Expands per-segment values to per-frame values.
+
+    `startTimes` and `endTimes` are integer arrays specifying the times of a
+    sequence of contiguous segments, and `values` is an array of per-segment
+    values.
+    Returns an array with one value for each frame from `startTimes[0]` to
+    `endTimes[-1]`.
+
+    >>> import numpy as np
+    >>> import htk_io.alignment as alio
+    >>> alio.expandToFrames(
+    ...     np.array([0, 2, 3]), np.array([2, 3, 6]), np.array([5, 7, 5])
+    ... ).tolist()
+    [5, 5, 7, 5, 5, 5]
+    """
+    durations = np.asarray(endTimes) - np.asarray(startTimes)
+    if np.any(durations < 0):
+        raise RuntimeError('segment end time before start time')
+    if np.any(startTimes[1:] != endTimes[:-1]):
+        raise RuntimeError('segments are not contiguous')
+    return np.repeat(values, durations)
+
+def alignmentToFrames(alignment, labelToIndex, level=-1):
+    """Expands an alignment to an int32 array of per-frame label indices.
+
+    The label of each segment at the given level of `alignment` is converted
+    to an index using `labelToIndex`, which may be a dict or any other object
+    supporting item lookup, and repeated for each frame in the segment.
+    Levels are numbered as for `ArrayAlignment`, so by default the innermost
+    level is used.
+    The returned array has an entry for each frame from the start time of the
+    first segment to the end time of the last segment, and a RuntimeError is
+    raised if the segments are not contiguous.
+
+    If `level` is a list of levels then an array of shape
+    (numFrames, len(level)) is returned, and `labelToIndex` may be a list of
+    label-to-index maps, one for each level.
+
+    >>> import htk_io.alignment as alio
+    >>> alignment = [
+    ...     (0, 2, 'a', [
+    ...         (0, 1, 'X', None),
+    ...         (1, 2, 'Y', None),
+    ...     ]),
+    ...     (2, 5, 'b', [
+    ...         (2, 5, 'X', None),
+    ...     ]),
+    ... ]
+    >>> alio.alignmentToFrames(alignment, {'X': 0, 'Y': 1}).tolist()
+    [0, 1, 0, 0, 0]
+    >>> alio.alignmentToFrames(
+    ...     alignment, [{'a': 7, 'b': 8}, {'X': 0, 'Y': 1}], level=[0, 1]
+    ... ).tolist()
+    [[7, 0], [7, 1], [8, 0], [8, 0], [8, 0]]
+    """
+    arrayAlignment = getArrayAlignment(alignment, LabelVocab())
+    labels = arrayAlignment.labelVocab.labels
+
+    levels = level if isinstance(level, list) else [level]
+    if isinstance(labelToIndex, list):
+        assert len(labelToIndex) == len(levels)
+        labelToIndexList = labelToIndex
     else:
-        numLevels = len(flatAlignment[0][2])
-        assert numLevels >= 1
-
-        currLabels = [ None for _ in range(numLevels) ]
-        currSubAlignments = [ [] for _ in range(numLevels) ]
-        for entry, entryNext in zip(flatAlignment, flatAlignment[1:] + [None]):
-            currNumLevels = len(entry[2])
-            assert 1 <= currNumLevels <= numLevels
-
-            startTime, endTime, labelTuple, subAlignment = entry
-            assert subAlignment is None
-
-            currLabels[:currNumLevels] = labelTuple
-
-            numFreeze = numLevels if entryNext is None else len(entryNext[2])
-            for freezeIndex in range(numFreeze):
-                label = currLabels[freezeIndex]
-                if freezeIndex >= 1:
-                    subAlignmentSeg = currSubAlignments[freezeIndex - 1]
-                    startTimeSeg = subAlignmentSeg[0][0]
-                    endTimeSeg = subAlignmentSeg[-1][1]
-                    currSubAlignments[freezeIndex].append(
-                        (startTimeSeg, endTimeSeg, label, subAlignmentSeg)
-                    )
-                    currLabels[freezeIndex] = None
-                    currSubAlignments[freezeIndex - 1] = []
-                else:
-                    currSubAlignments[freezeIndex].append(
-                        (startTime, endTime, label, None)
-                    )
-                    currLabels[freezeIndex] = None
-
-        alignment = currSubAlignments[numLevels - 1]
-
-    return alignment
+        labelToIndexList = [labelToIndex] * len(levels)
+
+    framesList = []
+    for currLevel, currLabelToIndex in zip(levels, labelToIndexList):
+        # (look up each distinct label at this level just once)
+        uniqueCodes, codeIndices = np.unique(
+            arrayAlignment.labelCodes[currLevel], return_inverse=True
+        )
+        indexOfUniqueCode = np.array([
+            currLabelToIndex[labels[code]] for code in uniqueCodes.tolist()
+        ], dtype=np.int32)
+        framesList.append(expandToFrames(
+            arrayAlignment.startTimes[currLevel],
+            arrayAlignment.endTimes[currLevel],
+            indexOfUniqueCode[codeIndices]
+        ))
+
+    if isinstance(level, list):
+        return np.reshape(
+            np.transpose(framesList), (-1, len(levels))
+        ).astype(np.int32)
+    else:
+        return framesList[0]
+
+def framesToAlignment(frames, startTime=0, indexToLabel=None):
+    """Converts an array of per-frame label indices to an alignment.
+
+    This is the inverse of `alignmentToFrames` for a 1-level alignment.
+    Each run of consecutive frames with the same value in the 1-dimensional
+    array `frames` becomes a segment, with the first frame at time
+    `startTime`.
+    The label of each segment is the frame value converted to an int, or if
+    `indexToLabel` is specified, the result of looking up this value in
+    `indexToLabel` (which may be a list or a dict, for example).
+
+    >>> import numpy as np
+    >>> import htk_io.alignment as alio
+    >>> alio.framesToAlignment(np.array([0, 1, 0, 0, 0]),
+    ...                        indexToLabel=['X', 'Y'])
+    [(0, 1, 'X', None), (1, 2, 'Y', None), (2, 5, 'X', None)]
+    """
+    frames = np.asarray(frames)
+    assert frames.ndim == 1
+    if len(frames) == 0:
+        return []
+
+    changeIndices = np.flatnonzero(frames[1:] != frames[:-1]) + 1
+    startIndices = np.concatenate([[0], changeIndices])
+    endIndices = np.concatenate([changeIndices, [len(frames)]])
+    values = frames[startIndices].tolist()
+    if indexToLabel is not None:
+        values = [ indexToLabel[value] for value in values ]
+
+    return [
+        (startTimeSeg, endTimeSeg, value, None)
+        for startTimeSeg, endTimeSeg, value in zip(
+            (startIndices + startTime).tolist(),
+            (endIndices + startTime).tolist(),
+            values
+        )
+    ]
 
 class AlignmentIo(LineIo):
     """Reads and writes HTK-style alignment files.
@@ -436,14 +922,291 @@ class AlignmentIo(LineIo):
 
         Use `readFile` method to read an actual file.
         """
-        rawAlignment = self.simpleIo.readLines(alignmentLines)
-        flatAlignment = [
-            (startTime, endTime, label.split(self.levelSep), subAlignment)
-            for startTime, endTime, label, subAlignment in rawAlignment
-        ]
-        alignment = unflatten(flatAlignment)
+        return list(iterUnflatten(self.iterReadLines(alignmentLines)))
+
+    def readFile(self, alignmentFile):
+        return list(self.iterAlignment(alignmentFile))
+
+    def iterReadLines(self, alignmentLines):
+        """Returns an iterator over the flat segments in some alignment lines.
+
+        Each flat segment is as in the output of `flatten`.
+        `alignmentLines` may be any iterable, and is only consumed as the
+        returned iterator is.
+        """
+        levelSep = self.levelSep
+        for startTime, endTime, label, subAlignment in (
+            self.simpleIo.iterReadLines(alignmentLines)
+        ):
+            yield startTime, endTime, tuple(label.split(levelSep)), subAlignment
+
+    def iterSegments(self, alignmentFile):
+        """Returns an iterator over the flat segments in an alignment file.
+
+        Each flat segment is as in the output of `flatten`.
+        The file is read incrementally as the iterator is consumed, so the
+        whole file is never held in memory at once.
+        Use `iterUnflatten` or `iterAlignment` to recover the multilevel
+        structure incrementally.
+
+        >>> import htk_io.alignment as alio
+        >>> alignmentIo = alio.AlignmentIo(framePeriod=0.005)
+        >>> for flatSegment in alignmentIo.iterSegments(
+        ...     'example/simple-2-level.lab'
+        ... ):
+        ...     print flatSegment
+        (0, 2, ('a', 'apple'), None)
+        (2, 3, ('p',), None)
+        (3, 5, ('p',), None)
+        (5, 8, ('l',), None)
+        (8, 10, ('e',), None)
+        (10, 11, ('p', 'pears'), None)
+        (11, 13, ('e',), None)
+        (13, 14, ('a',), None)
+        (14, 27, ('r',), None)
+        (27, 41, ('s',), None)
+        """
+        return self.iterReadLines(self.iterFileLines(alignmentFile))
+
+    def readArrayFile(self, alignmentFile, labelVocab):
+        """Reads an alignment file as an `ArrayAlignment`.
+
+        Labels are converted to codes using `labelVocab`, which is extended
+        with any new labels.
+        """
+        return getArrayAlignmentFromFlat(
+            self.iterSegments(alignmentFile), labelVocab
+        )
+
+    def writeArrayFile(self, alignmentFile, arrayAlignment):
+        """Writes an `ArrayAlignment` as an alignment file."""
+        self.writeFile(alignmentFile, arrayAlignment.toAlignment())
+
+    def iterAlignment(self, alignmentFile):
+        """Returns an iterator over the top-level segments in an alignment file.
+
+        This reads the file incrementally, yielding each top-level segment
+        (with its complete sub-alignment) as soon as it has been read.
+        """
+        return iterUnflatten(self.iterSegments(alignmentFile))
+
+def getArchiveLabelsFile(archiveFile):
+    """Returns the label table file for an alignment archive."""
+    return archiveFile + '.labels'
+
+class AlignmentArchiveWriter(object):
+    """Writes many alignments to a single binary archive.
+
+    An alignment archive consists of a binary data file `archiveFile`, a text
+    index file (see `getArchiveIndexFile`) and a label table file (see
+    `getArchiveLabelsFile`).
+    Each alignment is stored as an `ArrayAlignment`.
+    For each level, the start times, end times, label codes and (for levels
+    other than the outermost) parent indices are stored as the rows of an
+    int64 array in the data file, and the alignments share a single table of
+    labels.
+    The index file has one line per alignment of the form
+    "<uttId> <offset> <numLevels> <numSegs0> <numSegs1> ...", where offset is
+    the byte offset of the alignment in the data file and numSegs0 is the
+    number of segments at level 0, etc.
+
+    Labels should be strings which do not contain newlines.
+
+    Use as a context manager, or call `close` once all alignments have been
+    written.
+    """
+    def __init__(self, archiveFile):
+        self.archiveFile = archiveFile
+
+        self.labelVocab = LabelVocab()
+        self.numLabelsChecked = 0
+        self.uttIds = set()
+        self.offset = 0
+        self.dataFile = open(archiveFile, 'wb')
+        self.indexFile = open(getArchiveIndexFile(archiveFile), 'w')
+
+    def write(self, uttId, alignment):
+        """Appends the alignment `alignment` for utterance `uttId`."""
+        self.writeArray(uttId, getArrayAlignment(alignment, self.labelVocab))
+
+    def writeArray(self, uttId, arrayAlignment):
+        """Appends the `ArrayAlignment` `arrayAlignment` for `uttId`."""
+        if uttId in self.uttIds:
+            raise RuntimeError('utterance %s already in archive' % uttId)
+        if len(uttId.split()) != 1:
+            raise RuntimeError('invalid utterance id %r' % uttId)
+        self.uttIds.add(uttId)
+
+        if arrayAlignment.labelVocab is self.labelVocab:
+            labelCodes = arrayAlignment.labelCodes
+        else:
+            codeMap = np.array([
+                self.labelVocab.getCode(label)
+                for label in arrayAlignment.labelVocab.labels
+            ], dtype=np.int64)
+            labelCodes = [
+                codeMap[codes] for codes in arrayAlignment.labelCodes
+            ]
+        for label in self.labelVocab.labels[self.numLabelsChecked:]:
+            if not isinstance(label, str) or '\n' in label:
+                raise RuntimeError('label %r can not be stored in an'
+                                   ' alignment archive' % label)
+        self.numLabelsChecked = len(self.labelVocab)
+
+        numSegsList = []
+        for level in range(arrayAlignment.numLevels):
+            rows = [
+                arrayAlignment.startTimes[level],
+                arrayAlignment.endTimes[level],
+                labelCodes[level],
+            ]
+            if level >= 1:
+                rows.append(arrayAlignment.parentIndices[level])
+            levelArray = np.array(rows, dtype=np.int64)
+            levelArray.tofile(self.dataFile)
+            numSegsList.append(levelArray.shape[1])
+
+        self.indexFile.write('%s %s %s %s\n' % (
+            uttId,
+            self.offset,
+            arrayAlignment.numLevels,
+            ' '.join(map(str, numSegsList))
+        ))
+        self.offset = self.dataFile.tell()
+
+    def close(self):
+        self.dataFile.close()
+        self.indexFile.close()
+        with open(getArchiveLabelsFile(self.archiveFile), 'w') as f:
+            for label in self.labelVocab.labels:
+                f.write(label)
+                f.write('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+class AlignmentArchive(object):
+    """Reads alignments from an archive written by AlignmentArchiveWriter.
+
+    An instance of this class can be used as a function from utterance id to
+    alignment, in the same way as a `DirReader` for a directory of alignment
+    files, and the object returned is transformed by `transform` if
+    specified.
+    Any alignment can be accessed in constant time, without any text parsing.
+    Use `getArrayAlignment` to get an alignment as an `ArrayAlignment` (with
+    `labelVocab` as its label vocab) instead.
+
+    If `mmap` is True then the archive is memory-mapped, and the arrays of an
+    `ArrayAlignment` are read-only views into the archive.
+    """
+    def __init__(self, archiveFile, mmap=True, transform=None):
+        self.archiveFile = archiveFile
+        self.mmap = mmap
+        self.transform = transform
+
+        with open(getArchiveLabelsFile(archiveFile)) as f:
+            self.labelVocab = LabelVocab([ line.rstrip('\n') for line in f ])
+
+        self.uttIds = []
+        self.index = dict()
+        with open(getArchiveIndexFile(archiveFile)) as f:
+            for line in f:
+                entries = line.split()
+                uttId = entries[0]
+                offset, numLevels = int(entries[1]), int(entries[2])
+                numSegsList = map(int, entries[3:])
+                if len(numSegsList) != numLevels:
+                    raise RuntimeError('invalid index line %r in archive %s'
+                                       % (line, archiveFile))
+                if uttId in self.index:
+                    raise RuntimeError('utterance %s repeated in archive %s' %
+                                       (uttId, archiveFile))
+                self.uttIds.append(uttId)
+                self.index[uttId] = offset, numSegsList
+
+        self.data = None
+        if mmap and os.path.getsize(archiveFile) > 0:
+            self.data = np.memmap(archiveFile, dtype=np.uint8, mode='r')
+
+    def __len__(self):
+        return len(self.uttIds)
+
+    def __contains__(self, uttId):
+        return uttId in self.index
+
+    def _readValues(self, offset, numValues):
+        if numValues == 0:
+            return np.zeros((0,), dtype=np.int64)
+        if self.mmap:
+            return self.data[offset:(offset + numValues * 8)].view(np.int64)
+        else:
+            with open(self.archiveFile, 'rb') as f:
+                f.seek(offset)
+                return np.fromfile(f, dtype=np.int64, count=numValues)
+
+    def getArrayAlignment(self, uttId):
+        """Returns the alignment for `uttId` as an `ArrayAlignment`."""
+        offset, numSegsList = self.index[uttId]
+        numRowsList = [3] + [4] * (len(numSegsList) - 1)
+        values = self._readValues(
+            offset,
+            sum([
+                numRows * numSegs
+                for numRows, numSegs in zip(numRowsList, numSegsList)
+            ])
+        )
+
+        startTimes, endTimes, labelCodes, parentIndices = [], [], [], []
+        pos = 0
+        for numRows, numSegs in zip(numRowsList, numSegsList):
+            levelArray = np.reshape(values[pos:(pos + numRows * numSegs)],
+                                    (numRows, numSegs))
+            pos += numRows * numSegs
+            startTimes.append(levelArray[0])
+            endTimes.append(levelArray[1])
+            labelCodes.append(levelArray[2].astype(np.int32))
+            parentIndices.append(levelArray[3] if numRows == 4 else None)
+
+        return ArrayAlignment(self.labelVocab, startTimes, endTimes,
+                              labelCodes, parentIndices)
+
+    def __call__(self, uttId):
+        alignment = self.getArrayAlignment(uttId).toAlignment()
+        if self.transform is not None:
+            alignment = self.transform(alignment)
         return alignment
 
+def writeAlignmentArchive(archiveFile, getAlignment, uttIds):
+    """Writes the alignments for the given utterances to an archive.
+
+    `getAlignment` is a function from utterance id to alignment, for example a
+    `DirReader` for a directory of alignment files.
+
+    Example usage (assumes the current directory contains the "example"
+    subdirectory included in source code for this package):
+
+    >>> import os, shutil, tempfile
+    >>> from htk_io.base import DirReader
+    >>> import htk_io.alignment as alio
+    >>> alignmentIo = alio.AlignmentIo(framePeriod=0.005)
+    >>> getAlignment = DirReader(alignmentIo, 'example', 'lab')
+    >>> tempDir = tempfile.mkdtemp()
+    >>> archiveFile = os.path.join(tempDir, 'lab.archive')
+    >>> alio.writeAlignmentArchive(archiveFile, getAlignment,
+    ...                            ['simple', 'simple-2-level'])
+    >>> getAlignmentArchived = alio.AlignmentArchive(archiveFile)
+    >>> (getAlignmentArchived('simple-2-level') ==
+    ...  getAlignment('simple-2-level'))
+    True
+    >>> shutil.rmtree(tempDir)
+    """
+    with AlignmentArchiveWriter(archiveFile) as writer:
+        for uttId in uttIds:
+            writer.write(uttId, getAlignment(uttId))
+
 def mapAlignmentLabels(alignment, labelMaps):
     """Transforms an alignment by mapping the labels at each depth.
 
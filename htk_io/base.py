@@ -6,6 +6,8 @@
 # See `License` for details of license and warranty.
 
 import os
+from collections import OrderedDict
+import numpy as np
 
 class Io(object):
     """An abstract class for reading and writing files."""
@@ -21,9 +23,68 @@ class LineIo(Io):
                 f.write('\n')
 
     def readFile(self, filename):
-        lines = [ line.rstrip('\n') for line in open(filename, 'U') ]
+        lines = list(self.iterFileLines(filename))
         return self.readLines(lines)
 
+    def iterFileLines(self, filename):
+        """Returns an iterator over the lines of a file.
+
+        The lines are read from the file as the iterator is consumed rather
+        than all at once.
+        """
+        with open(filename, 'U') as f:
+            for line in f:
+                yield line.rstrip('\n')
+
+def getNumFrames(filename, frameShape, dtype):
+    """Returns the number of frames in a raw binary file.
+
+    The file is assumed to consist of a sequence of frames, each an array of
+    shape `frameShape` and dtype `dtype`.
+    A RuntimeError is raised if the file size is not a whole number of frames.
+    """
+    frameBytes = int(np.prod(frameShape)) * np.dtype(dtype).itemsize
+    fileBytes = os.path.getsize(filename)
+    if fileBytes % frameBytes != 0:
+        raise RuntimeError(
+            'size of file %s (%s bytes) is not a multiple of frame size (%s'
+            ' bytes)' % (filename, fileBytes, frameBytes)
+        )
+    return fileBytes // frameBytes
+
+def readFrames(filename, frameShape, dtype, startFrame=None, endFrame=None):
+    """Reads frames [startFrame, endFrame) from a raw binary file.
+
+    The file is assumed to consist of a sequence of frames, each an array of
+    shape `frameShape` and dtype `dtype`.
+    Only the bytes for the requested frames are read from the file.
+    `startFrame` defaults to the start of the file and `endFrame` to the end.
+    Returns an array of shape (endFrame - startFrame,) + frameShape.
+    """
+    frameShape = tuple(frameShape)
+    numFrames = getNumFrames(filename, frameShape, dtype)
+    if startFrame is None:
+        startFrame = 0
+    if endFrame is None:
+        endFrame = numFrames
+    if not 0 <= startFrame <= endFrame <= numFrames:
+        raise RuntimeError(
+            'invalid frame range [%s, %s) for file %s with %s frames' %
+            (startFrame, endFrame, filename, numFrames)
+        )
+    frameSize = int(np.prod(frameShape))
+    frameBytes = frameSize * np.dtype(dtype).itemsize
+    with open(filename, 'rb') as f:
+        f.seek(startFrame * frameBytes)
+        values = np.fromfile(
+            f, dtype=dtype, count=(endFrame - startFrame) * frameSize
+        )
+    return np.reshape(values, (-1,) + frameShape)
+
+def getArchiveIndexFile(archiveFile):
+    """Returns the index file for an archive of per-utterance objects."""
+    return archiveFile + '.index'
+
 # (FIXME : add corresponding write method and rename class
 #    (after deciding how to encode general invertible transforms nicely))
 class DirReader(object):
@@ -110,3 +171,97 @@ class DirReader(object):
         if self.transform is not None:
             obj = self.transform(obj)
         return obj
+
+class CachingDirReader(DirReader):
+    """A `DirReader` which caches the objects it has read.
+
+    An instance of this class can be used wherever a `DirReader` is used.
+    The most recently used objects are cached, up to at most `maxEntries`
+    objects and at most `maxBytes` bytes, where the size of an object is taken
+    to be the size of the file it was read from.
+    Either bound may be None to specify no bound.
+    A cached object is only used if the modification time and size of its
+    file are unchanged since it was read.
+
+    If `cacheTransformed` is True then the objects cached are those returned
+    after applying `transform`, and otherwise `transform` is applied on each
+    call.
+    Note that the same cached object is returned on each call, so it should
+    not be modified by the caller.
+
+    The number of cache hits, cache misses and evictions are recorded in
+    `hits`, `misses` and `evictions`.
+
+    >>> from htk_io.base import CachingDirReader
+    >>> import htk_io.alignment as alio
+    >>> alignmentIo = alio.AlignmentIo(framePeriod=0.005)
+    >>> getAlignment = CachingDirReader(alignmentIo, 'example', 'lab',
+    ...                                 maxEntries=1)
+    >>> getAlignment('simple') == [
+    ...     (0, 10, 'apple', None),
+    ...     (10, 41, 'pears', None),
+    ... ]
+    True
+    >>> getAlignment('simple') is getAlignment('simple')
+    True
+    >>> _ = getAlignment('simple-2-level')
+    >>> getAlignment.hits, getAlignment.misses, getAlignment.evictions
+    (2, 2, 1)
+    """
+    def __init__(self, io, readDir, ext, transform=None, maxEntries=1000,
+                 maxBytes=None, cacheTransformed=True):
+        DirReader.__init__(self, io, readDir, ext, transform=transform)
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.cacheTransformed = cacheTransformed
+
+        self.entries = OrderedDict()
+        self.numBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        """Removes all objects from the cache."""
+        self.entries.clear()
+        self.numBytes = 0
+
+    def _removeEntry(self, base):
+        _, numBytes, _ = self.entries.pop(base)
+        self.numBytes -= numBytes
+
+    def _isFull(self):
+        return (
+            (self.maxEntries is not None and
+             len(self.entries) > self.maxEntries) or
+            (self.maxBytes is not None and self.numBytes > self.maxBytes)
+        )
+
+    def __call__(self, base):
+        objFile = os.path.join(self.readDir, '%s.%s' % (base, self.ext))
+        stat = os.stat(objFile)
+        fileKey = stat.st_mtime, stat.st_size
+
+        entry = self.entries.get(base)
+        if entry is not None and entry[0] == fileKey:
+            self.hits += 1
+            # (move to most recently used position)
+            del self.entries[base]
+            self.entries[base] = entry
+            obj = entry[2]
+        else:
+            self.misses += 1
+            if entry is not None:
+                self._removeEntry(base)
+            obj = self.io.readFile(objFile)
+            if self.cacheTransformed and self.transform is not None:
+                obj = self.transform(obj)
+            self.entries[base] = fileKey, stat.st_size, obj
+            self.numBytes += stat.st_size
+            while self.entries and self._isFull():
+                self._removeEntry(next(iter(self.entries)))
+                self.evictions += 1
+
+        if not self.cacheTransformed and self.transform is not None:
+            obj = self.transform(obj)
+        return obj
@@ -0,0 +1,170 @@
+"""Functions for processing a collection of files, one per utterance."""
+
+# Copyright 2014, 2015 Matt Shannon
+
+# This file is part of htk_io.
+# See `License` for details of license and warranty.
+
+import os
+import sys
+import traceback
+import multiprocessing
+import multiprocessing.pool
+from collections import deque
+
+def writeFileAtomic(io, objFile, obj):
+    """Writes a file using `io` such that it is either complete or absent.
+
+    The file is first written to a temporary file in the same directory and
+    then renamed, so a reader never sees a partially-written file, and a
+    failure while writing leaves any existing file untouched.
+    """
+    dirName, baseName = os.path.split(objFile)
+    tempFile = os.path.join(dirName, '.%s.tmp%s' % (baseName, os.getpid()))
+    try:
+        io.writeFile(tempFile, obj)
+        os.rename(tempFile, objFile)
+    except:
+        if os.path.exists(tempFile):
+            os.remove(tempFile)
+        raise
+
+def mapFile(mapObj, ioIn, readDir, extIn, ioOut, writeDir, extOut, uttId):
+    """Reads, maps and writes the file for one utterance.
+
+    Returns None on success, or a string describing the error on failure.
+    """
+    try:
+        objFileIn = os.path.join(readDir, '%s.%s' % (uttId, extIn))
+        objFileOut = os.path.join(writeDir, '%s.%s' % (uttId, extOut))
+        obj = ioIn.readFile(objFileIn)
+        objNew = mapObj(obj)
+        writeFileAtomic(ioOut, objFileOut, objNew)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+# (set in each worker process by _initWorker)
+_workerMapFileArgs = None
+
+def _initWorker(mapFileArgs):
+    global _workerMapFileArgs
+    _workerMapFileArgs = mapFileArgs
+
+def _mapFileInWorker(uttId):
+    return uttId, mapFile(*(_workerMapFileArgs + (uttId,)))
+
+def mapFiles(mapObj, uttIds, ioIn, readDir, extIn, ioOut, writeDir, extOut,
+             numJobs=1):
+    """Maps the file for each utterance in a directory to a file in another.
+
+    For each utterance id in `uttIds`, the file with extension `extIn` in
+    `readDir` is read using `ioIn`, mapped using `mapObj` and written to the
+    file with extension `extOut` in `writeDir` using `ioOut`.
+
+    If `numJobs` is greater than 1 then utterances are processed in parallel
+    by a pool of `numJobs` worker processes.
+    The worker processes are forked from the current process, so any state
+    `mapObj` uses (decision trees, question sets, etc) is built once by the
+    caller and inherited by each worker rather than being rebuilt or pickled.
+
+    Each output file is written atomically.
+    If processing an utterance fails then the error is reported on stderr
+    together with the utterance id, the remaining utterances are still
+    processed, and a RuntimeError listing the failed utterance ids is raised
+    once all utterances have been processed.
+    """
+    mapFileArgs = (mapObj, ioIn, readDir, extIn, ioOut, writeDir, extOut)
+
+    if numJobs <= 1:
+        results = (
+            (uttId, mapFile(*(mapFileArgs + (uttId,))))
+            for uttId in uttIds
+        )
+        pool = None
+    else:
+        pool = multiprocessing.Pool(
+            numJobs, initializer=_initWorker, initargs=(mapFileArgs,)
+        )
+        results = pool.imap_unordered(_mapFileInWorker, uttIds, chunksize=16)
+
+    failedUttIds = []
+    try:
+        for uttId, error in results:
+            if error is not None:
+                sys.stderr.write('error processing utterance %s:\n%s' %
+                                 (uttId, error))
+                failedUttIds.append(uttId)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if failedUttIds:
+        raise RuntimeError(
+            'processing failed for %s utterances: %s' %
+            (len(failedUttIds), ' '.join(sorted(failedUttIds)))
+        )
+
+# (set in each worker process by _initReadWorker)
+_workerGetObj = None
+
+def _initReadWorker(getObj):
+    global _workerGetObj
+    _workerGetObj = getObj
+
+def _readInWorker(base):
+    return _workerGetObj(base)
+
+def iterPrefetched(getObj, bases, numPrefetch=8, numWorkers=1,
+                   useProcesses=False):
+    """Returns an iterator over the objects for the given base names.
+
+    The object for each base name in `bases` is computed by `getObj`, which
+    is typically a `DirReader`, and the objects are yielded in the order of
+    `bases`.
+    While the caller processes one object, the objects for up to `numPrefetch`
+    following base names are read in the background by a pool of
+    `numWorkers` worker threads, or worker processes if `useProcesses` is
+    True.
+    Worker threads are sufficient when most of the time is spent waiting for
+    file I/O, whereas worker processes also allow parsing to be done in
+    parallel.
+    The worker processes are forked from the current process, so `getObj` is
+    not pickled, but each object read is pickled to return it to the caller.
+
+    If reading an object raises an exception then the exception is re-raised
+    when that object would have been yielded.
+    """
+    assert numPrefetch >= 1
+    if useProcesses:
+        pool = multiprocessing.Pool(
+            numWorkers, initializer=_initReadWorker, initargs=(getObj,)
+        )
+        readFn = _readInWorker
+    else:
+        pool = multiprocessing.pool.ThreadPool(numWorkers)
+        readFn = getObj
+
+    basesIter = iter(bases)
+    pending = deque()
+    completed = False
+    try:
+        while True:
+            while len(pending) < numPrefetch + 1:
+                try:
+                    base = next(basesIter)
+                except StopIteration:
+                    break
+                pending.append(pool.apply_async(readFn, (base,)))
+            if not pending:
+                break
+            yield pending.popleft().get()
+        completed = True
+    finally:
+        if completed:
+            pool.close()
+        else:
+            # (stop any outstanding reads if iteration was abandoned)
+            pool.terminate()
+        pool.join()
@@ -25,18 +25,31 @@ HMGenS pdf file can be interpreted in a related but different way.
 
 import numpy as np
 
+from htk_io.base import getNumFrames, readFrames
+
 # FIXME : add tests
 
 # FIXME : change to a HMGenSPdfIo class
-def readHMGenSPdf(pdfFile, paramOrder, numWindows):
+def getHMGenSPdfNumFrames(pdfFile, paramOrder, numWindows):
+    """Returns the number of frames in an HMGenS pdf file.
+
+    A RuntimeError is raised if the file size is not consistent with
+    `paramOrder` and `numWindows`.
+    """
+    return getNumFrames(pdfFile, (2, numWindows, paramOrder), np.float32)
+
+def readHMGenSPdf(pdfFile, paramOrder, numWindows, startFrame=None,
+                  endFrame=None):
     """Reads an HMGenS probability density (pdf) file into a numpy array.
 
     Returns two arrays, each of shape (numTimes, numWindows, paramOrder), the
     first specifying the b-value and the second specifying the precision.
+
+    If `startFrame` or `endFrame` is specified then only frames
+    [startFrame, endFrame) are read from the file.
     """
-    pdfAll = np.reshape(
-        np.fromfile(pdfFile, dtype=np.float32),
-        (-1, 2, numWindows, paramOrder)
+    pdfAll = readFrames(
+        pdfFile, (2, numWindows, paramOrder), np.float32, startFrame, endFrame
     ).astype(np.float)
     bWinAll = pdfAll[:, 0]
     tauWinAll = pdfAll[:, 1]
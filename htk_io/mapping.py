@@ -0,0 +1,256 @@
+"""Functions and classes for mapping the labels in alignments.
+
+These are the operations performed by the alignment mapping commands, made
+available for use on in-memory alignments.
+Each mapper is built once (which for the tree-based and question-based mappers
+involves compiling the question set) and may then be used to map any number of
+alignments.
+"""
+
+# Copyright 2014, 2015 Matt Shannon
+
+# This file is part of htk_io.
+# See `License` for details of license and warranty.
+
+import numpy as np
+
+import htk_io.alignment as alio
+import htk_io.ques as qio
+import htk_io.tree as tio
+
+def readLabelMapFile(labelMapFile):
+    """Reads a label map file with two whitespace-separated columns.
+
+    Returns a dict mapping each label in the first column to the
+    corresponding label in the second column.
+    """
+    labelMapDict = dict()
+    for line in open(labelMapFile):
+        labelKey, labelValue = line.rstrip('\n').split()
+        if labelKey in labelMapDict:
+            raise RuntimeError('multiple values given for key %s' % labelKey)
+        labelMapDict[labelKey] = labelValue
+
+    return labelMapDict
+
+class LabelMapper(object):
+    """Maps each label in an alignment using a dict.
+
+    Only the top level of the alignment is considered, and the returned
+    alignment has no sub-alignments.
+
+    >>> import htk_io.mapping as mapping
+    >>> labelMapper = mapping.LabelMapper({'a': 'A', 'b': 'B'})
+    >>> labelMapper([
+    ...     (0, 2, 'a', None),
+    ...     (2, 3, 'b', None),
+    ... ])
+    [(0, 2, 'A', None), (2, 3, 'B', None)]
+    """
+    def __init__(self, labelMapDict):
+        self.labelMapDict = labelMapDict
+
+    def __call__(self, alignment):
+        labelMapDict = self.labelMapDict
+        return [
+            (startTime, endTime, labelMapDict[label], None)
+            for startTime, endTime, label, _ in alignment
+        ]
+
+def getSubLabelStrEnds(subLabelStrEndPat, numSubLabels):
+    """Returns the expected ending of each sublabel string.
+
+    `subLabelStrEndPat` is a printf-style pattern which is expanded with each
+    sublabel index, starting from 2 as in HTK.
+
+    >>> import htk_io.mapping as mapping
+    >>> mapping.getSubLabelStrEnds('[%d]', 3)
+    ['[2]', '[3]', '[4]']
+    """
+    return [
+        subLabelStrEndPat % (subLabelIndex + 2)
+        for subLabelIndex in range(numSubLabels)
+    ]
+
+def iterSubSegments(alignment, subLabelStrEnds):
+    """Returns an iterator over the sub-segments of a 2-level alignment.
+
+    Yields (label, subLabelIndex, subStartTime, subEndTime) for each
+    (label, sublabel) pair, checking that each label has the expected
+    sublabels.
+    """
+    numSubLabels = len(subLabelStrEnds)
+    for startTime, endTime, label, subAlignment in alignment:
+        assert len(subAlignment) == numSubLabels
+
+        for subLabelIndex, (subStartTime, subEndTime, subLabelStr, _) in (
+            enumerate(subAlignment)
+        ):
+            assert subLabelStr.endswith(subLabelStrEnds[subLabelIndex])
+            yield label, subLabelIndex, subStartTime, subEndTime
+
+class LeafMacroIdMapper(object):
+    """Maps each (label, sublabel) in an alignment to a tree leaf macro id.
+
+    The tree for the sublabel with index `subLabelIndex` is the tree in
+    `streamSpecedTrees` for stream spec `streamSpecs[subLabelIndex]` (see
+    `tio.StreamSpecIndex.getTree`), and `subLabelStrEnds` is as returned by
+    `getSubLabelStrEnds`.
+    Calling an instance on a 2-level (label, sublabel) alignment returns a
+    1-level alignment where each label is a leaf macro id (e.g. "mgc_s2_23").
+
+    If `answerCache` is specified, it should be a `qio.QuesAnswerCache` (or
+    an object with the same interface) whose `quesReDict` contains every
+    question in `questions`, and it is shared by the trees for every
+    sublabel.
+    By default no answer cache is used.
+    """
+    def __init__(self, questions, streamSpecedTrees, streamSpecs,
+                 subLabelStrEnds, answerCache=None):
+        assert len(streamSpecs) == len(subLabelStrEnds)
+        self.subLabelStrEnds = subLabelStrEnds
+        self.answerCache = answerCache
+
+        if answerCache is None:
+            quesReDict = qio.getQuesReDict(questions)
+        else:
+            quesReDict = answerCache.quesReDict
+            for quesId, _ in questions:
+                assert quesId in quesReDict
+
+        streamSpecIndex = tio.StreamSpecIndex(streamSpecedTrees)
+        self.navTrees = [
+            tio.CompiledNavBinaryTree(
+                quesReDict, streamSpecIndex.getTree(streamSpec),
+                answerCache=self.answerCache
+            )
+            for streamSpec in streamSpecs
+        ]
+
+        self.numLeaves = sum([
+            len(navTree.tree.leaves) for navTree in self.navTrees
+        ])
+
+    def getLeaves(self, alignment):
+        """Returns the sub-segments of an alignment and their leaves.
+
+        Returns a list of (subStartTime, subEndTime, leaf) tuples.
+        """
+        navTrees = self.navTrees
+        return [
+            (subStartTime, subEndTime,
+             navTrees[subLabelIndex].getLeaf(label))
+            for label, subLabelIndex, subStartTime, subEndTime in (
+                iterSubSegments(alignment, self.subLabelStrEnds)
+            )
+        ]
+
+    def __call__(self, alignment):
+        return [
+            (subStartTime, subEndTime, leaf.macroId, None)
+            for subStartTime, subEndTime, leaf in self.getLeaves(alignment)
+        ]
+
+class LeafIndexMapper(object):
+    """Maps each (label, sublabel) in an alignment to a tree leaf index.
+
+    The leaf for each (label, sublabel) pair is found using
+    `leafMacroIdMapper`, a `LeafMacroIdMapper`, and its macro id is converted
+    to an index using `leafMacroIdToIndex` (see `getLeafMacroIdToIndex`).
+    Calling an instance on a 2-level (label, sublabel) alignment returns an
+    int32 numpy array.
+    If `perFrame` is False then the array has shape (numSegments, 3), with
+    each row specifying the start time, end time and leaf index for one
+    (label, sublabel) pair.
+    If `perFrame` is True then the array has shape (numFrames, 1) and
+    specifies the leaf index for each frame (see `alio.alignmentToFrames`),
+    with row 0 corresponding to frame 0.
+    In this case a RuntimeError is raised if the alignment does not start at
+    time 0.
+    """
+    def __init__(self, leafMacroIdMapper, leafMacroIdToIndex, perFrame=False):
+        self.leafMacroIdMapper = leafMacroIdMapper
+        self.leafMacroIdToIndex = leafMacroIdToIndex
+        self.perFrame = perFrame
+
+        # (leaf index for each leaf object, to avoid repeated lookups)
+        self.leafIndexOf = dict()
+        for navTree in leafMacroIdMapper.navTrees:
+            for leaf in navTree.tree.leaves:
+                self.leafIndexOf[leaf] = leafMacroIdToIndex[leaf.macroId]
+
+    def __call__(self, alignment):
+        leafIndexOf = self.leafIndexOf
+        segments = np.array([
+            (subStartTime, subEndTime, leafIndexOf[leaf])
+            for subStartTime, subEndTime, leaf in (
+                self.leafMacroIdMapper.getLeaves(alignment)
+            )
+        ], dtype=np.int64).reshape((-1, 3))
+
+        if self.perFrame:
+            if len(segments) and segments[0, 0] != 0:
+                raise RuntimeError('alignment starts at time %s rather than 0,'
+                                   ' so can not be expanded to frames' %
+                                   segments[0, 0])
+            frames = alio.expandToFrames(segments[:, 0], segments[:, 1],
+                                         segments[:, 2])
+            return np.reshape(frames, (-1, 1)).astype(np.int32)
+        else:
+            if np.any(np.abs(segments) > np.iinfo(np.int32).max):
+                raise RuntimeError('segment times too large to store as int32')
+            return segments.astype(np.int32)
+
+class QuesAnswerMapper(object):
+    """Maps each (label, sublabel) in an alignment to a vector of answers.
+
+    Calling an instance on a 2-level (label, sublabel) alignment returns a
+    1-level alignment where each label is a string consisting of the relative
+    position of the sublabel within the label followed by the answer (0 or 1)
+    to each question in `questions`, separated by commas.
+    `subLabelStrEnds` is as returned by `getSubLabelStrEnds`.
+    """
+    def __init__(self, questions, subLabelStrEnds):
+        self.subLabelStrEnds = subLabelStrEnds
+        self.quesMatcher = qio.QuesMatcher(questions)
+
+    def __call__(self, alignment):
+        numSubLabels = len(self.subLabelStrEnds)
+
+        labels = [ label for _, _, label, _ in alignment ]
+        answerVecs = self.quesMatcher.getAnswerMatrix(labels).view(
+            np.uint8
+        ).tolist()
+        answerVecStrOf = dict([
+            (label, ','.join(map(str, answerVec)))
+            for label, answerVec in zip(labels, answerVecs)
+        ])
+
+        return [
+            (
+                subStartTime,
+                subEndTime,
+                '%s,%s' % ((subLabelIndex + 0.5) / numSubLabels,
+                           answerVecStrOf[label]),
+                None
+            )
+            for label, subLabelIndex, subStartTime, subEndTime in (
+                iterSubSegments(alignment, self.subLabelStrEnds)
+            )
+        ]
+
+def getLeafMacroIdToIndex(streamSpecedTrees):
+    """Returns a dict mapping each leaf macro id to a leaf index.
+
+    Leaf indices are assigned to the distinct leaf macro ids of all the trees
+    in `streamSpecedTrees` in sorted order.
+    """
+    leafMacroIdSet = set()
+    for streamSpec, tree in streamSpecedTrees:
+        for leaf in tree.leaves:
+            leafMacroIdSet.add(leaf.macroId)
+
+    return dict([
+        (leafMacroId, leafIndex)
+        for leafIndex, leafMacroId in enumerate(sorted(leafMacroIdSet))
+    ])
@@ -5,7 +5,12 @@
 # This file is part of htk_io.
 # See `License` for details of license and warranty.
 
+import os
 import re
+import random
+import hashlib
+import cPickle
+from itertools import ifilterfalse, izip_longest
 
 def stripQuotes(s):
     assert len(s) >= 2 and s[0] == '"' and s[-1] == '"'
@@ -28,25 +33,148 @@ def normalizeWhitespace(lines):
             outLines.append(outLine)
     return outLines
 
-def verifiedRead(read, write, lines, unpack=False):
+def normalizeLineWhitespace(line):
+    """Normalizes the whitespace in a single line.
+
+    Gives the same result as `normalizeWhitespace` for a single line, that is
+    each run of whitespace is replaced by a single space and trailing
+    whitespace is removed.
+
+    >>> from htk_io.misc import normalizeLineWhitespace
+    >>> normalizeLineWhitespace('\t QS  "a"\t{ *-a+* } ')
+    ' QS "a" { *-a+* }'
+    """
+    outLine = ' '.join(line.split())
+    if outLine and line[0].isspace():
+        outLine = ' ' + outLine
+    return outLine
+
+def isBlankLine(line):
+    return not line or line.isspace()
+
+def verifiedRead(read, write, lines, unpack=False, verify='full',
+                 sampleFraction=0.1):
+    """Reads data and verifies that it was read correctly.
+
+    The data is read from `lines` using `read` and then written back to lines
+    using `write`, and the original and re-written lines are compared up to
+    whitespace normalization (see `normalizeWhitespace`), ignoring blank
+    lines.
+    The comparison is done one line at a time and stops at the first mismatch,
+    at which point a RuntimeError is raised.
+
+    If `verify` is 'full' then every line is compared.
+    If `verify` is 'sampled' then only a random fraction `sampleFraction` of
+    the non-blank lines are compared (though the number of non-blank lines is
+    always checked).
+    If `verify` is 'off' then no verification is done, and `write` is not
+    called.
+
+    If `write` returns an iterator rather than a list then the re-written lines
+    are generated as they are compared, so verification uses constant memory
+    beyond that needed for `lines` and the parsed data.
+    """
+    if verify not in ('full', 'sampled', 'off'):
+        raise RuntimeError('unknown verify mode %s' % verify)
+
     data = read(lines)
+    if verify == 'off':
+        return data
+
     if unpack:
         linesOut = write(*data)
     else:
         linesOut = write(data)
 
-    lines = normalizeWhitespace(lines)
-    linesOut = normalizeWhitespace(linesOut)
-
-    if linesOut != lines:
-        for line, lineOut in zip(lines, linesOut):
-            if line != lineOut:
-                print line
-                print ' !='
-                print lineOut
-                raise RuntimeError('verified read failed')
-        assert len(line) != len(lineOut)
-        print 'lengths differ: %s vs %s' % (len(line), len(lineOut))
-        raise RuntimeError('verified read failed')
+    if verify == 'sampled':
+        # (fixed seed so that verification is reproducible)
+        rng = random.Random(0)
+    for lineIndex, (line, lineOut) in enumerate(izip_longest(
+        ifilterfalse(isBlankLine, lines),
+        ifilterfalse(isBlankLine, linesOut)
+    )):
+        if line is None or lineOut is None:
+            raise RuntimeError(
+                'verified read failed: number of lines differs (%s line %s'
+                ' missing)' % ('original' if line is None else 're-written',
+                               lineIndex + 1)
+            )
+        if verify == 'sampled' and rng.random() >= sampleFraction:
+            continue
+        if normalizeLineWhitespace(line) != normalizeLineWhitespace(lineOut):
+            raise RuntimeError(
+                'verified read failed: non-blank line %s %r != %r' %
+                (lineIndex + 1, line, lineOut)
+            )
 
     return data
+
+def getVerifiedCacheName(name, verify, sampleFraction):
+    """Returns the parse cache name for a verified read of a file.
+
+    The cache name identifies how thoroughly the cached result was verified,
+    so that for example a result verified with a small `sampleFraction` is
+    not reused for a read which asks for a larger fraction to be verified.
+
+    >>> from htk_io.misc import getVerifiedCacheName
+    >>> getVerifiedCacheName('tree', 'full', 0.1)
+    'tree'
+    >>> getVerifiedCacheName('tree', 'sampled', 0.25)
+    'tree-sampled0.25'
+    """
+    if verify == 'full':
+        return name
+    elif verify == 'sampled':
+        return '%s-sampled%r' % (name, sampleFraction)
+    else:
+        return '%s-%s' % (name, verify)
+
+# (increment whenever the in-memory representation of parsed files changes, so
+#   that stale parse cache files are not used)
+parseCacheVersion = 2
+
+def readFileLinesCached(readLines, filename, cacheDir, cacheName):
+    """Reads a line-based file, caching the parsed result on disk.
+
+    The file is read using `readLines`, a function from a list of lines to
+    the parsed object.
+    If `cacheDir` is not None then the parsed object is stored in `cacheDir`
+    in pickled form, keyed by `cacheName` and a hash of the file contents.
+    Subsequent reads of a file with the same contents load the pickled object
+    instead of calling `readLines` (which may be an expensive verifying read).
+    """
+    with open(filename, 'rb') as f:
+        contents = f.read()
+    # (same lines as obtained by reading the file in universal newline mode)
+    lines = contents.splitlines()
+    contentsHash = hashlib.sha1(contents).hexdigest()
+    # (only keep one copy of the file contents while parsing)
+    del contents
+    if cacheDir is None:
+        return readLines(lines)
+
+    cacheFile = os.path.join(cacheDir, '%s-v%s-%s.pickle' % (
+        cacheName, parseCacheVersion, contentsHash
+    ))
+    if os.path.exists(cacheFile):
+        try:
+            with open(cacheFile, 'rb') as f:
+                return cPickle.load(f)
+        except Exception:
+            # (fall back to parsing if cache file is corrupt)
+            pass
+
+    obj = readLines(lines)
+
+    # (write atomically since many processes may share a cache directory)
+    tempFile = '%s.tmp%s' % (cacheFile, os.getpid())
+    try:
+        with open(tempFile, 'wb') as f:
+            cPickle.dump(obj, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tempFile, cacheFile)
+    except:
+        if os.path.exists(tempFile):
+            os.remove(tempFile)
+        raise
+
+    return obj
@@ -7,8 +7,11 @@
 
 import re
 import fnmatch
+from collections import OrderedDict
+import numpy as np
 
 from htk_io.misc import stripQuotes, addQuotes, verifiedRead
+from htk_io.misc import readFileLinesCached, getVerifiedCacheName
 
 def getQuesRe(quesPats):
     """Converts a list of question patterns to a regular expression."""
@@ -26,6 +29,285 @@ def getQuesReDict(questions):
 
     return quesReDict
 
+def getUniqueLabels(labels):
+    """Returns the distinct labels in a sequence and where each label occurs.
+
+    Returns a list of distinct labels in order of first occurrence together
+    with an integer numpy array giving the index in this list of each label in
+    `labels`.
+    """
+    labelIndexOf = dict()
+    uniqueLabels = []
+    labelIndices = []
+    for label in labels:
+        labelIndex = labelIndexOf.get(label)
+        if labelIndex is None:
+            labelIndex = len(uniqueLabels)
+            labelIndexOf[label] = labelIndex
+            uniqueLabels.append(label)
+        labelIndices.append(labelIndex)
+
+    return uniqueLabels, np.array(labelIndices, dtype=np.int64)
+
+def getAnswerMatrix(labels, quesRes):
+    """Returns the answers to a list of questions for each of many labels.
+
+    `quesRes` is a list of question regular expressions, as returned by
+    `getQuesRe`.
+    The returned numpy array has boolean dtype and shape
+    (len(labels), len(quesRes)), with entry (labelIndex, quesIndex) True if
+    the answer to question `quesIndex` is yes for label `labelIndex`.
+    Its `view(np.uint8)` gives the same answers as 0s and 1s without copying.
+    Each distinct label is only matched against the questions once.
+
+    Example usage:
+
+    >>> import htk_io.ques as qio
+    >>> questions = [('C-a', ['*-a+*']), ('L-b', ['b^*'])]
+    >>> quesRes = [ qio.getQuesRe(quesPats) for _, quesPats in questions ]
+    >>> answers = qio.getAnswerMatrix(
+    ...     ['b^x-a+y', 'x^x-b+y', 'b^x-a+y'], quesRes
+    ... )
+    >>> answers.view(np.uint8).tolist()
+    [[1, 1], [0, 0], [1, 1]]
+    """
+    uniqueLabels, labelIndices = getUniqueLabels(labels)
+
+    uniqueAnswers = np.zeros((len(uniqueLabels), len(quesRes)), dtype=np.bool_)
+    if uniqueLabels:
+        for quesIndex, quesRe in enumerate(quesRes):
+            match = quesRe.match
+            uniqueAnswers[:, quesIndex] = [
+                match(label) is not None for label in uniqueLabels
+            ]
+
+    return uniqueAnswers[labelIndices]
+
+wildcardRe = re.compile(r'[*?\[]')
+
+class QuesMatcher(object):
+    """Answers all the questions in a question set for a label at once.
+
+    This gives the same answers as matching against the regular expressions
+    returned by `getQuesReDict`, but is typically much faster for large HTS
+    question sets.
+    Each distinct pattern is only considered once, however many questions it
+    appears in.
+    Most HTS question patterns are of the form "*-a+*", "a^*" or "*/A:1_*", and
+    are answered by a single substring, prefix or suffix test on the label
+    instead of a regular expression match.
+    Any remaining patterns are matched using a regular expression, but only
+    when the longest literal part of the pattern occurs in the label.
+
+    Example usage:
+
+    >>> import htk_io.ques as qio
+    >>> questions = [
+    ...     ('C-a', ['*-a+*']),
+    ...     ('L-b_or_c', ['b^*', 'c^*']),
+    ...     ('C-?', ['*-?+*']),
+    ... ]
+    >>> quesMatcher = qio.QuesMatcher(questions)
+    >>> quesMatcher.getAnswers('b^x-a+y').tolist()
+    [True, True, True]
+    >>> quesMatcher.getAnswers('a^x-bb+y').tolist()
+    [False, False, False]
+    >>> quesMatcher.getAnswerDict('c^x-b+y') == {
+    ...     'C-a': False, 'L-b_or_c': True, 'C-?': True,
+    ... }
+    True
+    """
+    def __init__(self, questions):
+        self.quesIds = [ quesId for quesId, _ in questions ]
+
+        patIndexOf = dict()
+        pats = []
+        quesPatIndices = []
+        for quesId, quesPats in questions:
+            # (getQuesRe treats an empty list of patterns like [''])
+            quesPats = quesPats if quesPats else ['']
+            for patIndex, quesPat in enumerate(quesPats):
+                # N.B. the regular expression returned by getQuesRe only
+                #   requires the last pattern to match all the way to the end
+                #   of the label, so earlier patterns are effectively followed
+                #   by '*'
+                if patIndex < len(quesPats) - 1 and not quesPat.endswith('*'):
+                    quesPat = quesPat + '*'
+                if quesPat not in patIndexOf:
+                    patIndexOf[quesPat] = len(pats)
+                    pats.append(quesPat)
+                quesPatIndices.append(patIndexOf[quesPat])
+        self.numPats = len(pats)
+        self.quesPatIndices = np.array(quesPatIndices, dtype=np.int64)
+        self.quesStarts = np.cumsum(
+            [0] + [ max(len(quesPats), 1) for _, quesPats in questions[:-1] ]
+        ).astype(np.int64)
+
+        self.exactPats = []
+        self.prefixPats = []
+        self.suffixPats = []
+        self.containsPats = []
+        self.alwaysPatIndices = []
+        self.generalPats = []
+        for patIndex, pat in enumerate(pats):
+            inner = pat.strip('*')
+            isLiteral = wildcardRe.search(inner) is None
+            startStar = pat.startswith('*')
+            endStar = pat.endswith('*')
+            if isLiteral and inner == '' and pat != '':
+                self.alwaysPatIndices.append(patIndex)
+            elif isLiteral and not startStar and not endStar:
+                self.exactPats.append((patIndex, inner))
+            elif isLiteral and not startStar:
+                self.prefixPats.append((patIndex, inner))
+            elif isLiteral and not endStar:
+                self.suffixPats.append((patIndex, inner))
+            elif isLiteral:
+                self.containsPats.append((patIndex, inner))
+            else:
+                if '[' in pat:
+                    anchor = ''
+                else:
+                    anchor = max(re.split(r'[*?]', pat), key=len)
+                self.generalPats.append(
+                    (patIndex, anchor, getQuesRe([pat]).match)
+                )
+
+    def getPatAnswers(self, label):
+        """Returns whether each distinct pattern matches a label."""
+        patAnswers = np.zeros((self.numPats,), dtype=np.bool_)
+        patAnswers[self.alwaysPatIndices] = True
+        patAnswers[[
+            patIndex
+            for patIndex, lit in self.containsPats
+            if lit in label
+        ]] = True
+        patAnswers[[
+            patIndex
+            for patIndex, lit in self.prefixPats
+            if label.startswith(lit)
+        ]] = True
+        patAnswers[[
+            patIndex
+            for patIndex, lit in self.suffixPats
+            if label.endswith(lit)
+        ]] = True
+        patAnswers[[
+            patIndex
+            for patIndex, lit in self.exactPats
+            if label == lit
+        ]] = True
+        patAnswers[[
+            patIndex
+            for patIndex, anchor, match in self.generalPats
+            if anchor in label and match(label)
+        ]] = True
+        return patAnswers
+
+    def getAnswers(self, label):
+        """Returns a boolean numpy array of answers to each question."""
+        if not self.quesIds:
+            return np.zeros((0,), dtype=np.bool_)
+        patAnswers = self.getPatAnswers(label)
+        return np.logical_or.reduceat(
+            patAnswers[self.quesPatIndices], self.quesStarts
+        )
+
+    def getAnswerDict(self, label):
+        """Returns a dict mapping each question id to its answer."""
+        return dict(zip(self.quesIds, self.getAnswers(label).tolist()))
+
+    def getAnswerMatrix(self, labels):
+        """Returns the answers to each question for each of many labels.
+
+        The returned value is as for the `getAnswerMatrix` function.
+        """
+        uniqueLabels, labelIndices = getUniqueLabels(labels)
+        uniqueAnswers = np.zeros(
+            (len(uniqueLabels), len(self.quesIds)), dtype=np.bool_
+        )
+        for labelIndex, label in enumerate(uniqueLabels):
+            uniqueAnswers[labelIndex] = self.getAnswers(label)
+
+        return uniqueAnswers[labelIndices]
+
+class QuesAnswerCache(object):
+    """Caches the answers to questions for recently seen labels.
+
+    Each answer for a given (label, quesId) pair is computed lazily using
+    `quesReDict` the first time it is requested and remembered after that.
+    Answers are kept for at most `maxLabels` labels, with the least recently
+    used label being evicted first.
+    The same cache may be shared by any number of trees using the same
+    `quesReDict`.
+    The bookkeeping makes each lookup more expensive than matching a question
+    directly, so a cache only pays off when the same labels are looked up
+    repeatedly with the same questions.
+
+    Example usage:
+
+    >>> import htk_io.ques as qio
+    >>> quesReDict = qio.getQuesReDict([('C-a', ['*-a+*'])])
+    >>> answerCache = qio.QuesAnswerCache(quesReDict, maxLabels=2)
+    >>> answerCache.getAnswer('x-a+y', 'C-a')
+    True
+    >>> answerCache.getAnswer('x-a+y', 'C-a')
+    True
+    >>> answerCache.getAnswer('x-b+y', 'C-a')
+    False
+    >>> answerCache.hits, answerCache.misses, answerCache.evictions
+    (1, 2, 0)
+    >>> answerCache.getAnswer('x-c+y', 'C-a')
+    False
+    >>> answerCache.getAnswer('x-a+y', 'C-a')
+    True
+    >>> answerCache.hits, answerCache.misses, answerCache.evictions
+    (1, 4, 2)
+    """
+    def __init__(self, quesReDict, maxLabels=10000):
+        self.quesReDict = quesReDict
+        self.maxLabels = maxLabels
+
+        assert self.maxLabels >= 1
+
+        self.clear()
+
+    def clear(self):
+        """Forgets all cached answers and resets the counters."""
+        self.labelAnswers = OrderedDict()
+        self.currLabel = None
+        self.currAnswers = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _setCurrLabel(self, label):
+        answers = self.labelAnswers.pop(label, None)
+        if answers is None:
+            answers = dict()
+            if len(self.labelAnswers) >= self.maxLabels:
+                self.labelAnswers.popitem(last=False)
+                self.evictions += 1
+        self.labelAnswers[label] = answers
+        self.currLabel = label
+        self.currAnswers = answers
+
+    def getAnswer(self, label, quesId):
+        """Returns True if the answer to question `quesId` is yes."""
+        # (consecutive requests are usually for the same label, so avoid
+        #   re-ordering the LRU list in that case)
+        if label != self.currLabel:
+            self._setCurrLabel(label)
+        answers = self.currAnswers
+        answer = answers.get(quesId)
+        if answer is None:
+            answer = self.quesReDict[quesId].match(label) is not None
+            answers[quesId] = answer
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
 def parseQuestionLines(lines, isTreeFile=False):
     questions = []
     restIndex = len(lines)
@@ -59,17 +341,18 @@ def readQuestionLines(lines, isTreeFile=False):
     assert not linesRest
     return questions
 
-def writeQuestionLines(questions, isTreeFile=False):
-    outLines = []
+def iterWriteQuestionLines(questions, isTreeFile=False):
+    """Returns an iterator over the lines written by `writeQuestionLines`."""
     for quesId, quesPats in questions:
         if isTreeFile:
             quesPatsStr = ','.join(map(addQuotes, quesPats))
-            outLines.append('QS %s { %s }' % (quesId, quesPatsStr))
+            yield 'QS %s { %s }' % (quesId, quesPatsStr)
         else:
             quesPatsStr = ','.join(quesPats)
-            outLines.append('QS %s {%s}' % (addQuotes(quesId), quesPatsStr))
+            yield 'QS %s {%s}' % (addQuotes(quesId), quesPatsStr)
 
-    return outLines
+def writeQuestionLines(questions, isTreeFile=False):
+    return list(iterWriteQuestionLines(questions, isTreeFile=isTreeFile))
 
 def readQuesFile(quesFile):
     """Reads a question file."""
@@ -77,15 +360,30 @@ def readQuesFile(quesFile):
     questions = readQuestionLines(lines)
     return questions
 
-def readQuesFileVerifying(quesFile):
+def readQuesFileVerifying(quesFile, cacheDir=None, verify='full',
+                          sampleFraction=0.1):
     """Reads a question file and verifies that it was read correctly.
 
     Verifies that reconstructing the question file from the parsed output
     reproduces the original question file up to certain whitespace
     substitutions.
+    The `verify` and `sampleFraction` arguments control how thoroughly this
+    is checked (see `verifiedRead`).
+
+    If `cacheDir` is specified then the parsed questions are cached in
+    `cacheDir`, and the parsing and verification are skipped when a file with
+    the same contents is read again (see `readFileLinesCached`).
     """
-    lines = [ line.rstrip('\n') for line in open(quesFile, 'U') ]
-    questions = verifiedRead(readQuestionLines, writeQuestionLines, lines)
+    def readLinesVerifying(lines):
+        return verifiedRead(
+            readQuestionLines, iterWriteQuestionLines, lines,
+            verify=verify, sampleFraction=sampleFraction
+        )
+
+    cacheName = getVerifiedCacheName('ques', verify, sampleFraction)
+    questions = readFileLinesCached(
+        readLinesVerifying, quesFile, cacheDir, cacheName
+    )
     return questions
 
 def writeQuesFile(questions, quesFile):
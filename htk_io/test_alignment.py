@@ -7,7 +7,11 @@
 
 import unittest
 import doctest
+import os
 import random
+import shutil
+import tempfile
+import numpy as np
 from numpy.random import randint, randn
 
 import htk_io.alignment as alio
@@ -92,6 +96,29 @@ def gen_labelMap():
     return SimpleLabelMap(ident)
 
 class AlignmentTest(unittest.TestCase):
+    def test_roundHalfAway(self, its=50):
+        for it in range(its):
+            x = np.concatenate([
+                randn(20) * 10.0 ** randint(8),
+                randint(-100, 100, size=20) + 0.5,
+                [0.49999999999999994, -0.49999999999999994, 0.0],
+            ])
+            self.assertEqual(
+                alio.roundHalfAway(x).tolist(),
+                [ round(value) for value in x.tolist() ]
+            )
+
+    def test_parseInts(self, its=50):
+        for it in range(its):
+            ints = [ int(value) for value in randint(-10 ** 9, 10 ** 9,
+                                                     size=randint(10)) ]
+            intStrs = [ str(value) for value in ints ]
+            self.assertEqual(alio.parseInts(intStrs).tolist(), ints)
+        for badStrs in [['1', '2.5'], ['1e5'], ['0x10'], ['3', 'a']]:
+            self.assertRaises(ValueError, alio.parseInts, badStrs)
+        self.assertRaises(OverflowError, alio.parseInts,
+                          ['99999999999999999999'])
+
     def test_SimpleAlignmentIo_writeLines_empty(self):
         framePeriod = gen_framePeriod()
         alignmentIo = alio.SimpleAlignmentIo(framePeriod)
@@ -138,6 +165,41 @@ class AlignmentTest(unittest.TestCase):
             alignmentAgain = alignmentIo.readLines(alignmentLines)
             self.assertEqual(alignmentAgain, alignment)
 
+    def test_SimpleAlignmentIo_large_times(self, its=50):
+        for it in range(its):
+            framePeriod = gen_framePeriod()
+            alignmentIo = alio.SimpleAlignmentIo(framePeriod)
+            divisor = framePeriod * 1e7
+            ticksStrs = [
+                str(random.choice([1, -1]) * randint(2 ** 62) *
+                    2 ** randint(12))
+                for _ in range(6)
+            ] + ['9223372036854775807', '-9223372036854775808']
+            random.shuffle(ticksStrs)
+            alignmentLines = [
+                '%s %s a' % (startTicks, endTicks)
+                for startTicks, endTicks in zip(ticksStrs[::2],
+                                                ticksStrs[1::2])
+            ]
+            alignment = alignmentIo.readLines(alignmentLines)
+            self.assertEqual(alignment, [
+                (int(round(int(startTicks) / divisor)),
+                 int(round(int(endTicks) / divisor)), 'a', None)
+                for startTicks, endTicks in zip(ticksStrs[::2],
+                                                ticksStrs[1::2])
+            ])
+            self.assertEqual(alignmentIo.writeLines(alignment), [
+                '%s %s a' % (int(round(startTime * divisor)),
+                             int(round(endTime * divisor)))
+                for startTime, endTime, _, _ in alignment
+            ])
+
+    def test_SimpleAlignmentIo_writeLines_bad_segment(self):
+        alignmentIo = alio.SimpleAlignmentIo(gen_framePeriod())
+        for badSegment in [(0, 1, 'a'), (0, 1, 'a', None, None)]:
+            self.assertRaises(ValueError, alignmentIo.writeLines,
+                              [(0, 1, 'a', None), badSegment])
+
     def test_flatten_1_level(self, its=50):
         for it in range(its):
             alignment = gen_alignment()
@@ -181,6 +243,44 @@ class AlignmentTest(unittest.TestCase):
             ]
             self.assertEqual(flatAlignmentAgain, flatAlignment)
 
+    def test_flatten_checkRecover(self, its=200):
+        def perturb(alignment):
+            segIndex = randint(len(alignment))
+            startTime, endTime, label, subAlignment = alignment[segIndex]
+            choice = randint(4)
+            if choice == 0:
+                # remove a sub-alignment
+                subAlignment = None
+            elif choice == 1:
+                # change a time
+                if randint(2) == 0:
+                    startTime += random.choice([-1, 1])
+                else:
+                    endTime += random.choice([-1, 1])
+            elif choice == 2 and subAlignment is not None:
+                subAlignment = perturb(list(subAlignment))
+            elif choice == 3:
+                # add an extra level
+                subAlignment = [(startTime, endTime, label, subAlignment)]
+            alignment[segIndex] = startTime, endTime, label, subAlignment
+            return alignment
+
+        for it in range(its):
+            numLevels = randint(1, 4)
+            alignment = gen_alignment(numLevels=numLevels, minSize=1)
+            if randint(4) != 0:
+                alignment = perturb(alignment)
+
+            flatAlignment = alio.flatten(alignment, checkRecover=False)
+            try:
+                recoverable = alio.unflatten(flatAlignment) == alignment
+            except (AssertionError, IndexError):
+                recoverable = False
+            if recoverable:
+                self.assertEqual(alio.flatten(alignment), flatAlignment)
+            else:
+                self.assertRaises(RuntimeError, alio.flatten, alignment)
+
     def test_unflatten(self, its=50):
         for it in range(its):
             numLevels = randint(1, 4)
@@ -190,6 +290,212 @@ class AlignmentTest(unittest.TestCase):
             alignmentAgain = alio.unflatten(flatAlignment)
             self.assertEqual(alignmentAgain, alignment)
 
+    def test_iterUnflatten(self, its=50):
+        for it in range(its):
+            numLevels = randint(1, 4)
+            alignment = gen_alignment(numLevels=numLevels)
+            flatAlignment = alio.flatten(alignment)
+
+            consumed = []
+            def genFlatSegments():
+                for flatSegment in flatAlignment:
+                    consumed.append(flatSegment)
+                    yield flatSegment
+
+            segments = []
+            for segment in alio.iterUnflatten(genFlatSegments()):
+                segments.append(segment)
+                # only the flat segments making up the segments so far, plus
+                #   at most one more to detect the end of a segment, should
+                #   have been consumed
+                numFlat = len(alio.flatten(segments))
+                self.assertTrue(numFlat <= len(consumed) <= numFlat + 1)
+            self.assertEqual(segments, alignment)
+
+    def test_AlignmentIo_iterSegments(self, its=20):
+        tempDir = tempfile.mkdtemp()
+        try:
+            alignmentFile = os.path.join(tempDir, 'utt.lab')
+            for it in range(its):
+                numLevels = randint(1, 4)
+                alignment = gen_alignment(numLevels=numLevels)
+                framePeriod = gen_framePeriod()
+                alignmentIo = alio.AlignmentIo(framePeriod)
+                alignmentIo.writeFile(alignmentFile, alignment)
+
+                self.assertEqual(
+                    list(alignmentIo.iterSegments(alignmentFile)),
+                    alio.flatten(alignment)
+                )
+                self.assertEqual(
+                    list(alignmentIo.iterAlignment(alignmentFile)),
+                    alignment
+                )
+                self.assertEqual(alignmentIo.readFile(alignmentFile),
+                                 alignment)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_ArrayAlignment(self, its=50):
+        labelVocab = alio.LabelVocab()
+        for it in range(its):
+            numLevels = randint(1, 4)
+            alignment = gen_alignment(numLevels=numLevels)
+
+            arrayAlignment = alio.getArrayAlignment(alignment, labelVocab)
+
+            self.assertEqual(arrayAlignment.toAlignment(), alignment)
+            if alignment:
+                self.assertEqual(arrayAlignment.numLevels, numLevels)
+            flatAlignment = alio.flatten(alignment)
+            self.assertEqual(
+                arrayAlignment.getDurations().tolist(),
+                [ endTime - startTime
+                  for startTime, endTime, _, _ in flatAlignment ]
+            )
+            self.assertEqual(
+                [ labelVocab.labels[labelCode]
+                  for labelCode in arrayAlignment.labelCodes[-1] ],
+                [ labelTuple[0] for _, _, labelTuple, _ in flatAlignment ]
+            )
+
+    def test_AlignmentIo_readArrayFile(self, its=20):
+        tempDir = tempfile.mkdtemp()
+        try:
+            alignmentFile = os.path.join(tempDir, 'utt.lab')
+            alignmentFileAgain = os.path.join(tempDir, 'utt-again.lab')
+            labelVocab = alio.LabelVocab()
+            for it in range(its):
+                numLevels = randint(1, 4)
+                alignment = gen_alignment(numLevels=numLevels)
+                alignmentIo = alio.AlignmentIo(gen_framePeriod())
+                alignmentIo.writeFile(alignmentFile, alignment)
+
+                arrayAlignment = alignmentIo.readArrayFile(alignmentFile,
+                                                           labelVocab)
+                self.assertEqual(arrayAlignment.toAlignment(), alignment)
+
+                alignmentIo.writeArrayFile(alignmentFileAgain, arrayAlignment)
+                self.assertEqual(alignmentIo.readFile(alignmentFileAgain),
+                                 alignment)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_AlignmentArchive(self, its=10):
+        tempDir = tempfile.mkdtemp()
+        try:
+            for it in range(its):
+                archiveFile = os.path.join(tempDir, 'lab.archive')
+                uttIds = [ 'utt%s' % uttIndex
+                           for uttIndex in range(randint(6)) ]
+                alignments = dict([
+                    (uttId, gen_alignment(numLevels=randint(1, 4)))
+                    for uttId in uttIds
+                ])
+                alio.writeAlignmentArchive(archiveFile, alignments.get, uttIds)
+
+                for mmap in [True, False]:
+                    archive = alio.AlignmentArchive(archiveFile, mmap=mmap)
+                    self.assertEqual(archive.uttIds, uttIds)
+                    self.assertEqual(len(archive), len(uttIds))
+                    for uttId in reversed(uttIds):
+                        self.assertTrue(uttId in archive)
+                        self.assertEqual(archive(uttId), alignments[uttId])
+                        arrayAlignment = archive.getArrayAlignment(uttId)
+                        self.assertIs(arrayAlignment.labelVocab,
+                                      archive.labelVocab)
+                    self.assertFalse('utt_missing' in archive)
+                    del archive
+
+                # writing an ArrayAlignment with a different label vocab
+                labelVocab = alio.LabelVocab(['x', 'y'])
+                alignment = gen_alignment(numLevels=randint(1, 4))
+                with alio.AlignmentArchiveWriter(archiveFile) as writer:
+                    writer.write('utt0', gen_alignment())
+                    writer.writeArray(
+                        'utt1', alio.getArrayAlignment(alignment, labelVocab)
+                    )
+                self.assertEqual(
+                    alio.AlignmentArchive(archiveFile)('utt1'), alignment
+                )
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_alignmentToFrames(self, its=50):
+        for it in range(its):
+            numLevels = randint(1, 4)
+            alignment = gen_alignment(numLevels=numLevels)
+            labelToIndex = dict([
+                (label, randint(-5, 100))
+                for label in ['a', 'b', 'aa', 'ab', 'ba', 'bb']
+            ])
+            arrayAlignment = alio.getArrayAlignment(alignment,
+                                                    alio.LabelVocab())
+
+            framesList = []
+            for level in range(arrayAlignment.numLevels):
+                framesGood = []
+                for startTime, endTime, labelCode in zip(
+                    arrayAlignment.startTimes[level],
+                    arrayAlignment.endTimes[level],
+                    arrayAlignment.labelCodes[level]
+                ):
+                    label = arrayAlignment.labelVocab.labels[labelCode]
+                    framesGood.extend(
+                        [labelToIndex[label]] * (endTime - startTime)
+                    )
+                frames = alio.alignmentToFrames(alignment, labelToIndex,
+                                                level=level)
+                self.assertEqual(frames.dtype, np.int32)
+                self.assertEqual(frames.tolist(), framesGood)
+                framesList.append(framesGood)
+
+            levels = range(arrayAlignment.numLevels)
+            random.shuffle(levels)
+            framesMulti = alio.alignmentToFrames(alignment, labelToIndex,
+                                                 level=levels)
+            self.assertEqual(framesMulti.dtype, np.int32)
+            self.assertEqual(framesMulti.shape,
+                             (len(framesList[0]), len(levels)))
+            for column, level in enumerate(levels):
+                self.assertEqual(framesMulti[:, column].tolist(),
+                                 framesList[level])
+
+    def test_alignmentToFrames_not_contiguous(self):
+        self.assertRaises(
+            RuntimeError,
+            alio.alignmentToFrames,
+            [(0, 1, 'a', None), (2, 3, 'b', None)], {'a': 0, 'b': 1}
+        )
+
+    def test_framesToAlignment(self, its=50):
+        for it in range(its):
+            startTime = randint(-10, 11)
+            alignment = gen_alignment(startTimeInit=startTime, minDur=1)
+            # (merge adjacent segments with the same label)
+            alignmentGood = []
+            for segment in alignment:
+                if alignmentGood and alignmentGood[-1][2] == segment[2]:
+                    alignmentGood[-1] = (alignmentGood[-1][0], segment[1],
+                                         segment[2], None)
+                else:
+                    alignmentGood.append(segment)
+            labelToIndex = dict([
+                (label, index)
+                for index, label in enumerate(['a', 'b', 'aa', 'ab', 'ba',
+                                               'bb'])
+            ])
+            indexToLabel = dict([
+                (index, label) for label, index in labelToIndex.items()
+            ])
+
+            frames = alio.alignmentToFrames(alignment, labelToIndex)
+            self.assertEqual(
+                alio.framesToAlignment(frames, startTime=startTime,
+                                       indexToLabel=indexToLabel),
+                alignmentGood
+            )
+
     def test_AlignmentIo_writeLines_1_level(self, its=50):
         for it in range(its):
             framePeriod = gen_framePeriod()
@@ -7,16 +7,110 @@
 
 import unittest
 import doctest
+import os
+import shutil
+import tempfile
+import numpy as np
+from numpy.random import randint, randn
 
 import htk_io.base
+from htk_io.vecseq import VecSeqIo
 
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(htk_io.base))
     return tests
 
-# FIXME : add tests
 class BaseTest(unittest.TestCase):
-    pass
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.dataFile = os.path.join(self.tempDir, 'data')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_readFrames(self, its=50):
+        for it in range(its):
+            numFrames = randint(10)
+            frameShape = tuple(randint(1, 4, size=randint(1, 3)))
+            dtype = [np.float32, np.float64, np.int32][randint(3)]
+            values = randn(numFrames, *frameShape).astype(dtype)
+            values.tofile(self.dataFile)
+
+            self.assertEqual(
+                htk_io.base.getNumFrames(self.dataFile, frameShape, dtype),
+                numFrames
+            )
+            startFrame = randint(numFrames + 1)
+            endFrame = randint(startFrame, numFrames + 1)
+            valuesRange = htk_io.base.readFrames(
+                self.dataFile, frameShape, dtype, startFrame, endFrame
+            )
+            self.assertEqual(valuesRange.dtype, dtype)
+            self.assertEqual(valuesRange.shape,
+                             (endFrame - startFrame,) + frameShape)
+            assert np.all(valuesRange == values[startFrame:endFrame])
+            assert np.all(
+                htk_io.base.readFrames(self.dataFile, frameShape, dtype) ==
+                values
+            )
+
+            self.assertRaises(
+                RuntimeError,
+                htk_io.base.readFrames,
+                self.dataFile, frameShape, dtype, startFrame, numFrames + 1
+            )
+
+    def test_getNumFrames_invalid_size(self):
+        np.zeros((5,), dtype=np.float32).tofile(self.dataFile)
+        self.assertEqual(
+            htk_io.base.getNumFrames(self.dataFile, (5,), np.float32), 1
+        )
+        self.assertRaises(RuntimeError, htk_io.base.getNumFrames,
+                          self.dataFile, (2,), np.float32)
+        self.assertRaises(RuntimeError, htk_io.base.readFrames,
+                          self.dataFile, (3,), np.float32, 0, 1)
+
+    def test_CachingDirReader(self, its=20):
+        vecSeqIo = VecSeqIo(3)
+        for it in range(its):
+            maxEntries = [None, randint(1, 4)][randint(2)]
+            maxBytes = [None, randint(100)][randint(2)]
+            cacheTransformed = (randint(2) == 1)
+            numCalls = [0]
+            def transform(vecSeq):
+                numCalls[0] += 1
+                return vecSeq * 2.0
+            getVecSeq = htk_io.base.CachingDirReader(
+                vecSeqIo, self.tempDir, 'mgc', transform=transform,
+                maxEntries=maxEntries, maxBytes=maxBytes,
+                cacheTransformed=cacheTransformed
+            )
+
+            vecSeqs = dict()
+            for _ in range(30):
+                base = 'utt%s' % randint(5)
+                vecSeqFile = os.path.join(self.tempDir, '%s.mgc' % base)
+                if base not in vecSeqs or randint(5) == 0:
+                    vecSeqs[base] = randn(randint(5), 3).astype(np.float32)
+                    vecSeqIo.writeFile(vecSeqFile, vecSeqs[base])
+                    # (ensure change is detected even if size is unchanged)
+                    mtime = randint(1000000)
+                    os.utime(vecSeqFile, (mtime, mtime))
+                numCallsBefore = numCalls[0]
+                missesBefore = getVecSeq.misses
+                assert np.all(getVecSeq(base) == vecSeqs[base] * 2.0)
+                if not cacheTransformed or getVecSeq.misses > missesBefore:
+                    self.assertEqual(numCalls[0], numCallsBefore + 1)
+                else:
+                    self.assertEqual(numCalls[0], numCallsBefore)
+
+                if maxEntries is not None:
+                    self.assertTrue(len(getVecSeq.entries) <= maxEntries)
+                if maxBytes is not None:
+                    self.assertTrue(getVecSeq.numBytes <= maxBytes)
+            self.assertEqual(getVecSeq.hits + getVecSeq.misses, 30)
+            for base in vecSeqs:
+                os.remove(os.path.join(self.tempDir, '%s.mgc' % base))
 
 if __name__ == '__main__':
     unittest.main()
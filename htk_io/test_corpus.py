@@ -0,0 +1,113 @@
+"""Tests for functions for processing a collection of files."""
+
+# Copyright 2014, 2015 Matt Shannon
+
+# This file is part of htk_io.
+# See `License` for details of license and warranty.
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from htk_io.base import DirReader
+import htk_io.alignment as alio
+import htk_io.corpus as corpus
+from htk_io.test_alignment import gen_alignment
+
+def mapLabelsToUpper(alignment):
+    return [
+        (startTime, endTime, label.upper(), subAlignment)
+        for startTime, endTime, label, subAlignment in alignment
+    ]
+
+class CorpusTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.readDir = os.path.join(self.tempDir, 'in')
+        self.writeDir = os.path.join(self.tempDir, 'out')
+        os.mkdir(self.readDir)
+        os.mkdir(self.writeDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_mapFiles(self):
+        alignmentIo = alio.AlignmentIo(framePeriod=1e-7)
+        uttIds = [ 'utt%s' % uttIndex for uttIndex in range(10) ]
+        alignments = dict()
+        for uttId in uttIds:
+            alignments[uttId] = gen_alignment()
+            alignmentIo.writeFile(
+                os.path.join(self.readDir, '%s.lab' % uttId),
+                alignments[uttId]
+            )
+
+        for numJobs in [1, 3]:
+            stderrOrig = sys.stderr
+            sys.stderr = StringIO()
+            try:
+                self.assertRaises(
+                    RuntimeError,
+                    corpus.mapFiles,
+                    mapLabelsToUpper, uttIds + ['missing'],
+                    alignmentIo, self.readDir, 'lab',
+                    alignmentIo, self.writeDir, 'lab%s' % numJobs,
+                    numJobs=numJobs
+                )
+                errorOutput = sys.stderr.getvalue()
+            finally:
+                sys.stderr = stderrOrig
+            self.assertIn('error processing utterance missing', errorOutput)
+            for uttId in uttIds:
+                self.assertEqual(
+                    alignmentIo.readFile(
+                        os.path.join(self.writeDir,
+                                     '%s.lab%s' % (uttId, numJobs))
+                    ),
+                    mapLabelsToUpper(alignments[uttId])
+                )
+        self.assertEqual(len(os.listdir(self.writeDir)), 2 * len(uttIds))
+
+    def test_iterPrefetched(self):
+        alignmentIo = alio.AlignmentIo(framePeriod=1e-7)
+        uttIds = [ 'utt%s' % uttIndex for uttIndex in range(20) ]
+        alignments = dict()
+        for uttId in uttIds:
+            alignments[uttId] = gen_alignment()
+            alignmentIo.writeFile(
+                os.path.join(self.readDir, '%s.lab' % uttId),
+                alignments[uttId]
+            )
+        getAlignment = DirReader(alignmentIo, self.readDir, 'lab',
+                                 transform=mapLabelsToUpper)
+
+        for useProcesses in [False, True]:
+            for numPrefetch, numWorkers in [(1, 1), (4, 3), (100, 2)]:
+                self.assertEqual(
+                    list(corpus.iterPrefetched(
+                        getAlignment, uttIds, numPrefetch=numPrefetch,
+                        numWorkers=numWorkers, useProcesses=useProcesses
+                    )),
+                    [ mapLabelsToUpper(alignments[uttId]) for uttId in uttIds ]
+                )
+
+            # exceptions are re-raised in order
+            objs = corpus.iterPrefetched(
+                getAlignment, uttIds[:2] + ['missing'] + uttIds[2:],
+                numPrefetch=4, numWorkers=2, useProcesses=useProcesses
+            )
+            self.assertEqual(next(objs), mapLabelsToUpper(alignments['utt0']))
+            self.assertEqual(next(objs), mapLabelsToUpper(alignments['utt1']))
+            self.assertRaises(IOError, next, objs)
+
+            # iteration may be abandoned early
+            objs = corpus.iterPrefetched(getAlignment, uttIds,
+                                         useProcesses=useProcesses)
+            self.assertEqual(next(objs), mapLabelsToUpper(alignments['utt0']))
+            objs.close()
+
+if __name__ == '__main__':
+    unittest.main()
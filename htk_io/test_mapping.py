@@ -0,0 +1,218 @@
+"""Tests for functions and classes for mapping the labels in alignments."""
+
+# Copyright 2014, 2015 Matt Shannon
+
+# This file is part of htk_io.
+# See `License` for details of license and warranty.
+
+import unittest
+import doctest
+import random
+import numpy as np
+from numpy.random import randint
+
+import htk_io.ques as qio
+import htk_io.tree as tio
+import htk_io.mapping as mapping
+from htk_io.test_ques import gen_label, gen_questions
+from htk_io.test_tree import gen_tree
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(mapping))
+    return tests
+
+def gen_sublabel_alignment(subLabelStrEnds, size=None):
+    """Returns a 2-level (label, sublabel) alignment."""
+    if size is None:
+        size = randint(5)
+    alignment = []
+    startTime = 0
+    for _ in range(size):
+        label = gen_label()
+        subAlignment = []
+        for subLabelStrEnd in subLabelStrEnds:
+            endTime = startTime + randint(1, 4)
+            subAlignment.append(
+                (startTime, endTime, label + subLabelStrEnd, None)
+            )
+            startTime = endTime
+        alignment.append(
+            (subAlignment[0][0], subAlignment[-1][1], label, subAlignment)
+        )
+    return alignment
+
+class MappingTest(unittest.TestCase):
+    def test_LeafMacroIdMapper(self, its=20):
+        for it in range(its):
+            questions = gen_questions()
+            quesReDict = qio.getQuesReDict(questions)
+            quesIds = [ quesId for quesId, _ in questions ]
+            numSubLabels = randint(1, 4)
+            subLabelStrEnds = mapping.getSubLabelStrEnds('[%d]', numSubLabels)
+            streamSpecs = [
+                '{*}[%s].stream[1]' % (subLabelIndex + 2)
+                for subLabelIndex in range(numSubLabels)
+            ]
+            streamSpecedTrees = [
+                (streamSpec,
+                 gen_tree(quesIds, leafPrefix='s%s_' % (subLabelIndex + 2)))
+                for subLabelIndex, streamSpec in enumerate(streamSpecs)
+            ]
+            random.shuffle(streamSpecedTrees)
+            treeOf = dict(streamSpecedTrees)
+
+            leafMacroIdMapper = mapping.LeafMacroIdMapper(
+                questions, streamSpecedTrees, streamSpecs, subLabelStrEnds
+            )
+            self.assertIs(leafMacroIdMapper.answerCache, None)
+            answerCache = qio.QuesAnswerCache(quesReDict,
+                                              maxLabels=randint(1, 5))
+            leafMacroIdMapperCached = mapping.LeafMacroIdMapper(
+                questions, streamSpecedTrees, streamSpecs, subLabelStrEnds,
+                answerCache=answerCache
+            )
+            for navTree in leafMacroIdMapperCached.navTrees:
+                self.assertIs(navTree.answerCache, answerCache)
+            for _ in range(3):
+                alignment = gen_sublabel_alignment(subLabelStrEnds)
+                alignmentGood = []
+                for _, _, label, subAlignment in alignment:
+                    for subLabelIndex, (subStartTime, subEndTime, _, _) in (
+                        enumerate(subAlignment)
+                    ):
+                        navTree = tio.NavBinaryTree(
+                            quesReDict, treeOf[streamSpecs[subLabelIndex]]
+                        )
+                        alignmentGood.append((
+                            subStartTime, subEndTime,
+                            navTree.getLeaf(label).macroId, None
+                        ))
+                self.assertEqual(leafMacroIdMapper(alignment), alignmentGood)
+                self.assertEqual(leafMacroIdMapperCached(alignment),
+                                 alignmentGood)
+
+            self.assertRaises(
+                RuntimeError,
+                mapping.LeafMacroIdMapper,
+                questions, streamSpecedTrees, ['{*}[7].stream[1]'], ['[7]']
+            )
+
+    def test_LeafIndexMapper(self, its=20):
+        for it in range(its):
+            questions = gen_questions()
+            quesIds = [ quesId for quesId, _ in questions ]
+            numSubLabels = randint(1, 4)
+            subLabelStrEnds = mapping.getSubLabelStrEnds('[%d]', numSubLabels)
+            streamSpecs = [
+                '{*}[%s].stream[1]' % (subLabelIndex + 2)
+                for subLabelIndex in range(numSubLabels)
+            ]
+            streamSpecedTrees = [
+                (streamSpec,
+                 gen_tree(quesIds, leafPrefix='s%s_' % (subLabelIndex + 2)))
+                for subLabelIndex, streamSpec in enumerate(streamSpecs)
+            ]
+            leafMacroIdMapper = mapping.LeafMacroIdMapper(
+                questions, streamSpecedTrees, streamSpecs, subLabelStrEnds
+            )
+            leafMacroIdToIndex = mapping.getLeafMacroIdToIndex(
+                streamSpecedTrees
+            )
+            leafIndexMapper = mapping.LeafIndexMapper(leafMacroIdMapper,
+                                                      leafMacroIdToIndex)
+            leafIndexMapperFrames = mapping.LeafIndexMapper(
+                leafMacroIdMapper, leafMacroIdToIndex, perFrame=True
+            )
+
+            alignment = gen_sublabel_alignment(subLabelStrEnds)
+            alignmentMacroId = leafMacroIdMapper(alignment)
+
+            segments = leafIndexMapper(alignment)
+            self.assertEqual(segments.dtype, np.int32)
+            self.assertEqual(segments.tolist(), [
+                [startTime, endTime, leafMacroIdToIndex[leafMacroId]]
+                for startTime, endTime, leafMacroId, _ in alignmentMacroId
+            ])
+
+            frames = leafIndexMapperFrames(alignment)
+            self.assertEqual(frames.dtype, np.int32)
+            self.assertEqual(frames.tolist(), [
+                [leafMacroIdToIndex[leafMacroId]]
+                for startTime, endTime, leafMacroId, _ in alignmentMacroId
+                for _ in range(startTime, endTime)
+            ])
+
+            # (per-frame output requires the alignment to start at time 0)
+            alignmentShifted = gen_sublabel_alignment(subLabelStrEnds,
+                                                      size=randint(1, 5))
+            offset = randint(1, 4)
+            alignmentShifted = [
+                (startTime + offset, endTime + offset, label, [
+                    (subStartTime + offset, subEndTime + offset, subLabel,
+                     None)
+                    for subStartTime, subEndTime, subLabel, _ in subAlignment
+                ])
+                for startTime, endTime, label, subAlignment in alignmentShifted
+            ]
+            self.assertRaises(RuntimeError, leafIndexMapperFrames,
+                              alignmentShifted)
+            self.assertEqual(
+                leafIndexMapper(alignmentShifted)[0, 0], offset
+            )
+
+    def test_QuesAnswerMapper(self, its=20):
+        for it in range(its):
+            questions = gen_questions()
+            quesReDict = qio.getQuesReDict(questions)
+            numSubLabels = randint(1, 4)
+            subLabelStrEnds = mapping.getSubLabelStrEnds('[%d]', numSubLabels)
+
+            quesAnswerMapper = mapping.QuesAnswerMapper(questions,
+                                                        subLabelStrEnds)
+            alignment = gen_sublabel_alignment(subLabelStrEnds)
+            alignmentNew = quesAnswerMapper(alignment)
+
+            subSegments = [
+                (label, subLabelIndex, subSegment)
+                for _, _, label, subAlignment in alignment
+                for subLabelIndex, subSegment in enumerate(subAlignment)
+            ]
+            self.assertEqual(len(alignmentNew), len(subSegments))
+            for (label, subLabelIndex, subSegment), segmentNew in zip(
+                subSegments, alignmentNew
+            ):
+                self.assertEqual(segmentNew[:2], subSegment[:2])
+                answerStrs = segmentNew[2].split(',')
+                self.assertEqual(answerStrs[0],
+                                 str((subLabelIndex + 0.5) / numSubLabels))
+                self.assertEqual(answerStrs[1:], [
+                    str(int(bool(quesReDict[quesId].match(label))))
+                    for quesId, _ in questions
+                ])
+
+    def test_getLeafMacroIdToIndex(self, its=20):
+        for it in range(its):
+            questions = gen_questions()
+            quesIds = [ quesId for quesId, _ in questions ]
+            streamSpecedTrees = [
+                ('{*}[%s].stream[1]' % state,
+                 gen_tree(quesIds, leafPrefix='s%s_' % randint(2, 4)))
+                for state in range(randint(1, 4))
+            ]
+            leafMacroIdToIndex = mapping.getLeafMacroIdToIndex(
+                streamSpecedTrees
+            )
+            leafMacroIds = sorted(leafMacroIdToIndex)
+            self.assertEqual(
+                [ leafMacroIdToIndex[leafMacroId]
+                  for leafMacroId in leafMacroIds ],
+                range(len(leafMacroIds))
+            )
+            self.assertEqual(set(leafMacroIds), set([
+                leaf.macroId
+                for _, tree in streamSpecedTrees
+                for leaf in tree.leaves
+            ]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Tests for helper functions for I/O."""
+
+# Copyright 2014, 2015 Matt Shannon
+
+# This file is part of htk_io.
+# See `License` for details of license and warranty.
+
+import unittest
+import doctest
+import random
+from numpy.random import randint
+
+import htk_io.misc
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(htk_io.misc))
+    return tests
+
+def gen_line():
+    return ''.join([
+        random.choice(['a', 'b', ' ', '  ', '\t', '\r', '\x0b', '\x0c'])
+        for _ in range(randint(8))
+    ])
+
+def gen_lines():
+    """Returns lines which are either blank or have no leading whitespace."""
+    return [
+        random.choice(['', ' \t', 'a' + gen_line(), 'b' + gen_line()])
+        for _ in range(randint(10))
+    ]
+
+def readWords(lines):
+    return [ line.split() for line in lines if line.split() ]
+
+def writeWords(wordsList):
+    return [ ' '.join(words) for words in wordsList ]
+
+def iterWriteWords(wordsList):
+    for words in wordsList:
+        yield ' '.join(words)
+
+class MiscTest(unittest.TestCase):
+    def test_normalizeLineWhitespace(self, its=500):
+        for it in range(its):
+            line = gen_line()
+            self.assertEqual(
+                [ outLine
+                  for outLine in [htk_io.misc.normalizeLineWhitespace(line)]
+                  if outLine != '' ],
+                htk_io.misc.normalizeWhitespace([line])
+            )
+
+    def test_verifiedRead(self, its=100):
+        for it in range(its):
+            lines = gen_lines()
+            for verify in ['full', 'sampled', 'off']:
+                for write in [writeWords, iterWriteWords]:
+                    self.assertEqual(
+                        htk_io.misc.verifiedRead(readWords, write, lines,
+                                                 verify=verify),
+                        readWords(lines)
+                    )
+
+    def test_verifiedRead_mismatch(self, its=100):
+        def writeWordsBad(wordsList):
+            linesOut = writeWords(wordsList)
+            if randint(2) == 0:
+                linesOut[randint(len(linesOut))] += 'c'
+            else:
+                del linesOut[randint(len(linesOut))]
+            return linesOut
+
+        for it in range(its):
+            lines = gen_lines() + ['a']
+            self.assertRaises(
+                RuntimeError,
+                htk_io.misc.verifiedRead, readWords, writeWordsBad, lines
+            )
+            self.assertEqual(
+                htk_io.misc.verifiedRead(readWords, writeWordsBad, lines,
+                                         verify='off'),
+                readWords(lines)
+            )
+            # (a sample fraction of 1 checks every line)
+            self.assertRaises(
+                RuntimeError,
+                htk_io.misc.verifiedRead, readWords, writeWordsBad, lines,
+                verify='sampled', sampleFraction=1.0
+            )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""Tests for functions for reading and writing HTK / HTS question files."""
+
+# Copyright 2014, 2015 Matt Shannon
+
+# This file is part of htk_io.
+# See `License` for details of license and warranty.
+
+import unittest
+import doctest
+import random
+import re
+import os
+import shutil
+import tempfile
+from numpy.random import randint
+
+import htk_io.ques as qio
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(qio))
+    return tests
+
+def gen_phone(alphabet=None):
+    if alphabet is None:
+        alphabet = ['a', 'b', 'c']
+    return random.choice(alphabet)
+
+def gen_label():
+    """Returns a simple full-context label such as "a^b-c+a"."""
+    return '%s^%s-%s+%s' % tuple([ gen_phone() for _ in range(4) ])
+
+def gen_ques_pat():
+    """Returns a question pattern in the style used by HTS question sets."""
+    phone = gen_phone()
+    return random.choice([
+        '%s^*' % phone,
+        '*^%s-*' % phone,
+        '*-%s+*' % phone,
+        '*+%s' % phone,
+        '*%s*' % phone,
+        '*-?+%s' % phone,
+    ])
+
+def gen_questions(numQuestions=None):
+    if numQuestions is None:
+        numQuestions = randint(1, 10)
+    return [
+        ('Q%s' % quesIndex, [ gen_ques_pat() for _ in range(randint(1, 4)) ])
+        for quesIndex in range(numQuestions)
+    ]
+
+def gen_str(alphabet, maxSize=6):
+    return ''.join([
+        random.choice(alphabet)
+        for _ in range(randint(maxSize + 1))
+    ])
+
+def gen_ques_pat_unusual():
+    """Returns a question pattern using any of the fnmatch features."""
+    while True:
+        quesPat = gen_str('ab-*?[]!')
+        try:
+            qio.getQuesRe([quesPat])
+        except re.error:
+            # (e.g. "[b-a]" is not a valid pattern)
+            continue
+        return quesPat
+
+def gen_questions_unusual(numQuestions=None):
+    if numQuestions is None:
+        numQuestions = randint(1, 10)
+    return [
+        (
+            'Q%s' % quesIndex,
+            [ gen_ques_pat_unusual() for _ in range(randint(4)) ]
+        )
+        for quesIndex in range(numQuestions)
+    ]
+
+class QuesTest(unittest.TestCase):
+    def test_getAnswerMatrix(self, its=50):
+        for it in range(its):
+            questions = gen_questions()
+            quesRes = [ qio.getQuesRe(quesPats) for _, quesPats in questions ]
+            labels = [ gen_label() for _ in range(randint(10)) ]
+
+            answers = qio.getAnswerMatrix(labels, quesRes)
+
+            self.assertEqual(answers.shape, (len(labels), len(questions)))
+            answersGood = [
+                [ quesRe.match(label) is not None for quesRe in quesRes ]
+                for label in labels
+            ]
+            self.assertEqual(answers.tolist(), answersGood)
+
+    def test_QuesMatcher(self, its=200):
+        for it in range(its):
+            if randint(2) == 0:
+                questions = gen_questions()
+                labels = [ gen_label() for _ in range(10) ]
+            else:
+                questions = gen_questions_unusual()
+                labels = [ gen_str('ab-[]!') for _ in range(10) ]
+            quesReDict = qio.getQuesReDict(questions)
+            quesMatcher = qio.QuesMatcher(questions)
+
+            for label in labels:
+                answerDictGood = dict([
+                    (quesId, quesRe.match(label) is not None)
+                    for quesId, quesRe in quesReDict.items()
+                ])
+                self.assertEqual(quesMatcher.getAnswerDict(label),
+                                 answerDictGood)
+
+            quesRes = [ quesReDict[quesId] for quesId, _ in questions ]
+            self.assertEqual(
+                quesMatcher.getAnswerMatrix(labels).tolist(),
+                qio.getAnswerMatrix(labels, quesRes).tolist()
+            )
+
+    def test_readQuesFileVerifying_cached(self, its=10):
+        tempDir = tempfile.mkdtemp()
+        try:
+            quesFile = os.path.join(tempDir, 'questions.hed')
+            cacheDir = os.path.join(tempDir, 'cache')
+            os.mkdir(cacheDir)
+            for it in range(its):
+                questions = gen_questions()
+                qio.writeQuesFile(questions, quesFile)
+                for _ in range(2):
+                    questionsAgain = qio.readQuesFileVerifying(
+                        quesFile, cacheDir=cacheDir
+                    )
+                    self.assertEqual(questionsAgain,
+                                     qio.readQuesFileVerifying(quesFile))
+            self.assertTrue(len(os.listdir(cacheDir)) <= its)
+        finally:
+            shutil.rmtree(tempDir)
+
+if __name__ == '__main__':
+    unittest.main()
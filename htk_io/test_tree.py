@@ -0,0 +1,320 @@
+"""Tests for functions for reading and writing HTK / HTS decision tree files."""
+
+# Copyright 2014, 2015 Matt Shannon
+
+# This file is part of htk_io.
+# See `License` for details of license and warranty.
+
+import unittest
+import doctest
+import random
+import os
+import shutil
+import tempfile
+from numpy.random import randint
+
+import htk_io.ques as qio
+import htk_io.tree as tio
+from htk_io.test_ques import gen_label, gen_questions
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(tio))
+    return tests
+
+def gen_tree(quesIds, numSplits=None, leafPrefix='s2_'):
+    """Returns a random binary tree asking questions from `quesIds`."""
+    if numSplits is None:
+        numSplits = randint(6)
+    if numSplits == 0:
+        return tio.Tree([], rootNode=tio.Leaf('%s1' % leafPrefix))
+
+    # give each split except the root a parent chosen from earlier splits
+    childLists = [ [] for _ in range(numSplits) ]
+    for splitId in range(1, numSplits):
+        while True:
+            parentId = randint(splitId)
+            if len(childLists[parentId]) < 2:
+                break
+        childLists[parentId].append(splitId)
+
+    splitInfos = []
+    numLeaves = 0
+    for splitId in range(numSplits):
+        children = list(childLists[splitId])
+        while len(children) < 2:
+            numLeaves += 1
+            children.append(tio.Leaf('%s%s' % (leafPrefix, numLeaves)))
+        random.shuffle(children)
+        quesId = random.choice(quesIds)
+        splitInfos.append((splitId, quesId, children[0], children[1]))
+    random.shuffle(splitInfos)
+
+    return tio.Tree(splitInfos, rootNode=0)
+
+class TreeTest(unittest.TestCase):
+    def test_CompiledNavBinaryTree_getLeaf(self, its=50):
+        for it in range(its):
+            questions = gen_questions()
+            quesReDict = qio.getQuesReDict(questions)
+            quesIds = [ quesId for quesId, _ in questions ]
+            tree = gen_tree(quesIds)
+            navTree = tio.NavBinaryTree(quesReDict, tree)
+            compiledTree = tio.CompiledNavBinaryTree(quesReDict, tree)
+
+            for _ in range(10):
+                label = gen_label()
+                leaf = navTree.getLeaf(label)
+                self.assertIs(compiledTree.getLeaf(label), leaf)
+                self.assertIs(
+                    tree.leaves[compiledTree.getLeafIndex(label)], leaf
+                )
+
+    def test_NavBinaryTree_getLeaves(self, its=50):
+        for it in range(its):
+            questions = gen_questions()
+            quesReDict = qio.getQuesReDict(questions)
+            quesIds = [ quesId for quesId, _ in questions ]
+            tree = gen_tree(quesIds)
+            navTree = tio.NavBinaryTree(quesReDict, tree)
+            navTreeCached = tio.NavBinaryTree(
+                quesReDict, tree,
+                answerCache=qio.QuesAnswerCache(quesReDict)
+            )
+
+            labels = [ gen_label() for _ in range(randint(20)) ]
+            labels += random.sample(labels, len(labels) // 2)
+            leafIndicesGood = [
+                tree.leaves.index(navTree.getLeaf(label)) for label in labels
+            ]
+            for navTreeCurr in [navTree, navTreeCached]:
+                leafIndices = navTreeCurr.getLeaves(labels)
+                self.assertEqual(leafIndices.shape, (len(labels),))
+                self.assertEqual(leafIndices.tolist(), leafIndicesGood)
+
+    def test_QuesAnswerCache_shared(self, its=50):
+        for it in range(its):
+            questions = gen_questions()
+            quesReDict = qio.getQuesReDict(questions)
+            quesIds = [ quesId for quesId, _ in questions ]
+            trees = [ gen_tree(quesIds) for _ in range(3) ]
+            answerCache = qio.QuesAnswerCache(quesReDict,
+                                              maxLabels=randint(1, 5))
+            navTreePairs = [
+                (
+                    tio.NavBinaryTree(quesReDict, tree),
+                    random.choice([
+                        tio.NavBinaryTree, tio.CompiledNavBinaryTree
+                    ])(quesReDict, tree, answerCache=answerCache)
+                )
+                for tree in trees
+            ]
+
+            for _ in range(10):
+                label = gen_label()
+                for navTree, navTreeCached in navTreePairs:
+                    self.assertIs(navTreeCached.getLeaf(label),
+                                  navTree.getLeaf(label))
+            self.assertTrue(
+                len(answerCache.labelAnswers) <= answerCache.maxLabels
+            )
+            for label, answers in answerCache.labelAnswers.items():
+                for quesId, answer in answers.items():
+                    self.assertEqual(
+                        answer, bool(quesReDict[quesId].match(label))
+                    )
+
+    def test_Tree_lazy(self, its=50):
+        for it in range(its):
+            questions = gen_questions()
+            quesIds = [ quesId for quesId, _ in questions ]
+            tree = gen_tree(quesIds)
+            self.assertIs(tree._nodes, None)
+            nodes = [ node for node, _ in tree.breadthFirst() ]
+            self.assertEqual(tree.nodes, nodes)
+            self.assertEqual(tree.splitIds, [
+                node for node in nodes if not isinstance(node, tio.Leaf)
+            ])
+            self.assertEqual(tree.leaves, [
+                node for node in nodes if isinstance(node, tio.Leaf)
+            ])
+            self.assertEqual(tree.countReachableSplits(),
+                             len(tree.splitIds))
+
+            splitInfos = [
+                (splitId, tree.getQuesId[splitId],
+                 tree.getChildren[splitId][0], tree.getChildren[splitId][1])
+                for splitId in tree.splitIdsInOrigOrder
+            ]
+            unreachableSplitInfo = (
+                1000, random.choice(quesIds),
+                tio.Leaf('s2_1000'), tio.Leaf('s2_1001')
+            )
+            self.assertRaises(
+                RuntimeError,
+                tio.Tree, splitInfos + [unreachableSplitInfo], tree.rootNode
+            )
+
+    def test_StreamSpecIndex(self, its=50):
+        for it in range(its):
+            questions = gen_questions()
+            quesIds = [ quesId for quesId, _ in questions ]
+            states = range(2, 2 + randint(1, 4))
+            streams = range(1, 1 + randint(1, 5))
+            # (each state has one tree per stream range, with random ranges)
+            streamSpecedTrees = []
+            treeOf = dict()
+            for state in states:
+                streamStart = streams[0]
+                while streamStart <= streams[-1]:
+                    streamEnd = randint(streamStart, streams[-1] + 1)
+                    if streamStart == streamEnd:
+                        streamSpec = '{*}[%s].stream[%s]' % (state,
+                                                             streamStart)
+                    else:
+                        streamSpec = '{*}[%s].stream[%s-%s]' % (
+                            state, streamStart, streamEnd
+                        )
+                    tree = gen_tree(quesIds, leafPrefix='s%s_' % state)
+                    streamSpecedTrees.append((streamSpec, tree))
+                    for stream in range(streamStart, streamEnd + 1):
+                        treeOf[state, stream] = tree
+                    streamStart = streamEnd + 1
+            random.shuffle(streamSpecedTrees)
+
+            index = tio.StreamSpecIndex(streamSpecedTrees)
+            for streamSpec, tree in streamSpecedTrees:
+                self.assertIs(index.getTree(streamSpec), tree)
+            treeGrid = index.getTreeGrid(states, streams)
+            for state, treeRow in zip(states, treeGrid):
+                for stream, tree in zip(streams, treeRow):
+                    self.assertIs(tree, treeOf[state, stream])
+                    self.assertIs(
+                        index.getTree('{*}[%s].stream[%s]' % (state, stream)),
+                        tree
+                    )
+            self.assertRaises(RuntimeError, index.getTreeForStateStream,
+                              states[-1] + 1, streams[0])
+            self.assertRaises(RuntimeError, index.getTree,
+                              '{*}[%s].stream[%s]' % (states[0],
+                                                      streams[-1] + 1))
+
+    def test_readTreeFileVerifying_cached(self, its=10):
+        tempDir = tempfile.mkdtemp()
+        try:
+            treeFile = os.path.join(tempDir, 'tree.inf')
+            cacheDir = os.path.join(tempDir, 'cache')
+            os.mkdir(cacheDir)
+            for it in range(its):
+                questions = gen_questions()
+                quesIds = [ quesId for quesId, _ in questions ]
+                streamSpecedTrees = [
+                    ('{*}[%s].stream[1]' % state,
+                     gen_tree(quesIds, leafPrefix='s%s_' % state))
+                    for state in range(2, 2 + randint(1, 4))
+                ]
+                tio.writeTreeFile(questions, streamSpecedTrees, treeFile)
+                treeLines = tio.writeTreeFileLines(questions,
+                                                   streamSpecedTrees)
+                self.assertEqual(
+                    list(tio.iterWriteTreeFileLines(questions,
+                                                    streamSpecedTrees)),
+                    treeLines
+                )
+                for _ in range(2):
+                    questionsAgain, streamSpecedTreesAgain = (
+                        tio.readTreeFileVerifying(treeFile, cacheDir=cacheDir)
+                    )
+                    self.assertEqual(
+                        tio.writeTreeFileLines(questionsAgain,
+                                               streamSpecedTreesAgain),
+                        treeLines
+                    )
+
+            # (results verified with different sample fractions are cached
+            #   separately)
+            for cacheFile in os.listdir(cacheDir):
+                os.remove(os.path.join(cacheDir, cacheFile))
+            for sampleFraction in [0.01, 0.5, 0.01]:
+                tio.readTreeFileVerifying(treeFile, cacheDir=cacheDir,
+                                          verify='sampled',
+                                          sampleFraction=sampleFraction)
+            self.assertEqual(len(os.listdir(cacheDir)), 2)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_writeTreeFileBinary(self, its=20):
+        tempDir = tempfile.mkdtemp()
+        try:
+            treeFile = os.path.join(tempDir, 'tree.bin')
+            for it in range(its):
+                questions = gen_questions()
+                quesIds = [ quesId for quesId, _ in questions ]
+                streamSpecedTrees = [
+                    ('{*}[%s].stream[%s]' % (state, stream),
+                     gen_tree(quesIds, leafPrefix='s%s_' % state))
+                    for state in range(2, 2 + randint(4))
+                    for stream in range(1, randint(1, 3) + 1)
+                ]
+                tio.writeTreeFileBinary(questions, streamSpecedTrees,
+                                        treeFile)
+                questionsAgain, streamSpecedTreesAgain = (
+                    tio.readTreeFileBinary(treeFile)
+                )
+
+                self.assertEqual(questionsAgain, questions)
+                self.assertEqual(
+                    tio.writeTreeFileLines(questionsAgain,
+                                           streamSpecedTreesAgain),
+                    tio.writeTreeFileLines(questions, streamSpecedTrees)
+                )
+                for (_, tree), (_, treeAgain) in zip(streamSpecedTrees,
+                                                     streamSpecedTreesAgain):
+                    self.assertEqual(map(str, treeAgain.nodes),
+                                     map(str, tree.nodes))
+                    self.assertEqual(
+                        map(str, treeAgain.nodes),
+                        [ str(node) for node, _ in treeAgain.breadthFirst() ]
+                    )
+                    self.assertEqual(treeAgain.splitIds, tree.splitIds)
+                    self.assertEqual(map(str, treeAgain.leaves),
+                                     map(str, tree.leaves))
+
+            # (unicode strings are stored as utf-8)
+            tio.writeTreeFileBinary(
+                [(u'Q\xe9', [u'*-\xe9+*']), ('R', ['*'])],
+                [(u'{*}[2].stream[1]', tio.Tree([
+                    (0, u'Q\xe9', tio.Leaf(u's2_\xe9'), tio.Leaf('s2_2')),
+                ], rootNode=0))],
+                treeFile
+            )
+            questionsAgain, streamSpecedTreesAgain = (
+                tio.readTreeFileBinary(treeFile)
+            )
+            self.assertEqual(questionsAgain, [
+                ('Q\xc3\xa9', ['*-\xc3\xa9+*']), ('R', ['*'])
+            ])
+            self.assertEqual(
+                tio.writeTreeFileLines(questionsAgain, streamSpecedTreesAgain),
+                [
+                    'QS Q\xc3\xa9 { "*-\xc3\xa9+*" }',
+                    'QS R { "*" }',
+                    '',
+                    ' {*}[2].stream[1]',
+                    '{',
+                    ' 0 Q\xc3\xa9 "s2_\xc3\xa9" "s2_2"',
+                    '}',
+                    '',
+                ]
+            )
+            for questionsBad in [[(1, ['*'])], [('Q', [None])]]:
+                self.assertRaises(RuntimeError, tio.writeTreeFileBinary,
+                                  questionsBad, [], treeFile)
+
+            with open(treeFile, 'w') as f:
+                f.write('QS x { "*" }\n')
+            self.assertRaises(RuntimeError, tio.readTreeFileBinary, treeFile)
+        finally:
+            shutil.rmtree(tempDir)
+
+if __name__ == '__main__':
+    unittest.main()
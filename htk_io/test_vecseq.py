@@ -0,0 +1,132 @@
+"""Tests for functions for reading and writing raw vector sequence files."""
+
+# Copyright 2014, 2015 Matt Shannon
+
+# This file is part of htk_io.
+# See `License` for details of license and warranty.
+
+import unittest
+import doctest
+import os
+import shutil
+import tempfile
+import numpy as np
+from numpy.random import randint, randn
+
+from htk_io.base import DirReader
+import htk_io.vecseq as vsio
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(vsio))
+    return tests
+
+def gen_vecSeq(numFrames=None, vecSize=None):
+    if numFrames is None:
+        numFrames = randint(10)
+    if vecSize is None:
+        vecSize = randint(1, 5)
+    return randn(numFrames, vecSize)
+
+class VecSeqTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.vecSeqFile = os.path.join(self.tempDir, 'utt.mgc')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_VecSeqIo_readFile(self, its=50):
+        for it in range(its):
+            vecSeq = gen_vecSeq()
+            numFrames, vecSize = vecSeq.shape
+            vecSeqIo = vsio.VecSeqIo(vecSize)
+            vecSeqIo.writeFile(self.vecSeqFile, vecSeq)
+
+            vecSeqAgain = vecSeqIo.readFile(self.vecSeqFile)
+            self.assertEqual(vecSeqAgain.dtype, np.float)
+            self.assertEqual(vecSeqAgain.shape, (numFrames, vecSize))
+            assert np.all(vecSeqAgain == vecSeq.astype(np.float32))
+
+    def test_VecSeqIo_readFile_mmap(self, its=50):
+        for it in range(its):
+            vecSeq = gen_vecSeq()
+            numFrames, vecSize = vecSeq.shape
+            dtypeFile = [np.float32, np.float64][randint(2)]
+            vecSeqIo = vsio.VecSeqIo(vecSize, dtypeFile=dtypeFile)
+            vecSeqIoMmap = vsio.VecSeqIo(vecSize, dtypeFile=dtypeFile,
+                                         mmap=True)
+            vecSeqIo.writeFile(self.vecSeqFile, vecSeq)
+
+            vecSeqMmap = vecSeqIoMmap.readFile(self.vecSeqFile)
+            self.assertEqual(vecSeqMmap.dtype, dtypeFile)
+            self.assertEqual(vecSeqMmap.shape, (numFrames, vecSize))
+            assert np.all(vecSeqMmap == vecSeqIo.readFile(self.vecSeqFile))
+
+            vecIndex = randint(vecSize)
+            traj = vsio.VecSeqToTraj(vecIndex)(vecSeqMmap)
+            self.assertEqual(type(traj), np.ndarray)
+            self.assertEqual(traj.dtype, dtypeFile)
+            trajFloat = vsio.VecSeqToTraj(vecIndex, dtype=np.float)(
+                vecSeqMmap
+            )
+            self.assertEqual(trajFloat.dtype, np.float)
+            assert np.all(trajFloat == vecSeq[:, vecIndex].astype(dtypeFile))
+            del vecSeqMmap, traj
+
+    def test_VecSeqIo_readFileFrames(self, its=50):
+        for it in range(its):
+            vecSeq = gen_vecSeq()
+            numFrames, vecSize = vecSeq.shape
+            vecSeqIo = vsio.VecSeqIo(vecSize, mmap=(randint(2) == 1))
+            vecSeqIo.writeFile(self.vecSeqFile, vecSeq)
+
+            self.assertEqual(vecSeqIo.getNumFrames(self.vecSeqFile),
+                             numFrames)
+            startFrame = randint(numFrames + 1)
+            endFrame = randint(startFrame, numFrames + 1)
+            vecSeqRange = vecSeqIo.readFileFrames(self.vecSeqFile,
+                                                  startFrame, endFrame)
+            vecSeqAll = vecSeqIo.readFile(self.vecSeqFile)
+            self.assertEqual(vecSeqRange.dtype, vecSeqAll.dtype)
+            assert np.all(vecSeqRange == vecSeqAll[startFrame:endFrame])
+            del vecSeqAll
+
+    def test_VecSeqArchive(self, its=10):
+        for it in range(its):
+            vecSize = randint(1, 5)
+            dtypeFile = [np.float32, np.float64][randint(2)]
+            vecSeqIo = vsio.VecSeqIo(vecSize, dtypeFile=dtypeFile, mmap=True)
+            uttIds = [ 'utt%s' % uttIndex for uttIndex in range(randint(6)) ]
+            for uttId in uttIds:
+                vecSeqIo.writeFile(
+                    os.path.join(self.tempDir, '%s.mgc' % uttId),
+                    gen_vecSeq(vecSize=vecSize)
+                )
+            getVecSeq = DirReader(vecSeqIo, self.tempDir, 'mgc')
+            archiveFile = os.path.join(self.tempDir, 'mgc.archive')
+            vsio.writeVecSeqArchive(archiveFile, getVecSeq, uttIds,
+                                    dtypeFile=dtypeFile)
+
+            archive = vsio.VecSeqArchive(archiveFile)
+            archiveNoMmap = vsio.VecSeqArchive(archiveFile, mmap=False)
+            self.assertEqual(archive.uttIds, uttIds)
+            self.assertEqual(len(archive), len(uttIds))
+            for uttId in reversed(uttIds):
+                vecSeq = getVecSeq(uttId)
+                self.assertTrue(uttId in archive)
+                self.assertEqual(archive.getNumFrames(uttId), len(vecSeq))
+
+                vecSeqMmap = archive(uttId)
+                self.assertEqual(vecSeqMmap.dtype, dtypeFile)
+                self.assertEqual(vecSeqMmap.shape, vecSeq.shape)
+                assert np.all(vecSeqMmap == vecSeq)
+
+                vecSeqRead = archiveNoMmap(uttId)
+                self.assertEqual(vecSeqRead.dtype, np.float)
+                assert np.all(vecSeqRead == vecSeq)
+                del vecSeq, vecSeqMmap
+            self.assertFalse('utt_missing' in archive)
+            del archive
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,15 @@
 # This file is part of htk_io.
 # See `License` for details of license and warranty.
 
+import gc
+import re
+import json
+import struct
 from collections import deque
+import numpy as np
 
 from htk_io.misc import stripQuotes, addQuotes, verifiedRead
+from htk_io.misc import readFileLinesCached, getVerifiedCacheName
 import htk_io.ques as qio
 
 class Leaf(object):
@@ -21,7 +27,17 @@ class Leaf(object):
         return 'Leaf(%r)' % self.macroId
 
 class Tree(object):
-    def __init__(self, splitInfos, rootNode):
+    """A decision tree.
+
+    The lists of nodes, split ids and leaves in breadth-first order (`nodes`,
+    `splitIds` and `leaves`) are only computed when first accessed, so
+    constructing a tree that is only used to look up leaves is cheap.
+
+    If `nodes` is specified, it should be the list of nodes in breadth-first
+    order (as returned by `breadthFirst`), and is used instead of traversing
+    the tree.
+    """
+    def __init__(self, splitInfos, rootNode, nodes=None):
         self.getQuesId = dict()
         self.getChildren = dict()
         self.splitIdsInOrigOrder = [
@@ -36,17 +52,56 @@ class Tree(object):
         assert (isinstance(self.rootNode, Leaf) or
                 self.rootNode in self.getChildren)
 
-        self.nodes = [ node for node, depth in self.breadthFirst() ]
-        self.splitIds = [ node
-                          for node in self.nodes
-                          if not isinstance(node, Leaf) ]
-        assert len(self.splitIds) <= len(splitInfos)
-        if len(self.splitIds) < len(splitInfos):
+        if nodes is None:
+            numReachable = self.countReachableSplits()
+        else:
+            assert len(nodes) % 2 == 1
+            numReachable = len(nodes) // 2
+        assert numReachable <= len(splitInfos)
+        if numReachable < len(splitInfos):
             raise RuntimeError('there appear to be unreachable nodes')
-        self.leaves = [ node
-                        for node in self.nodes
-                        if isinstance(node, Leaf) ]
-        assert len(self.leaves) == len(self.splitIds) + 1
+
+        self._nodes = nodes
+        self._splitIds = None
+        self._leaves = None
+
+    def countReachableSplits(self):
+        """Returns the number of split nodes reachable from the root."""
+        getChildren = self.getChildren
+        agenda = [] if isinstance(self.rootNode, Leaf) else [self.rootNode]
+        numReachable = 0
+        while agenda:
+            numReachable += 1
+            for childNode in getChildren[agenda.pop()]:
+                if not isinstance(childNode, Leaf):
+                    agenda.append(childNode)
+        return numReachable
+
+    @property
+    def nodes(self):
+        """The list of nodes in breadth-first order."""
+        if self._nodes is None:
+            self._nodes = [ node for node, depth in self.breadthFirst() ]
+        return self._nodes
+
+    @property
+    def splitIds(self):
+        """The list of split ids in breadth-first order."""
+        if self._splitIds is None:
+            self._splitIds = [ node
+                               for node in self.nodes
+                               if not isinstance(node, Leaf) ]
+        return self._splitIds
+
+    @property
+    def leaves(self):
+        """The list of leaves in breadth-first order."""
+        if self._leaves is None:
+            self._leaves = [ node
+                             for node in self.nodes
+                             if isinstance(node, Leaf) ]
+            assert len(self._leaves) == len(self.getChildren) + 1
+        return self._leaves
 
     def breadthFirst(self, nodeStart = None):
         """Returns an iterator over nodes in the tree in breadth-first order.
@@ -93,25 +148,218 @@ class NavBinaryTree(object):
     Each internal node in the tree should have two children, with the first
     child corresponding to a "no" answer to that node's question and the second
     child corresponding to a "yes" answer.
+
+    If `answerCache` is specified, it should be a `QuesAnswerCache` for
+    `quesReDict`, and questions are answered using the cache instead of by
+    matching against `quesReDict` directly.
     """
-    def __init__(self, quesReDict, tree):
+    def __init__(self, quesReDict, tree, answerCache=None):
         self.quesReDict = quesReDict
         self.tree = tree
+        self.answerCache = answerCache
+        # (leaf index for each leaf, computed when first needed by getLeaves)
+        self._leafIndexOf = None
 
-        for node in self.tree.splitIds:
-            assert len(self.tree.getChildren[node]) == 2
+        for children in self.tree.getChildren.values():
+            assert len(children) == 2
+        if self.answerCache is not None:
+            assert self.answerCache.quesReDict is self.quesReDict
 
     def getLeaf(self, label):
         """Returns the leaf associated with a label."""
         node = self.tree.rootNode
-        while not isinstance(node, Leaf):
-            quesId = self.tree.getQuesId[node]
-            children = self.tree.getChildren[node]
-            quesRe = self.quesReDict[quesId]
-            node = children[1] if quesRe.match(label) else children[0]
+        if self.answerCache is None:
+            while not isinstance(node, Leaf):
+                quesId = self.tree.getQuesId[node]
+                children = self.tree.getChildren[node]
+                quesRe = self.quesReDict[quesId]
+                node = children[1] if quesRe.match(label) else children[0]
+        else:
+            getAnswer = self.answerCache.getAnswer
+            while not isinstance(node, Leaf):
+                quesId = self.tree.getQuesId[node]
+                children = self.tree.getChildren[node]
+                node = children[1] if getAnswer(label, quesId) else children[0]
 
         return node
 
+    def getLeaves(self, labels):
+        """Returns the index in `tree.leaves` of the leaf for each label.
+
+        The labels are routed through the tree together, level by level, so
+        that each node's question is answered only for the labels which reach
+        that node (and only once for each distinct label).
+        Returns an integer numpy array with one element per label.
+
+        >>> import htk_io.ques as qio
+        >>> import htk_io.tree as tio
+        >>> questions = [('C-a', ['*-a+*']), ('L-b', ['b^*'])]
+        >>> tree = tio.Tree([
+        ...     (0, 'C-a', 1, tio.Leaf('s2_1')),
+        ...     (1, 'L-b', tio.Leaf('s2_2'), tio.Leaf('s2_3')),
+        ... ], rootNode=0)
+        >>> navTree = tio.NavBinaryTree(qio.getQuesReDict(questions), tree)
+        >>> navTree.getLeaves(['b^x-a+y', 'b^x-b+y', 'x^x-b+y', 'b^x-a+y'])
+        array([0, 2, 1, 0])
+        """
+        if self._leafIndexOf is None:
+            self._leafIndexOf = dict([
+                (leaf, leafIndex)
+                for leafIndex, leaf in enumerate(self.tree.leaves)
+            ])
+        leafIndexOf = self._leafIndexOf
+
+        uniqueIndexOf = dict()
+        uniqueIndices = np.array([
+            uniqueIndexOf.setdefault(label, len(uniqueIndexOf))
+            for label in labels
+        ], dtype=np.int64)
+        uniqueLabels = [None] * len(uniqueIndexOf)
+        for label, uniqueIndex in uniqueIndexOf.iteritems():
+            uniqueLabels[uniqueIndex] = label
+
+        uniqueLeafIndices = np.empty((len(uniqueLabels),), dtype=np.int64)
+        agenda = deque([(self.tree.rootNode, uniqueLabels)])
+        while agenda:
+            node, nodeLabels = agenda.popleft()
+            if isinstance(node, Leaf):
+                leafIndex = leafIndexOf[node]
+                for label in nodeLabels:
+                    uniqueLeafIndices[uniqueIndexOf[label]] = leafIndex
+            elif nodeLabels:
+                quesId = self.tree.getQuesId[node]
+                if self.answerCache is None:
+                    quesMatch = self.quesReDict[quesId].match
+                    answers = [ quesMatch(label) for label in nodeLabels ]
+                else:
+                    getAnswer = self.answerCache.getAnswer
+                    answers = [ getAnswer(label, quesId)
+                                for label in nodeLabels ]
+                noChild, yesChild = self.tree.getChildren[node]
+                agenda.append((noChild, [
+                    label
+                    for label, answer in zip(nodeLabels, answers)
+                    if not answer
+                ]))
+                agenda.append((yesChild, [
+                    label
+                    for label, answer in zip(nodeLabels, answers)
+                    if answer
+                ]))
+
+        return uniqueLeafIndices[uniqueIndices]
+
+class CompiledNavBinaryTree(object):
+    """A navigable binary decision tree compiled into flat node tables.
+
+    Behaves like `NavBinaryTree`, but the tree structure is stored as lists
+    indexed by node index rather than as dicts keyed by split id, so that
+    finding the leaf for a label involves no per-node dict lookups.
+
+    Node indices 0 to `numSplits - 1` are the internal nodes in the
+    breadth-first order given by `tree.splitIds`, and the remaining node
+    indices are the leaves in the order given by `tree.leaves`.
+    For each node index, `quesIndices` gives the index into `quesIds` of the
+    question asked at that node (-1 for a leaf), `noChildren` and
+    `yesChildren` give the node indices of its children (-1 for a leaf) and
+    `leafIndices` gives the index into `tree.leaves` (-1 for an internal
+    node).
+
+    Example usage:
+
+    >>> import htk_io.ques as qio
+    >>> import htk_io.tree as tio
+    >>> questions = [('C-a', ['*-a+*']), ('L-b', ['b^*'])]
+    >>> tree = tio.Tree([
+    ...     (0, 'C-a', 1, tio.Leaf('s2_1')),
+    ...     (1, 'L-b', tio.Leaf('s2_2'), tio.Leaf('s2_3')),
+    ... ], rootNode=0)
+    >>> compiledTree = tio.CompiledNavBinaryTree(
+    ...     qio.getQuesReDict(questions), tree
+    ... )
+    >>> compiledTree.getLeafIndex('b^x-a+y')
+    0
+    >>> compiledTree.getLeaf('b^x-b+y')
+    Leaf('s2_3')
+    >>> compiledTree.getLeaf('x^x-b+y')
+    Leaf('s2_2')
+
+    As for `NavBinaryTree`, a `QuesAnswerCache` for `quesReDict` may be
+    specified as `answerCache`.
+    """
+    def __init__(self, quesReDict, tree, answerCache=None):
+        self.tree = tree
+        self.answerCache = answerCache
+
+        if self.answerCache is not None:
+            assert self.answerCache.quesReDict is quesReDict
+
+        splitIds = self.tree.splitIds
+        leaves = self.tree.leaves
+        self.numSplits = len(splitIds)
+        numNodes = self.numSplits + len(leaves)
+
+        nodeIndexOf = dict()
+        for splitIndex, splitId in enumerate(splitIds):
+            nodeIndexOf[splitId] = splitIndex
+        for leafIndex, leaf in enumerate(leaves):
+            nodeIndexOf[leaf] = self.numSplits + leafIndex
+
+        self.quesIds = []
+        quesIndexOf = dict()
+        self.quesIndices = [-1] * numNodes
+        self.noChildren = [-1] * numNodes
+        self.yesChildren = [-1] * numNodes
+        self.leafIndices = [-1] * self.numSplits + range(len(leaves))
+        for splitIndex, splitId in enumerate(splitIds):
+            quesId = self.tree.getQuesId[splitId]
+            if quesId not in quesIndexOf:
+                quesIndexOf[quesId] = len(self.quesIds)
+                self.quesIds.append(quesId)
+            noChild, yesChild = self.tree.getChildren[splitId]
+            self.quesIndices[splitIndex] = quesIndexOf[quesId]
+            self.noChildren[splitIndex] = nodeIndexOf[noChild]
+            self.yesChildren[splitIndex] = nodeIndexOf[yesChild]
+
+        self.quesRes = [ quesReDict[quesId] for quesId in self.quesIds ]
+        self._nodeMatches = [
+            self.quesRes[quesIndex].match
+            for quesIndex in self.quesIndices[:self.numSplits]
+        ]
+        self._nodeQuesIds = [
+            self.quesIds[quesIndex]
+            for quesIndex in self.quesIndices[:self.numSplits]
+        ]
+
+    def getLeafIndex(self, label):
+        """Returns the index in `tree.leaves` of the leaf for a label."""
+        numSplits = self.numSplits
+        nodeMatches = self._nodeMatches
+        noChildren = self.noChildren
+        yesChildren = self.yesChildren
+
+        node = 0
+        if self.answerCache is None:
+            while node < numSplits:
+                if nodeMatches[node](label):
+                    node = yesChildren[node]
+                else:
+                    node = noChildren[node]
+        else:
+            getAnswer = self.answerCache.getAnswer
+            nodeQuesIds = self._nodeQuesIds
+            while node < numSplits:
+                if getAnswer(label, nodeQuesIds[node]):
+                    node = yesChildren[node]
+                else:
+                    node = noChildren[node]
+
+        return node - numSplits
+
+    def getLeaf(self, label):
+        """Returns the leaf associated with a label."""
+        return self.tree.leaves[self.getLeafIndex(label)]
+
 def readTreeFileLines(treeFileLines):
     questions, treeFileLines = qio.parseQuestionLines(
         treeFileLines, isTreeFile=True
@@ -183,32 +431,32 @@ def readTreeFileLines(treeFileLines):
     quesIdsSet = set([ quesId for quesId, _ in questions ])
     assert len(quesIdsSet) == len(questions)
     for streamSpec, tree in streamSpecedTrees:
-        for splitId in tree.splitIds:
-            quesId = tree.getQuesId[splitId]
+        for quesId in tree.getQuesId.values():
             assert quesId in quesIdsSet
 
     return questions, streamSpecedTrees
 
-def writeTreeFileLines(questions, streamSpecedTrees):
-    outLines = list(qio.writeQuestionLines(questions, isTreeFile=True))
+def iterWriteTreeFileLines(questions, streamSpecedTrees):
+    """Returns an iterator over the lines written by `writeTreeFileLines`."""
+    for line in qio.iterWriteQuestionLines(questions, isTreeFile=True):
+        yield line
     for streamSpec, tree in streamSpecedTrees:
-        outLines.append('')
-        outLines.append(' %s' % streamSpec)
+        yield ''
+        yield ' %s' % streamSpec
         if isinstance(tree.rootNode, Leaf):
             # degenerate tree with just a root leaf
-            outLines.append(' %s' % tree.rootNode)
+            yield ' %s' % tree.rootNode
         else:
-            outLines.append('{')
+            yield '{'
             for splitId in tree.splitIdsInOrigOrder:
                 quesId = tree.getQuesId[splitId]
                 leftChild, rightChild = tree.getChildren[splitId]
-                outLines.append(
-                    ' %s %s %s %s' %
-                    (splitId, quesId, leftChild, rightChild)
-                )
-            outLines.append('}')
-    outLines.append('')
-    return outLines
+                yield ' %s %s %s %s' % (splitId, quesId, leftChild, rightChild)
+            yield '}'
+    yield ''
+
+def writeTreeFileLines(questions, streamSpecedTrees):
+    return list(iterWriteTreeFileLines(questions, streamSpecedTrees))
 
 def readTreeFile(treeFile):
     """Reads a decision tree file."""
@@ -216,16 +464,29 @@ def readTreeFile(treeFile):
     questions, streamSpecedTrees = readTreeFileLines(lines)
     return questions, streamSpecedTrees
 
-def readTreeFileVerifying(treeFile):
+def readTreeFileVerifying(treeFile, cacheDir=None, verify='full',
+                          sampleFraction=0.1):
     """Reads a decision tree file and verifies that it was read correctly.
 
     Verifies that reconstructing the decision tree file from the parsed output
     reproduces the original decision tree file up to certain whitespace
     substitutions.
+    The `verify` and `sampleFraction` arguments control how thoroughly this
+    is checked (see `verifiedRead`).
+
+    If `cacheDir` is specified then the parsed questions and trees are cached
+    in `cacheDir`, and the parsing and verification are skipped when a file
+    with the same contents is read again (see `readFileLinesCached`).
     """
-    lines = [ line.rstrip('\n') for line in open(treeFile, 'U') ]
-    questions, streamSpecedTrees = verifiedRead(
-        readTreeFileLines, writeTreeFileLines, lines, unpack=True
+    def readLinesVerifying(treeFileLines):
+        return verifiedRead(
+            readTreeFileLines, iterWriteTreeFileLines, treeFileLines,
+            unpack=True, verify=verify, sampleFraction=sampleFraction
+        )
+
+    cacheName = getVerifiedCacheName('tree', verify, sampleFraction)
+    questions, streamSpecedTrees = readFileLinesCached(
+        readLinesVerifying, treeFile, cacheDir, cacheName
     )
     return questions, streamSpecedTrees
 
@@ -236,3 +497,385 @@ def writeTreeFile(questions, streamSpecedTrees, treeFile):
         for line in lines:
             f.write(line)
             f.write('\n')
+
+binaryTreeFileMagic = 'HTK_IO_TREE_BINARY_1\n'
+
+def _encodeStr(string):
+    # (unicode strings are stored as utf-8 and so read back as the
+    #   corresponding byte strings, as when reading a utf-8 text tree file)
+    if isinstance(string, unicode):
+        string = string.encode('utf-8')
+    if not isinstance(string, str):
+        raise RuntimeError('value %r can not be stored in a binary tree file'
+                           ' since it is not a string' % (string,))
+    if '\n' in string:
+        raise RuntimeError('string %r can not be stored in a binary tree'
+                           ' file' % string)
+    return string
+
+def _encodeStrs(strs):
+    strsEncoded = map(_encodeStr, strs)
+    return (np.frombuffer('\n'.join(strsEncoded), dtype=np.uint8),
+            len(strsEncoded))
+
+def _decodeStrs(strArray, numStrs):
+    return strArray.tostring().split('\n') if numStrs > 0 else []
+
+def writeTreeFileBinary(questions, streamSpecedTrees, treeFile):
+    """Writes a decision tree file in a compact binary format.
+
+    The binary format stores the questions and trees as a small number of
+    numpy arrays and string tables, together with the breadth-first order of
+    the nodes of each tree, so that `readTreeFileBinary` can load it without
+    any text parsing or tree traversal.
+    The file consists of a magic string, a JSON header specifying the
+    location, dtype and shape of each array, and the raw arrays themselves,
+    each aligned to 16 bytes.
+    Reading the binary file and writing it with `writeTreeFileLines` gives
+    exactly the same result as writing the original questions and trees.
+    Unicode question ids, patterns, stream specs and macro ids are stored as
+    utf-8 and read back as byte strings, and a RuntimeError is raised for any
+    other non-string value.
+    """
+    quesIndexOf = dict([
+        (quesId, quesIndex)
+        for quesIndex, (quesId, _) in enumerate(questions)
+    ])
+
+    leafMacroIds = []
+    leafCodeOf = dict()
+    def getLeafCode(leaf):
+        code = leafCodeOf.get(leaf.macroId)
+        if code is None:
+            code = len(leafMacroIds)
+            leafCodeOf[leaf.macroId] = code
+            leafMacroIds.append(leaf.macroId)
+        return code
+
+    def getNodeCode(node):
+        if isinstance(node, Leaf):
+            return True, getLeafCode(node)
+        else:
+            return False, node
+
+    def getNodeKey(node):
+        return ('leaf', id(node)) if isinstance(node, Leaf) else node
+
+    treeNumSplits = []
+    rootIsLeaf = []
+    rootValues = []
+    splitIds = []
+    splitQuesIndices = []
+    childIsLeaf = []
+    childValues = []
+    bfSlots = []
+    for streamSpec, tree in streamSpecedTrees:
+        treeNumSplits.append(len(tree.splitIdsInOrigOrder))
+        isLeaf, value = getNodeCode(tree.rootNode)
+        rootIsLeaf.append(isLeaf)
+        rootValues.append(value)
+
+        # (a "slot" is a position a node may occupy: -1 for the root and
+        #   2 * splitPos + childIndex for the child of the split at position
+        #   splitPos in original order)
+        slotOfNode = dict([(getNodeKey(tree.rootNode), -1)])
+        for splitPos, splitId in enumerate(tree.splitIdsInOrigOrder):
+            splitIds.append(splitId)
+            splitQuesIndices.append(quesIndexOf[tree.getQuesId[splitId]])
+            for childIndex, child in enumerate(tree.getChildren[splitId]):
+                isLeaf, value = getNodeCode(child)
+                childIsLeaf.append(isLeaf)
+                childValues.append(value)
+                slotOfNode[getNodeKey(child)] = 2 * splitPos + childIndex
+        for node in tree.nodes:
+            bfSlots.append(slotOfNode[getNodeKey(node)])
+
+    quesIds = [ quesId for quesId, _ in questions ]
+    quesPats = [ quesPat for _, quesPats in questions for quesPat in quesPats ]
+    streamSpecs = [ streamSpec for streamSpec, _ in streamSpecedTrees ]
+    quesIdsArray, numQuesIds = _encodeStrs(quesIds)
+    quesPatsArray, numQuesPats = _encodeStrs(quesPats)
+    streamSpecsArray, numStreamSpecs = _encodeStrs(streamSpecs)
+    leafMacroIdsArray, numLeafMacroIds = _encodeStrs(leafMacroIds)
+
+    arrays = [
+        ('quesIds', quesIdsArray),
+        ('quesPats', quesPatsArray),
+        ('quesNumPats', np.array(
+            [ len(quesPats) for _, quesPats in questions ], dtype=np.int64
+        )),
+        ('streamSpecs', streamSpecsArray),
+        ('leafMacroIds', leafMacroIdsArray),
+        ('treeNumSplits', np.array(treeNumSplits, dtype=np.int64)),
+        ('rootIsLeaf', np.array(rootIsLeaf, dtype=np.uint8)),
+        ('rootValues', np.array(rootValues, dtype=np.int64)),
+        ('splitIds', np.array(splitIds, dtype=np.int64)),
+        ('splitQuesIndices', np.array(splitQuesIndices, dtype=np.int64)),
+        ('childIsLeaf', np.array(childIsLeaf, dtype=np.uint8)),
+        ('childValues', np.array(childValues, dtype=np.int64)),
+        ('bfSlots', np.array(bfSlots, dtype=np.int64)),
+    ]
+    header = dict(
+        numQuesIds=numQuesIds,
+        numQuesPats=numQuesPats,
+        numStreamSpecs=numStreamSpecs,
+        numLeafMacroIds=numLeafMacroIds,
+        arrays=[],
+    )
+    # (compute array offsets assuming a header of a given maximum length)
+    def getHeaderStr(dataStart):
+        offset = dataStart
+        header['arrays'] = []
+        for name, array in arrays:
+            header['arrays'].append(
+                [name, offset, array.dtype.str, len(array)]
+            )
+            offset += array.nbytes + (-array.nbytes % 16)
+        return json.dumps(header)
+    headerLen = len(getHeaderStr(0))
+    while True:
+        dataStart = len(binaryTreeFileMagic) + 8 + headerLen
+        dataStart += -dataStart % 16
+        headerStr = getHeaderStr(dataStart)
+        if len(headerStr) <= headerLen:
+            break
+        headerLen = len(headerStr)
+    headerStr += ' ' * (headerLen - len(headerStr))
+
+    with open(treeFile, 'wb') as f:
+        f.write(binaryTreeFileMagic)
+        f.write(struct.pack('<q', headerLen))
+        f.write(headerStr)
+        f.write('\0' * (dataStart - f.tell()))
+        for name, array in arrays:
+            array.tofile(f)
+            f.write('\0' * (-array.nbytes % 16))
+
+def readTreeFileBinary(treeFile):
+    """Reads a decision tree file written by `writeTreeFileBinary`.
+
+    The file is memory-mapped, and the questions and trees are constructed
+    directly from the stored arrays, without any text parsing or tree
+    traversal.
+    Returns questions and stream-speced trees in the same form as
+    `readTreeFile`.
+    """
+    with open(treeFile, 'rb') as f:
+        magic = f.read(len(binaryTreeFileMagic))
+        if magic != binaryTreeFileMagic:
+            raise RuntimeError('%s is not a binary tree file' % treeFile)
+        headerLen, = struct.unpack('<q', f.read(8))
+        header = json.loads(f.read(headerLen))
+
+    data = np.memmap(treeFile, dtype=np.uint8, mode='r')
+    arrays = dict()
+    for name, offset, dtypeStr, length in header['arrays']:
+        dtype = np.dtype(dtypeStr)
+        arrays[name] = data[offset:(offset + length * dtype.itemsize)].view(
+            dtype
+        )
+
+    # (the cyclic garbage collector is disabled while the many small objects
+    #   making up the trees are created, since otherwise it is triggered
+    #   repeatedly and dominates the loading time)
+    gcWasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        questions, streamSpecedTrees = _getTreesFromArrays(header, arrays)
+    finally:
+        if gcWasEnabled:
+            gc.enable()
+
+    return questions, streamSpecedTrees
+
+def _getTreesFromArrays(header, arrays):
+    quesIds = _decodeStrs(arrays['quesIds'], header['numQuesIds'])
+    quesPatsAll = _decodeStrs(arrays['quesPats'], header['numQuesPats'])
+    streamSpecs = _decodeStrs(arrays['streamSpecs'],
+                              header['numStreamSpecs'])
+    leafMacroIds = _decodeStrs(arrays['leafMacroIds'],
+                               header['numLeafMacroIds'])
+
+    questions = []
+    patPos = 0
+    for quesId, numPats in zip(quesIds, arrays['quesNumPats'].tolist()):
+        questions.append((quesId, quesPatsAll[patPos:(patPos + numPats)]))
+        patPos += numPats
+
+    splitIdsAll = arrays['splitIds'].tolist()
+    splitQuesIndicesAll = arrays['splitQuesIndices'].tolist()
+    childIsLeafAll = arrays['childIsLeaf'].tolist()
+    childValuesAll = arrays['childValues'].tolist()
+    bfSlotsAll = arrays['bfSlots'].tolist()
+
+    streamSpecedTrees = []
+    splitStart = 0
+    for streamSpec, numSplits, rootIsLeaf, rootValue in zip(
+        streamSpecs,
+        arrays['treeNumSplits'].tolist(),
+        arrays['rootIsLeaf'].tolist(),
+        arrays['rootValues'].tolist()
+    ):
+        splitEnd = splitStart + numSplits
+        nodeAtSlot = [
+            Leaf(leafMacroIds[value]) if isLeaf else value
+            for isLeaf, value in zip(
+                childIsLeafAll[(2 * splitStart):(2 * splitEnd)],
+                childValuesAll[(2 * splitStart):(2 * splitEnd)]
+            )
+        ]
+        rootNode = Leaf(leafMacroIds[rootValue]) if rootIsLeaf else rootValue
+        # (slot -1 is the root)
+        nodeAtSlot.append(rootNode)
+
+        splitInfos = [
+            (splitId, quesIds[quesIndex],
+             nodeAtSlot[2 * splitPos], nodeAtSlot[2 * splitPos + 1])
+            for splitPos, (splitId, quesIndex) in enumerate(zip(
+                splitIdsAll[splitStart:splitEnd],
+                splitQuesIndicesAll[splitStart:splitEnd]
+            ))
+        ]
+        nodes = [
+            nodeAtSlot[slot]
+            for slot in bfSlotsAll[(2 * splitStart + len(streamSpecedTrees)):
+                                   (2 * splitEnd + len(streamSpecedTrees) + 1)]
+        ]
+        streamSpecedTrees.append(
+            (streamSpec, Tree(splitInfos, rootNode, nodes=nodes))
+        )
+        splitStart = splitEnd
+
+    return questions, streamSpecedTrees
+
+_streamSpecRe = re.compile(
+    r'^\{(.*)\}\[([0-9,-]+)\](?:\.stream\[([0-9,-]+)\])?$'
+)
+
+def parseIndexList(indexListStr):
+    """Parses a comma-separated list of indices and index ranges.
+
+    >>> import htk_io.tree as tio
+    >>> tio.parseIndexList('2-4,6')
+    [2, 3, 4, 6]
+    """
+    indices = []
+    for part in indexListStr.split(','):
+        bounds = part.split('-')
+        if len(bounds) == 1 and bounds[0]:
+            indices.append(int(bounds[0]))
+        elif len(bounds) == 2 and bounds[0] and bounds[1]:
+            indices.extend(range(int(bounds[0]), int(bounds[1]) + 1))
+        else:
+            raise RuntimeError('bad index list %s' % indexListStr)
+    return indices
+
+def parseStreamSpec(streamSpec):
+    """Parses a stream spec such as "{*}[2].stream[1-3]".
+
+    Returns a tuple (pat, states, streams), where `streams` is None if the
+    stream spec does not specify any streams.
+    Returns None if `streamSpec` is not of this form.
+
+    >>> import htk_io.tree as tio
+    >>> tio.parseStreamSpec('{*}[2].stream[1-3,5]')
+    ('*', [2], [1, 2, 3, 5])
+    >>> tio.parseStreamSpec('{*}[2-3]')
+    ('*', [2, 3], None)
+    """
+    match = _streamSpecRe.match(streamSpec)
+    if match is None:
+        return None
+    pat, statesStr, streamsStr = match.groups()
+    states = parseIndexList(statesStr)
+    streams = None if streamsStr is None else parseIndexList(streamsStr)
+    return pat, states, streams
+
+class StreamSpecIndex(object):
+    """An index for finding the tree for a stream spec or (state, stream).
+
+    `streamSpecedTrees` is a list of (streamSpec, tree) pairs as returned by
+    `readTreeFile`.
+    Trees may be looked up by their exact stream spec, or by state index and
+    stream number, in which case a tree matches if its stream spec includes
+    that state and stream (a stream spec with no streams includes every
+    stream).
+    Only trees whose stream spec has model pattern `pat` are used for lookups
+    by state and stream.
+
+    >>> import htk_io.tree as tio
+    >>> tree1 = tio.Tree([], rootNode=tio.Leaf('mgc_s2_1'))
+    >>> tree2 = tio.Tree([], rootNode=tio.Leaf('lf0_s2_1'))
+    >>> index = tio.StreamSpecIndex([
+    ...     ('{*}[2].stream[1]', tree1),
+    ...     ('{*}[2].stream[2-4]', tree2),
+    ... ])
+    >>> index.getTree('{*}[2].stream[1]') is tree1
+    True
+    >>> index.getTreeForStateStream(2, 3) is tree2
+    True
+    >>> index.getTree('{*}[2].stream[3]') is tree2
+    True
+    """
+    def __init__(self, streamSpecedTrees, pat='*'):
+        self.pat = pat
+        self.treesForStreamSpec = dict()
+        self.treesForStateStream = dict()
+        for streamSpec, tree in streamSpecedTrees:
+            self.treesForStreamSpec.setdefault(streamSpec, []).append(tree)
+
+            parsed = parseStreamSpec(streamSpec)
+            if parsed is not None and parsed[0] == pat:
+                _, states, streams = parsed
+                for state in states:
+                    for stream in ([None] if streams is None else streams):
+                        self.treesForStateStream.setdefault(
+                            (state, stream), []
+                        ).append(tree)
+
+    def getTreesForStateStream(self, state, stream):
+        """Returns the list of trees including a given state and stream."""
+        return (self.treesForStateStream.get((state, stream), []) +
+                self.treesForStateStream.get((state, None), []))
+
+    def getTreeForStateStream(self, state, stream):
+        """Returns the unique tree including a given state and stream."""
+        foundTrees = self.getTreesForStateStream(state, stream)
+        if len(foundTrees) != 1:
+            raise RuntimeError('found %s trees for state %s stream %s' %
+                               (len(foundTrees), state, stream))
+        return foundTrees[0]
+
+    def getTree(self, streamSpec):
+        """Returns the unique tree for a stream spec.
+
+        A tree with exactly the stream spec `streamSpec` is used if present.
+        Otherwise if `streamSpec` specifies a single state and stream (with
+        model pattern `pat`) then the tree including that state and stream is
+        used.
+        """
+        foundTrees = self.treesForStreamSpec.get(streamSpec, [])
+        if not foundTrees:
+            parsed = parseStreamSpec(streamSpec)
+            if parsed is not None and parsed[0] == self.pat:
+                _, states, streams = parsed
+                if len(states) == 1 and streams is not None and (
+                    len(streams) == 1
+                ):
+                    foundTrees = self.getTreesForStateStream(states[0],
+                                                             streams[0])
+        if len(foundTrees) != 1:
+            raise RuntimeError('found %s trees for stream spec %s' %
+                               (len(foundTrees), streamSpec))
+        return foundTrees[0]
+
+    def getTreeGrid(self, states, streams):
+        """Returns the tree for each state and stream.
+
+        Returns a list with one element per state in `states`, each of which
+        is a list of the tree for that state and each stream in `streams`.
+        """
+        return [
+            [ self.getTreeForStateStream(state, stream) for stream in streams ]
+            for state in states
+        ]
@@ -5,40 +5,231 @@
 # This file is part of htk_io.
 # See `License` for details of license and warranty.
 
+import os
 import numpy as np
 
-# FIXME : add tests
+from htk_io.base import getNumFrames, readFrames
+from htk_io.base import getArchiveIndexFile
 
 class VecSeqIo(object):
     """Reads and writes raw vector sequence files.
 
     This raw format is used by HTS for speech parameter files (as well as by
     the Speech Processing Toolkit (SPTK) for lots of purposes).
+
+    If `mmap` is True then files are memory-mapped rather than read into
+    memory (see `readFile`).
     """
-    def __init__(self, vecSize, dtypeFile=np.float32):
+    def __init__(self, vecSize, dtypeFile=np.float32, mmap=False):
         self.vecSize = vecSize
         self.dtypeFile = dtypeFile
+        self.mmap = mmap
 
     def readFile(self, vecSeqFile):
         """Reads a raw vector sequence file.
 
-        The dtype of the returned numpy array is always the numpy default
-        np.float, which may be 32-bit or 64-bit depending on architecture, etc.
+        If `mmap` is False, the dtype of the returned numpy array is always
+        the numpy default np.float, which may be 32-bit or 64-bit depending on
+        architecture, etc.
+
+        If `mmap` is True, the returned array is a read-only view of the
+        memory-mapped file with dtype `dtypeFile`.
+        No data is read from the file until it is accessed, and data is read
+        through the operating system's page cache, so it can be shared between
+        processes.
+        Use `astype` on the returned array (or a slice of it) to convert it to
+        another dtype.
+        """
+        if self.mmap:
+            return self.readFileMemmap(vecSeqFile)
+        else:
+            return np.reshape(
+                np.fromfile(vecSeqFile, dtype=self.dtypeFile),
+                (-1, self.vecSize)
+            ).astype(np.float)
+
+    def readFileMemmap(self, vecSeqFile):
+        """Memory-maps a raw vector sequence file.
+
+        Returns a read-only array of shape (numFrames, vecSize) and dtype
+        `dtypeFile` backed by the file.
         """
+        if os.path.getsize(vecSeqFile) == 0:
+            # (np.memmap does not support empty files)
+            return np.zeros((0, self.vecSize), dtype=self.dtypeFile)
         return np.reshape(
-            np.fromfile(vecSeqFile, dtype=self.dtypeFile),
+            np.memmap(vecSeqFile, dtype=self.dtypeFile, mode='r'),
             (-1, self.vecSize)
-        ).astype(np.float)
+        )
+
+    def getNumFrames(self, vecSeqFile):
+        """Returns the number of frames in a raw vector sequence file.
+
+        A RuntimeError is raised if the file size is not consistent with
+        `vecSize` and `dtypeFile`.
+        """
+        return getNumFrames(vecSeqFile, (self.vecSize,), self.dtypeFile)
+
+    def readFileFrames(self, vecSeqFile, startFrame=None, endFrame=None):
+        """Reads frames [startFrame, endFrame) of a raw vector sequence file.
+
+        Only the requested frames are read from the file.
+        The returned array has dtype np.float if `mmap` is False and dtype
+        `dtypeFile` if `mmap` is True, as for `readFile`.
+        """
+        vecSeq = readFrames(vecSeqFile, (self.vecSize,), self.dtypeFile,
+                            startFrame, endFrame)
+        if self.mmap:
+            return vecSeq
+        else:
+            return vecSeq.astype(np.float)
 
     def writeFile(self, vecSeqFile, vecSeq):
         """Writes a raw vector sequence file."""
         vecSeq.astype(self.dtypeFile).tofile(vecSeqFile)
 
 class VecSeqToTraj(object):
-    """Extracts one particular trajectory from a vector sequence."""
-    def __init__(self, vecIndex):
+    """Extracts one particular trajectory from a vector sequence.
+
+    The returned trajectory is a copy, with dtype `dtype` if specified and the
+    dtype of the vector sequence otherwise.
+    If the vector sequence is memory-mapped (see `VecSeqIo`) then only the
+    values for this trajectory are converted, rather than the whole vector
+    sequence.
+    """
+    def __init__(self, vecIndex, dtype=None):
         self.vecIndex = vecIndex
+        self.dtype = dtype
 
     def __call__(self, vecSeq):
         # (copy here allows larger array to be garbage collected)
-        return vecSeq[:, self.vecIndex].copy()
+        return np.array(vecSeq[:, self.vecIndex], dtype=self.dtype)
+
+class VecSeqArchiveWriter(object):
+    """Writes many vector sequences to a single archive.
+
+    A vector sequence archive consists of a data file `archiveFile`, in which
+    the raw vector sequences are stored one after another, and a text index
+    file (see `getArchiveIndexFile`) with one line per vector sequence of the
+    form "<uttId> <offset> <numFrames> <vecSize> <dtype>".
+    Here offset is the byte offset of the vector sequence in the data file and
+    dtype is the numpy dtype string (e.g. "<f4") for the stored values.
+    Each vector sequence is stored starting at an offset which is a multiple
+    of `align` bytes.
+
+    Use as a context manager, or call `close` once all vector sequences have
+    been written.
+    """
+    def __init__(self, archiveFile, dtypeFile=np.float32, align=16):
+        self.archiveFile = archiveFile
+        self.dtypeFile = dtypeFile
+        self.align = align
+
+        self.uttIds = set()
+        self.offset = 0
+        self.dataFile = open(archiveFile, 'wb')
+        self.indexFile = open(getArchiveIndexFile(archiveFile), 'w')
+
+    def write(self, uttId, vecSeq):
+        """Appends the vector sequence `vecSeq` for utterance `uttId`."""
+        if uttId in self.uttIds:
+            raise RuntimeError('utterance %s already in archive' % uttId)
+        if len(uttId.split()) != 1:
+            raise RuntimeError('invalid utterance id %r' % uttId)
+        if np.ndim(vecSeq) != 2:
+            raise RuntimeError('vector sequence should be 2-dimensional')
+        self.uttIds.add(uttId)
+
+        padding = -self.offset % self.align
+        self.dataFile.write('\0' * padding)
+        self.offset += padding
+
+        values = np.ascontiguousarray(vecSeq, dtype=self.dtypeFile)
+        numFrames, vecSize = values.shape
+        values.tofile(self.dataFile)
+        self.indexFile.write('%s %s %s %s %s\n' % (
+            uttId, self.offset, numFrames, vecSize, values.dtype.str
+        ))
+        self.offset += values.nbytes
+
+    def close(self):
+        self.dataFile.close()
+        self.indexFile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+class VecSeqArchive(object):
+    """Reads vector sequences from an archive written by VecSeqArchiveWriter.
+
+    An instance of this class can be used as a function from utterance id to
+    vector sequence, in the same way as a `DirReader` for a directory of raw
+    vector sequence files.
+    Any vector sequence can be accessed in constant time.
+
+    If `mmap` is True then the archive is memory-mapped and each vector
+    sequence returned is a read-only view with the dtype stored in the
+    archive.
+    Otherwise each vector sequence is read from the archive when requested and
+    has dtype np.float, as for `VecSeqIo`.
+    """
+    def __init__(self, archiveFile, mmap=True):
+        self.archiveFile = archiveFile
+        self.mmap = mmap
+
+        self.uttIds = []
+        self.index = dict()
+        with open(getArchiveIndexFile(archiveFile)) as f:
+            for line in f:
+                uttId, offset, numFrames, vecSize, dtype = line.split()
+                if uttId in self.index:
+                    raise RuntimeError('utterance %s repeated in archive %s' %
+                                       (uttId, archiveFile))
+                self.uttIds.append(uttId)
+                self.index[uttId] = (int(offset), int(numFrames),
+                                     int(vecSize), np.dtype(dtype))
+
+        self.data = None
+        if mmap and os.path.getsize(archiveFile) > 0:
+            self.data = np.memmap(archiveFile, dtype=np.uint8, mode='r')
+
+    def __len__(self):
+        return len(self.uttIds)
+
+    def __contains__(self, uttId):
+        return uttId in self.index
+
+    def getNumFrames(self, uttId):
+        return self.index[uttId][1]
+
+    def __call__(self, uttId):
+        offset, numFrames, vecSize, dtype = self.index[uttId]
+        numBytes = numFrames * vecSize * dtype.itemsize
+        if self.mmap:
+            if numBytes == 0:
+                return np.zeros((numFrames, vecSize), dtype=dtype)
+            return np.reshape(
+                self.data[offset:(offset + numBytes)].view(dtype),
+                (numFrames, vecSize)
+            )
+        else:
+            with open(self.archiveFile, 'rb') as f:
+                f.seek(offset)
+                values = np.fromfile(f, dtype=dtype,
+                                     count=(numFrames * vecSize))
+            return np.reshape(values, (numFrames, vecSize)).astype(np.float)
+
+def writeVecSeqArchive(archiveFile, getVecSeq, uttIds, dtypeFile=np.float32):
+    """Writes the vector sequences for the given utterances to an archive.
+
+    `getVecSeq` is a function from utterance id to vector sequence, for
+    example a `DirReader` for a directory of raw vector sequence files.
+    To avoid an unnecessary conversion, use a `VecSeqIo` with `mmap` set to
+    True in the `DirReader`.
+    """
+    with VecSeqArchiveWriter(archiveFile, dtypeFile=dtypeFile) as writer:
+        for uttId in uttIds:
+            writer.write(uttId, getVecSeq(uttId))